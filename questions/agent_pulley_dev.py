@@ -1,44 +1,85 @@
 import argparse
 import os
+import sys
 import json
 import random
 import glob
+import time
+import asyncio
 from tqdm import tqdm
-import copy
 from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from object import SimulationPulley
 from read_file import read_annotation_pulley
+from scene_cache import load_scene_pulley
+from read_file_4d import Outputs4D, is_converted as is_converted_4d
+from kinematics import attach_kinematics
+from read_file_boxes import convert_boxes, is_converted
 from question_engine_pulley import QuestionEnginePulley
+from question_store import QuestionStore
+from manifest import Manifest, content_hash, family_hashes
+from profiler import StageProfiler, report_stages, write_trace
+from work_queue import ShardQueue
 
 THREAD_NUM = 20
 
+# per-process agent of the multiprocessing workers, see _init_worker
+_worker_agent = None
+
+def video_rng(seed, video_id, family=None):
+    """ Random generator of one video, derived from the base seed and the video id only
+
+    Seeding with a string is stable across processes and runs (it does not depend on PYTHONHASHSEED),
+    so a video gets the same questions whatever worker or shard generates it. With `family` (a template
+    key) the generator is specific to one template family, which can then be regenerated alone.
+    """
+    if family is None:
+        return random.Random(f'{seed}-{video_id}')
+    return random.Random(f'{seed}-{video_id}-{family}')
+
+
+def shuffle_options(ques, ans, rng=random, skip=False, choice_maps=()):
+    """ Shuffle the options of a choice question, return (question, answer, raw options)
+
+    The options are moved with one index permutation, which is also applied in place to the
+    letter keyed dicts of `choice_maps` (the programs / features choices of the question).
+    """
+    lines = ques.split('\n')
+    ques_title, options = lines[0], lines[1:]
+    perm = list(range(len(options)))
+    if not skip:
+        rng.shuffle(perm)
+        letters = [option[0] for option in options]
+        for choices in choice_maps:
+            values = [choices[letters[j]] for j in perm]
+            for letter, value in zip(letters, values):
+                choices[letter] = value
+
+    # new position of every original option
+    position = [0] * len(perm)
+    for i, j in enumerate(perm):
+        position[j] = i
+    ans_shuffled = ' '.join(sorted([chr(ord('A') + position[ord(choice) - ord('A')]) for choice in ans.split()]))
+    raw_opt_shuffled = [options[j][3:] for j in perm]
+    # TODO: duplicate detect, remove when release
+    assert len(raw_opt_shuffled) == len(set(raw_opt_shuffled))
+
+    ques_shuffled = ques_title + '\n' + '\n'.join([chr(ord('A') + i) + '. ' + opt for i, opt in enumerate(raw_opt_shuffled)])
+    return ques_shuffled, ans_shuffled, raw_opt_shuffled
+
+
 class Randomization:
-    def __init__(self, questions, answers):
+    def __init__(self, questions, answers, rng=random):
         self.questions = questions
         self.answers = answers
+        self.rng = rng
     
     def shuffle_choice(self, skip=False):
         """ Shuffle the options of the choice questions and update the answers accordingly """
         questions_shuffled, answers_shuffled, raw_options_shuffled = [], [], []
-
         for ques, ans in zip(self.questions, self.answers):
-            ques_title, options = ques.split('\n')[0], ques.split('\n')[1:]
-            ans_choices = ans.split()
-            # shuffle the options
-            positive = [options[ord(choice) - ord('A')] for choice in ans_choices]
-            if not skip:
-                options_unshuffled = copy.deepcopy(options)
-                random.shuffle(options)
-
-            # update the answer and options
-            ans_shuffled = ' '.join(sorted([chr(ord('A') + options.index(choice)) for choice in positive]))
-            raw_opt_shuffled = [option[3:] for option in options]
-            # TODO: duplicate detect, remove when release
-            assert len(raw_opt_shuffled) == len(set(raw_opt_shuffled))
-
-            opt_shuffled = [chr(ord('A') + i) + '. ' + opt for i, opt in enumerate(raw_opt_shuffled)]
-            ques_shuffled = ques_title + '\n' + '\n'.join(opt_shuffled)
+            ques_shuffled, ans_shuffled, raw_opt_shuffled = shuffle_options(ques, ans, self.rng, skip)
             questions_shuffled.append(ques_shuffled)
             answers_shuffled.append(ans_shuffled)
             raw_options_shuffled.append(raw_opt_shuffled)
@@ -47,38 +88,18 @@ class Randomization:
     
 
 class RandomizationProgram:
-    def __init__(self, questions, answers, programs):
+    def __init__(self, questions, answers, programs, rng=random):
         self.questions = questions
         self.answers = answers
         self.programs = programs
+        self.rng = rng
     
     def shuffle_choice(self, skip=False):
-        """ Shuffle the options of the choice questions and update the answers accordingly """
+        """ Shuffle the options of the choice questions and update the answers and programs accordingly """
         questions_shuffled, answers_shuffled, raw_options_shuffled = [], [], []
         programs_shuffled = []
-
         for ques, ans, pg in zip(self.questions, self.answers, self.programs):
-            ques_title, options = ques.split('\n')[0], ques.split('\n')[1:]
-            ans_choices = ans.split()
-            # shuffle the options
-            positive = [options[ord(choice) - ord('A')] for choice in ans_choices]
-            if not skip:
-                options_unshuffled = copy.deepcopy(options)
-                random.shuffle(options)
-                shuffle_mapping = {options_unshuffled[i][0]: options[i][0] for i in range(len(options))}
-                # update the programs
-                pg_copy = copy.deepcopy(pg)
-                for k, v in shuffle_mapping.items():
-                    pg[k] = pg_copy[v]
-
-            # update the answer and options
-            ans_shuffled = ' '.join(sorted([chr(ord('A') + options.index(choice)) for choice in positive]))
-            raw_opt_shuffled = [option[3:] for option in options]
-            # TODO: duplicate detect, remove when release
-            assert len(raw_opt_shuffled) == len(set(raw_opt_shuffled))
-
-            opt_shuffled = [chr(ord('A') + i) + '. ' + opt for i, opt in enumerate(raw_opt_shuffled)]
-            ques_shuffled = ques_title + '\n' + '\n'.join(opt_shuffled)
+            ques_shuffled, ans_shuffled, raw_opt_shuffled = shuffle_options(ques, ans, self.rng, skip, choice_maps=(pg,))
             questions_shuffled.append(ques_shuffled)
             answers_shuffled.append(ans_shuffled)
             raw_options_shuffled.append(raw_opt_shuffled)
@@ -89,46 +110,25 @@ class RandomizationProgram:
 
 
 class RandomizationFeature:
-    def __init__(self, questions, answers, features):
+    def __init__(self, questions, answers, features, rng=random):
         self.questions = questions
         self.answers = answers
         self.features = features
+        self.rng = rng
     
     def shuffle_choice(self, skip=False):
-        """ Shuffle the options of the choice questions and update the answers accordingly """
+        """ Shuffle the options of the choice questions and update the answers and feature choices accordingly """
         questions_shuffled, answers_shuffled, raw_options_shuffled = [], [], []
         features_shuffled = []
-
         for ques, ans, ft in zip(self.questions, self.answers, self.features):
-            ques_title, options = ques.split('\n')[0], ques.split('\n')[1:]
-            ans_choices = ans.split()
-            # shuffle the options
-            positive = [options[ord(choice) - ord('A')] for choice in ans_choices]
-            if not skip:
-                options_unshuffled = copy.deepcopy(options)
-                random.shuffle(options)
-                shuffle_mapping = {options_unshuffled[i][0]: options[i][0] for i in range(len(options))}
-                # update the features
-                ft_copy = copy.deepcopy(ft)
-                for k, v in shuffle_mapping.items():
-                   ft['choices'][k] = ft_copy['choices'][v]
-
-            # update the answer and options
-            ans_shuffled = ' '.join(sorted([chr(ord('A') + options.index(choice)) for choice in positive]))
-            raw_opt_shuffled = [option[3:] for option in options]
-            # TODO: duplicate detect, remove when release
-            if len(raw_opt_shuffled) != len(set(raw_opt_shuffled)):
-                breakpoint()
-
-            opt_shuffled = [chr(ord('A') + i) + '. ' + opt for i, opt in enumerate(raw_opt_shuffled)]
-            ques_shuffled = ques_title + '\n' + '\n'.join(opt_shuffled)
+            ques_shuffled, ans_shuffled, raw_opt_shuffled = shuffle_options(ques, ans, self.rng, skip, choice_maps=(ft['choices'],))
             questions_shuffled.append(ques_shuffled)
             answers_shuffled.append(ans_shuffled)
             raw_options_shuffled.append(raw_opt_shuffled)
             features_shuffled.append(ft)
 
         return questions_shuffled, answers_shuffled, raw_options_shuffled, features_shuffled
-    
+
 
 class AgentPulley:
     """ Random withouot programs"""
@@ -136,6 +136,17 @@ class AgentPulley:
         self.args = args
         self.input_path = args.input_video_ann_path
         self.simulation = SimulationPulley()
+        self.rng = random # per video random.Random when args.seed is set, see set_video
+        self.engine = None # QuestionEnginePulley of the current simulation, see get_engine
+        self.video_id = None
+        self.output_path = os.path.join(args.output_ques_ann_path, args.video_type)
+        self.store = None # QuestionStore when args.output_format is jsonl
+        self.store_index = None
+        if getattr(args, 'output_format', 'json') == 'jsonl':
+            self.store = QuestionStore(os.path.join(self.output_path, 'store'), args.compress)
+        # next to the question files, tools/utils.py lists the videos from their names
+        self.manifest = Manifest(os.path.join(args.output_ques_ann_path, f'manifest_{args.video_type}.json'))
+        self.profiler = StageProfiler(getattr(args, 'profile', False), getattr(args, 'trace_memory', False))
         self.templates = {
             "mass": "Is the mass of the {} {} {} {}that of the {} {}?",
             # "mass_pos": "Is it possible to determine the relationship of mass between the {} {} and the {} {}.",
@@ -192,9 +203,39 @@ class AgentPulley:
         self.shuffle_keys = ['rope_counterfactual2']
         self.open_ended_keys = ['color', 'shape', 'existence', 'mass', 'tension']
     
-    def read_json(self, read_path):
-        return read_annotation_pulley(read_path, self.simulation)
+    def set_video(self, video_id):
+        """ Reset the per video state before generating the questions of `video_id` """
+        self.video_id = video_id
+        self.simulation = SimulationPulley()
+        self.rng = video_rng(self.args.seed, video_id) if self.args.seed is not None else random
+        self.engine = None
+
+    def family_rng(self, te_key):
+        """ Random generator of a template family of the current video """
+        if self.args.seed is None:
+            return self.rng
+        return video_rng(self.args.seed, self.video_id, te_key)
+
+    def read_json(self, read_path, raw=None):
+        if self.args.scene_cache_path:
+            self.simulation, valid = load_scene_pulley(read_path, self.args.scene_cache_path)
+        else:
+            valid = read_annotation_pulley(read_path, self.simulation, raw=raw)
+        if valid and self.args.kinematics:
+            # needs the converted 4D data, see read_file_4d.py
+            video_dir = os.path.dirname(read_path)
+            if is_converted_4d(video_dir):
+                attach_kinematics(self.simulation, Outputs4D(video_dir))
+            elif os.path.exists(os.path.join(video_dir, "outputs4D.index.json")):
+                print(f"{video_dir}: outputs4D.json changed since its conversion, no kinematics")
+        return valid
     
+    def get_engine(self):
+        """ The question engine of the current simulation, built (and its per-scene precompute run) once per video """
+        if self.engine is None or self.engine.simulation is not self.simulation:
+            self.engine = QuestionEnginePulley(self.simulation, self.templates, rng=self.rng)
+        return self.engine
+
     def generate(self, te_key, debug=False):
         """ Generate several questions based on the specified question type of template
 
@@ -205,19 +246,45 @@ class AgentPulley:
         >>>>Factual:
             'surface_tension': Comparison of surface tension of two liquids
         """
-        engine = QuestionEnginePulley(self.simulation, self.templates)
-        ques_generated, ans_generated, feat_generated = engine.generate(te_key, debug=debug)
-
+        with self.profiler.stage('engine'):
+            engine = self.get_engine()
+        engine.rng = rng = self.family_rng(te_key)
+        with self.profiler.stage('generate', te_key):
+            ques_generated, ans_generated, feat_generated = engine.generate(te_key, debug=debug)
+        with self.profiler.stage('randomize', te_key):
+            return self.build_items(te_key, ques_generated, ans_generated, feat_generated, rng)
+
+    def generate_scene(self, te_keys, debug=False):
+        """ Generate all the template keys of the current video, {key: items}
+
+        Same output as calling generate for each key in order, with the counterfactual
+        annotations walked once for all the counterfactual and goal-driven families.
+        """
+        rngs = {key: self.family_rng(key) for key in te_keys}
+        with self.profiler.stage('engine'):
+            engine = self.get_engine()
+        scene = engine.generate_scene(te_keys, debug=debug, rngs=rngs)
+        output_dict = {}
+        for key in te_keys:
+            with self.profiler.stage('generate', key):
+                _, generated = next(scene)
+            with self.profiler.stage('randomize', key):
+                output_dict[key] = self.build_items(key, *generated, rngs[key])
+        return output_dict
+
+    def build_items(self, te_key, ques_generated, ans_generated, feat_generated, rng=None):
+        """ Shuffle the choices and build the question items of a template key """
+        rng = rng if rng is not None else self.rng
         if te_key in self.multi_choice_keys+self.single_choice_keys:
             if feat_generated is None:
-                randomization = Randomization(ques_generated, ans_generated)
+                randomization = Randomization(ques_generated, ans_generated, rng=rng)
                 skip = True
                 if te_key in self.shuffle_keys:
                     skip = False
                 ques_generated, ans_generated, raw_options = randomization.shuffle_choice(skip=skip)
                 features_shuffled = None
             else:
-                randomization = RandomizationFeature(ques_generated, ans_generated, feat_generated)
+                randomization = RandomizationFeature(ques_generated, ans_generated, feat_generated, rng=rng)
                 skip = True
                 if te_key in self.shuffle_keys:
                     skip = False
@@ -256,51 +323,236 @@ class AgentPulley:
 
                 for ans_char in ans.split(' '):
                     item['positive'].append(opts[ord(ans_char) - ord('A')])
-                item['negative'] = list(set(opts) - set(item['positive']))
+                item['negative'] = [opt for opt in opts if opt not in item['positive']]
         
             data_generated.append(item)
 
         return data_generated            
 
     def generate_all_multithread(self):
-        """ Generate questions for all types """
+        """ Generate questions for all types, one agent per worker process """
         args = self.args
         all_jsons = glob.glob(os.path.join(self.input_path, '*/outputs.json')) # include invalid json
         all_jsons = sorted(all_jsons)[int(len(all_jsons) * args.start): int(len(all_jsons) * args.end)]
 
-        output_path = os.path.join(args.output_ques_ann_path, args.video_type)
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        with Pool(THREAD_NUM) as p:
-            args_list = [(json_path, output_path, args) for json_path in all_jsons]
-            list(tqdm(p.imap(self.generate_multithread, args_list), total=len(args_list)))
-
-    def generate_multithread(self, arg_list):
-        json_path, output_path, args = arg_list
+        if not os.path.exists(self.output_path):
+            os.makedirs(self.output_path)
+        if self.store is not None and args.restart:
+            self.store.clear() # before the workers start appending
+
+        timings = {}
+        try:
+            with Pool(args.num_workers, initializer=_init_worker, initargs=(args,)) as p:
+                results = p.imap_unordered(_generate_worker, all_jsons, chunksize=args.chunksize)
+                for video_id, status, elapsed, entry, rebuilt, stages in tqdm(results, total=len(all_jsons)):
+                    timings[video_id] = timing_entry(status, elapsed, rebuilt, stages)
+                    if entry is not None:
+                        self.manifest.update(video_id, entry)
+                    self.manifest.checkpoint()
+        finally:
+            self.manifest.save()
+        report_timings(timings, args.timing_path, args.trace_path)
+
+    def generate_all_sharded(self):
+        """ Generate the shards of the videos claimed from the shared queue at args.queue_path
+
+        Any number of processes, on one or several hosts, can run this on the same queue; each
+        of them generates the shards it claims with its own Pool. The manifest entries go to
+        the shard reports instead of manifest.json, merge_shards collects them at the end.
+        """
+        args = self.args
+        all_jsons = sorted(glob.glob(os.path.join(self.input_path, '*/outputs.json'))) # include invalid json
+        json_paths = {json_path.split('/')[-2]: json_path for json_path in all_jsons}
+
+        if not os.path.exists(self.output_path):
+            os.makedirs(self.output_path, exist_ok=True)
+        queue = ShardQueue(args.queue_path, args.num_shards, args.heartbeat_timeout, args.worker_id or None)
+        shards = queue.plan(json_paths.keys())
+
+        timings = {}
+        p = None
+        try:
+            # wait for the shards of the other processes, a stalled one is taken over once its lock is stale
+            while (shard := queue.wait_claim()) is not None:
+                if p is None:
+                    p = Pool(args.num_workers, initializer=_init_worker, initargs=(args,))
+                print(f"{queue.owner}: shard {shard} ({len(shards[shard])} videos)")
+                report = {"videos": {}, "manifest": {}}
+                with queue.keep_alive(shard) as heartbeat:
+                    results = p.imap_unordered(_generate_worker, [json_paths[video_id] for video_id in shards[shard]], chunksize=args.chunksize)
+                    for video_id, status, elapsed, entry, rebuilt, stages in results:
+                        report["videos"][video_id] = timings[video_id] = timing_entry(status, elapsed, rebuilt, stages)
+                        if entry is not None:
+                            report["manifest"][video_id] = entry
+                        if heartbeat.lost.is_set():
+                            break
+                if heartbeat.lost.is_set():
+                    # stop the videos of the shard still running, its new owner generates them
+                    p.terminate()
+                    p.join()
+                    p = None
+                    queue.abandon(shard)
+                    print(f"{queue.owner}: shard {shard} was taken over by another process")
+                elif not queue.complete(shard, report):
+                    print(f"{queue.owner}: shard {shard} was taken over by another process")
+        finally:
+            if p is not None:
+                p.terminate()
+        if self.store is not None:
+            self.store.close()
+        report_timings(timings, args.timing_path, args.trace_path)
+
+    def merge_shards(self):
+        """ Check the shard reports of args.queue_path and merge their manifest entries, True if every video was processed exactly once """
+        args = self.args
+        queue = ShardQueue(args.queue_path, args.num_shards)
+        reports, problems = queue.merge()
+        timings = {}
+        for report in reports.values():
+            timings.update(report["videos"])
+            for video_id, entry in report["manifest"].items():
+                self.manifest.update(video_id, entry)
+        if reports:
+            self.manifest.save()
+        print(f"{len(reports)}/{args.num_shards} shards done, {len(timings)} videos")
+        for problem in problems:
+            print(problem)
+        report_timings(timings, args.timing_path, args.trace_path)
+        return not problems
+
+    def generate_multithread(self, json_path, debug=False):
+        """ Generate and write the questions of one video
+
+        Return (status, manifest entry or None, number of families generated), see generate_video.
+        """
+        status, entry, rebuilt, output_dict = self.generate_video(json_path, debug=debug)
+        if output_dict is not None:
+            with self.profiler.stage('write'):
+                self.write_questions(json_path.split('/')[-2], output_dict)
+        return status, entry, rebuilt
+
+    def generate_video(self, json_path, debug=False, raw=None):
+        """ Generate the questions of one video without writing them
+
+        Only the template families that are out of date in the manifest are regenerated, a video
+        without manifest entry is skipped if its questions were already written.
+        `raw` is the content of the outputs.json when it was already read.
+        Return (status, manifest entry or None, number of families generated, question_dict or None),
+        the status is 'skipped', 'invalid', 'generated' (all the families) or 'updated' (some of them).
+        """
+        args = self.args
         video_id = json_path.split('/')[-2]
-        intermidiate_path = os.path.join(output_path, f'{video_id}.json')
-        if os.path.exists(intermidiate_path) and not args.restart:
-            return 0
         skip_ids = ['1846']
         if video_id in skip_ids:
-            return 0
+            return 'skipped', None, 0, None
 
-        output_dict = {}
-        self.simulation = SimulationPulley()
-        if self.read_json(json_path):
-            if args.key:
-                te_keys = [args.key] # TODO: for debugging, remove when release
-            else:
-                te_keys=list(self.templates.keys())
-            for key in te_keys:
-                output_dict[key] = self.generate(key)
-
-            with open(intermidiate_path, 'w') as f:
-                json.dump({
-                    "video_id": video_id, 
-                    "question_dict":output_dict}
-                    , f, indent=4)
+        if args.key:
+            te_keys = [args.key] # TODO: for debugging, remove when release
+        else:
+            te_keys=list(self.templates.keys())
+        if raw is None:
+            with self.profiler.stage('read'):
+                raw = _read_bytes(json_path)
+        input_hash = content_hash(raw)
+        if getattr(args, 'boxes', False):
+            with self.profiler.stage('boxes'):
+                if not is_converted(json_path, raw):
+                    convert_boxes(json_path, raw=raw)
+        families = family_hashes(self.templates, te_keys, args.seed)
+        old_dict = None
+        if args.restart:
+            keys = te_keys
+        elif video_id not in self.manifest.entries:
+            # not in the manifest, e.g. generated before it existed or lost to an interrupted run:
+            # the questions already written are kept as they are
+            if self.has_questions(video_id):
+                return 'skipped', None, 0, None
+            keys = te_keys
+        else:
+            if self.manifest.is_invalid(video_id, input_hash):
+                return 'invalid', None, 0, None
+            keys = self.manifest.plan(video_id, input_hash, families)
+            if len(keys) < len(te_keys):
+                # the other families are kept from the questions already written
+                old_dict = self.read_questions(video_id)
+                if old_dict is None:
+                    keys = te_keys # the questions are gone, generate them again
+            if not keys:
+                return 'skipped', None, 0, None
+
+        self.set_video(video_id)
+        with self.profiler.stage('parse'):
+            valid = self.read_json(json_path, raw=raw)
+        if not valid:
+            return 'invalid', {"input": input_hash, "invalid": True}, 0, None
+        output_dict = self.generate_scene(keys, debug=debug)
+
+        entry = {"input": input_hash, "families": {}}
+        if old_dict is not None and len(keys) < len(te_keys):
+            # keep the up to date families, in the template order
+            output_dict = {key: output_dict[key] if key in output_dict else old_dict[key] for key in te_keys if key in output_dict or key in old_dict}
+            entry["families"].update(self.manifest.entries[video_id]["families"])
+        entry["families"].update({key: families[key] for key in keys})
+        return ('generated' if len(keys) == len(te_keys) else 'updated'), entry, len(keys), output_dict
+
+    def generate_all_async(self):
+        """ Generate questions for all types, overlapping the file I/O with the generation
+
+        Up to args.prefetch videos are in flight: their outputs.json are read by a pool of
+        args.io_threads threads, generated by args.num_workers processes, and the questions
+        are written back by the threads while the next videos are being generated.
+        """
+        args = self.args
+        all_jsons = glob.glob(os.path.join(self.input_path, '*/outputs.json')) # include invalid json
+        all_jsons = sorted(all_jsons)[int(len(all_jsons) * args.start): int(len(all_jsons) * args.end)]
+
+        if not os.path.exists(self.output_path):
+            os.makedirs(self.output_path)
+        if self.store is not None and args.restart:
+            self.store.clear()
+
+        try:
+            timings = asyncio.run(self._generate_pipeline(all_jsons))
+        finally:
+            if self.store is not None:
+                self.store.close()
+            self.manifest.save()
+        report_timings(timings, args.timing_path, args.trace_path)
+
+    async def _generate_pipeline(self, all_jsons):
+        args = self.args
+        loop = asyncio.get_running_loop()
+        window = asyncio.Semaphore(args.prefetch)
+        timings = {}
+        progress = tqdm(total=len(all_jsons))
+
+        with ThreadPoolExecutor(args.io_threads) as io_pool, \
+                ThreadPoolExecutor(1) as store_pool, \
+                ProcessPoolExecutor(args.num_workers, initializer=_init_worker, initargs=(args,)) as cpu_pool:
+            # the store appends to a single shard, keep its writes in order on one thread
+            write_pool = store_pool if self.store is not None else io_pool
+
+            async def process(json_path):
+                async with window:
+                    raw, read_record = await loop.run_in_executor(io_pool, self.profiler.timed, 'read', _read_bytes, json_path)
+                    video_id, status, elapsed, entry, rebuilt, output_dict, stages = await loop.run_in_executor(
+                        cpu_pool, _generate_worker_raw, json_path, raw)
+                    if read_record is not None:
+                        stages.insert(0, read_record)
+                    if output_dict is not None:
+                        _, record = await loop.run_in_executor(
+                            write_pool, self.profiler.timed, 'write', self.write_questions, video_id, output_dict)
+                        if record is not None:
+                            stages.append(record)
+                timings[video_id] = timing_entry(status, elapsed, rebuilt, stages)
+                if entry is not None:
+                    self.manifest.update(video_id, entry)
+                self.manifest.checkpoint()
+                progress.update()
+
+            await asyncio.gather(*[process(json_path) for json_path in all_jsons])
+        progress.close()
+        return timings
                 
     def generate_all(self):
         """ Generate questions for all types """
@@ -311,42 +563,112 @@ class AgentPulley:
         all_jsons = glob.glob(os.path.join(self.input_path, '*/outputs.json')) # include invalid json
         all_jsons = sorted(all_jsons)[int(len(all_jsons) * args.start): int(len(all_jsons) * args.end)]
 
-        output_path = os.path.join(args.output_ques_ann_path, args.video_type)
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        # for json_path in tqdm(all_jsons):
-        for json_path in all_jsons:
-            video_id = json_path.split('/')[-2]
-            intermidiate_path = os.path.join(output_path, f'{video_id}.json')
-            if os.path.exists(intermidiate_path) and not args.restart:
-                continue
-
-            debug_ids = []
-            if video_id in debug_ids:
-                breakpoint()
-                debug_video = True
-            print(video_id)
-            skip_ids = ['1846']
-            if video_id in skip_ids:
-                continue
-
-            output_dict = {}
-            self.simulation = SimulationPulley()
-            if self.read_json(json_path):
-                if args.key:
-                    te_keys = [args.key] # TODO: for debugging, remove when release
-                else:
-                    te_keys=list(self.templates.keys())
-                for key in te_keys:
-                    output_dict[key] = self.generate(key, debug=debug_video)
-
-                with open(intermidiate_path, 'w') as f:
-                    json.dump({
-                        "video_id": video_id, 
-                        "question_dict":output_dict}
-                        , f, indent=4)
-
+        if not os.path.exists(self.output_path):
+            os.makedirs(self.output_path)
+        if self.store is not None and args.restart:
+            self.store.clear()
+
+        timings = {}
+        try:
+            # for json_path in tqdm(all_jsons):
+            for json_path in all_jsons:
+                video_id = json_path.split('/')[-2]
+
+                debug_ids = []
+                if video_id in debug_ids:
+                    breakpoint()
+                    debug_video = True
+                t0 = time.perf_counter()
+                status, entry, rebuilt = self.generate_multithread(json_path, debug=debug_video)
+                timings[video_id] = timing_entry(status, time.perf_counter() - t0, rebuilt, self.profiler.pop())
+                if status != 'skipped':
+                    print(video_id, status)
+                if entry is not None:
+                    self.manifest.update(video_id, entry)
+                self.manifest.checkpoint()
+        finally:
+            if self.store is not None:
+                self.store.close()
+            self.manifest.save()
+        report_timings(timings, args.timing_path, args.trace_path)
+
+    def has_questions(self, video_id):
+        """ Whether questions were already written for the video """
+        if self.store is not None:
+            if self.store_index is None:
+                self.store_index = self.store.index()
+            return video_id in self.store_index
+        return os.path.exists(os.path.join(self.output_path, f'{video_id}.json'))
+
+    def read_questions(self, video_id):
+        """ The question_dict already written for the video, None if there is none """
+        if self.store is not None:
+            if self.store_index is None:
+                self.store_index = self.store.index()
+            if video_id not in self.store_index:
+                return None
+            return self.store.read_video(video_id, self.store_index)["question_dict"]
+        path = os.path.join(self.output_path, f'{video_id}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)["question_dict"]
+
+    def write_questions(self, video_id, output_dict):
+        """ Append the questions to the store, or write them to <output_path>/<video_id>.json """
+        if self.store is not None:
+            self.store.write(video_id, output_dict)
+            return
+        with open(os.path.join(self.output_path, f'{video_id}.json'), 'w') as f:
+            json.dump({
+                "video_id": video_id, 
+                "question_dict":output_dict}
+                , f, indent=4)
+
+
+def _init_worker(args):
+    """ Pool initializer: build the agent once per process instead of pickling it per task """
+    global _worker_agent
+    _worker_agent = AgentPulley(args)
+
+def _generate_worker(json_path):
+    t0 = time.perf_counter()
+    status, entry, rebuilt = _worker_agent.generate_multithread(json_path)
+    return json_path.split('/')[-2], status, time.perf_counter() - t0, entry, rebuilt, _worker_agent.profiler.pop()
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _generate_worker_raw(json_path, raw):
+    """ Generate a video from the content of its outputs.json read by the main process, the questions are returned, not written """
+    t0 = time.perf_counter()
+    status, entry, rebuilt, output_dict = _worker_agent.generate_video(json_path, raw=raw)
+    return json_path.split('/')[-2], status, time.perf_counter() - t0, entry, rebuilt, output_dict, _worker_agent.profiler.pop()
+
+def timing_entry(status, elapsed, rebuilt, stages=None):
+    """ Timings of a video, with its profiled stages when --profile is on """
+    entry = {"status": status, "time": elapsed, "families_rebuilt": rebuilt}
+    if stages is not None:
+        entry["stages"] = stages
+    return entry
+
+def report_timings(timings, timing_path='', trace_path=''):
+    """ Print a summary of the per-video generation times and stages, optionally dump them as json / trace """
+    generated = sorted((v["time"], k) for k, v in timings.items() if v["status"] == "generated")
+    counts = {status: sum(v["status"] == status for v in timings.values()) for status in ["generated", "updated", "skipped", "invalid"]}
+    print(", ".join(f"{k}: {v}" for k, v in counts.items()))
+    print("families rebuilt: %d" % sum(v.get("families_rebuilt", 0) for v in timings.values()))
+    if generated:
+        times = [t for t, _ in generated]
+        print("per video (s): mean %.3f, median %.3f, max %.3f" % (sum(times) / len(times), times[len(times) // 2], times[-1]))
+        print("slowest: " + ", ".join(f"{k} ({t:.3f}s)" for t, k in generated[::-1][:5]))
+    report_stages(timings)
+    if timing_path:
+        with open(timing_path, 'w') as f:
+            json.dump(timings, f, indent=4)
+    if trace_path:
+        write_trace(timings, trace_path)
 
 def build_args_parser():
     parser = argparse.ArgumentParser()
@@ -360,7 +682,29 @@ def build_args_parser():
     parser.add_argument("--end", type=float, default=1.0, help="")
     parser.add_argument('--key', type=str, default='', help='Only generate the specified key, for debugging, e.g. surface_tension')
     parser.add_argument('--multithread', type=bool, default=True, help='Whether to use multithread')
+    parser.add_argument("--num_workers", type=int, default=THREAD_NUM, help="Number of worker processes")
+    parser.add_argument("--chunksize", type=int, default=4, help="Number of videos sent to a worker at once")
+    parser.add_argument("--timing_path", type=str, default="", help="Dump the per-video timings to this json file")
+    parser.add_argument('--kinematics', action='store_true', help='Attach the trajectory kinematics of the converted outputs4D to the objects')
+    parser.add_argument('--boxes', action='store_true', help='Convert the 2D bounding boxes of every outputs.json to boxes2D.bin next to it, see read_file_boxes.py')
+    parser.add_argument("--seed", type=int, default=None, help="Base seed, every video gets its own generator derived from it and the video id")
+    parser.add_argument("--scene_cache_path", type=str, default="", help="Directory of the parsed scene cache, disabled if empty")
+    parser.add_argument("--output_format", type=str, default="json", choices=["json", "jsonl"], help="One json file per video, or an append-only jsonl store under <output_path>/store")
+    parser.add_argument('--compress', action='store_true', help='Gzip the records of the jsonl store')
+    parser.add_argument('--profile', action='store_true', help='Record the time and allocations of every stage of every video, see profiler.py')
+    parser.add_argument('--trace_memory', action='store_true', help='With --profile, also record the peak memory of every stage (tracemalloc, slow)')
+    parser.add_argument("--trace_path", type=str, default="", help="With --profile, dump the stages to this Chrome trace json file")
+    parser.add_argument("--num_shards", type=int, default=0, help="Split the videos into this many shards claimed from --queue_path, see work_queue.py")
+    parser.add_argument("--queue_path", type=str, default="", help="Shared directory of the shard queue, defaults to <output_path>/queue")
+    parser.add_argument("--worker_id", type=str, default="", help="Name of this process in the shard queue, <host>-<pid> by default")
+    parser.add_argument("--heartbeat_timeout", type=float, default=300, help="Seconds after which a shard whose lock was not touched is taken over")
+    parser.add_argument('--merge_shards', action='store_true', help='Check that every video of the shard queue was processed exactly once and merge the manifest')
+    parser.add_argument('--async_io', action='store_true', help='Overlap the reads and writes with the generation, see generate_all_async')
+    parser.add_argument("--prefetch", type=int, default=64, help="Maximum number of videos in flight with --async_io")
+    parser.add_argument("--io_threads", type=int, default=16, help="Number of reader / writer threads with --async_io")
     args = parser.parse_args()
+    if not args.queue_path:
+        args.queue_path = os.path.join(args.output_ques_ann_path, args.video_type, 'queue')
     return args
 
 if __name__=="__main__":
@@ -371,7 +715,13 @@ if __name__=="__main__":
         args.multithread = False
         breakpoint()
 
-    if args.multithread:
+    if args.merge_shards:
+        sys.exit(0 if agent.merge_shards() else 1)
+    elif args.num_shards:
+        agent.generate_all_sharded()
+    elif args.async_io and not args.debug:
+        agent.generate_all_async()
+    elif args.multithread:
         agent.generate_all_multithread()
     else:
         agent.generate_all()
@@ -0,0 +1,79 @@
+""" Trajectory derived kinematics of the rigid bodies, from the rigidbodyCentroidStates of outputs4D
+
+Everything is computed for all the objects of a scene at once on a (objects, frames, 2, 3)
+array of per frame position and euler rotation (degrees). Directions use the same
+convention as ResultMotion / ResultRotation in outputs.json: motion 1 is up and -1 down,
+rotation 1 is clockwise (the euler z angle decreases) and -1 anti-clockwise.
+"""
+
+import numpy as np
+
+from read_file import parse_entity_name
+
+# an object has started moving once it left its initial pose by more than this
+ONSET_DISPLACEMENT = 0.1 # scene units
+ONSET_ROTATION = 1.0 # degrees
+# net change needed to call a motion up/down or a rotation clockwise/anti-clockwise
+LABEL_DISPLACEMENT = 0.5
+LABEL_ROTATION = 10.0
+
+
+def compute_kinematics(states):
+    """ states: (objects, frames, 2, 3) centroid states
+
+    Returns a dict of arrays, first axis is the object:
+      velocity            (objects, frames-1, 3) position difference between consecutive frames
+      displacement        (objects, 3) net displacement between the first and last frame
+      rotation            (objects, frames, 3) euler angles unwrapped over the 0/360 boundary
+      rotation_angle      (objects,) net rotation around z in degrees, positive is anti-clockwise
+      motion_onset        (objects,) first frame the object left its initial pose, -1 if it never did
+      motion_direction    (objects,) -1/0/1, see module docstring
+      rotation_direction  (objects,) -1/0/1, see module docstring
+    """
+    pos = states[:, :, 0]
+    rot = np.unwrap(states[:, :, 1], period=360, axis=1)
+
+    velocity = np.diff(pos, axis=1)
+    displacement = pos[:, -1] - pos[:, 0]
+    rotation_angle = rot[:, -1, 2] - rot[:, 0, 2]
+
+    moved = (np.linalg.norm(pos - pos[:, :1], axis=2) > ONSET_DISPLACEMENT) \
+        | (np.abs(rot - rot[:, :1]).max(axis=2) > ONSET_ROTATION)
+    motion_onset = np.where(moved.any(axis=1), moved.argmax(axis=1), -1)
+
+    dy = displacement[:, 1]
+    motion_direction = np.where(np.abs(dy) > LABEL_DISPLACEMENT, np.sign(dy), 0).astype(np.int8)
+    rotation_direction = np.where(np.abs(rotation_angle) > LABEL_ROTATION, -np.sign(rotation_angle), 0).astype(np.int8)
+
+    return {
+        "velocity": velocity,
+        "displacement": displacement,
+        "rotation": rot,
+        "rotation_angle": rotation_angle,
+        "motion_onset": motion_onset,
+        "motion_direction": motion_direction,
+        "rotation_direction": rotation_direction,
+    }
+
+def attach_kinematics(sim, outputs4d):
+    """ Set the kinematics of every rigid body of `outputs4d` (an Outputs4D) on the matching objects of `sim`
+
+    Objects without states (shafts, fixed points) or not in the simulation are left untouched.
+    """
+    by_frames = {}
+    for name in outputs4d.names("rigidbodyCentroidStates"):
+        obj = sim.name_object_map.get(parse_entity_name(name).key)
+        states = outputs4d.centroid_states(name)
+        if obj is None or len(states) < 2:
+            continue
+        by_frames.setdefault(len(states), []).append((obj, states))
+
+    for items in by_frames.values():
+        kin = compute_kinematics(np.stack([states for _, states in items]).astype(np.float64))
+        for i, (obj, _) in enumerate(items):
+            obj.velocity = kin["velocity"][i]
+            obj.displacement = kin["displacement"][i]
+            obj.rotation_angle = float(kin["rotation_angle"][i])
+            obj.motion_onset = int(kin["motion_onset"][i])
+            obj.motion_direction = int(kin["motion_direction"][i])
+            obj.rotation_direction = int(kin["rotation_direction"][i])
@@ -0,0 +1,72 @@
+""" Manifest of the generated questions, for incremental regeneration
+
+For every video the manifest records the content hash of its outputs.json and the hash of
+every template family the questions were generated with:
+  {"<video_id>": {"input": "<sha1>", "families": {"<template key>": "<sha1>"}}}
+Invalid videos are recorded with "invalid": true so that they are not parsed again.
+A rerun only regenerates the videos whose outputs.json changed, and for the others only the
+families whose template definition (or seed) changed.
+The manifest is saved every SAVE_EVERY videos (checkpoint) and at the end of the run, so an
+interrupted run keeps most of its progress. It lives next to the per-video question files,
+not among them: <output_ques_ann_path>/manifest_<video_type>.json.
+"""
+
+import os
+import json
+import hashlib
+
+# number of updates between two saves of checkpoint
+SAVE_EVERY = 20
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def content_hash(raw):
+    """ Same as file_hash, for the bytes of a file already read """
+    return hashlib.sha1(raw).hexdigest()
+
+def family_hashes(templates, keys, seed=None):
+    """ Hash of the definition of every template family, the seed is part of it as it changes the questions """
+    return {key: hashlib.sha1(json.dumps([templates[key], seed], sort_keys=True).encode()).hexdigest() for key in keys}
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.pending = 0 # updates since the last save
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def plan(self, video_id, input_hash, families):
+        """ Template keys of `families` (key -> hash) to regenerate, all of them if the input changed """
+        entry = self.entries.get(video_id)
+        if entry is None or entry["input"] != input_hash or entry.get("invalid"):
+            return list(families)
+        return [key for key, h in families.items() if entry["families"].get(key) != h]
+
+    def is_invalid(self, video_id, input_hash):
+        """ Whether the video was found invalid and its outputs.json did not change since """
+        entry = self.entries.get(video_id)
+        return entry is not None and entry.get("invalid", False) and entry["input"] == input_hash
+
+    def update(self, video_id, entry):
+        self.entries[video_id] = entry
+        self.pending += 1
+
+    def checkpoint(self, every=SAVE_EVERY):
+        """ Save once `every` updates were made since the last save, call it after every video """
+        if self.pending >= every:
+            self.save()
+
+    def save(self):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.pending = 0
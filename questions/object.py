@@ -1,68 +1,115 @@
 import os
+import sys
 import json
 import random
 import shutil
+from rope_graph import RopeGraph
 
 
+KINEMATICS = ("velocity", "displacement", "rotation_angle", "motion_onset", "motion_direction", "rotation_direction")
+
+
+def _null_float(value):
+    """ float, or None (null) for a missing mass / tension, the string "null" of older callers included """
+    if value is None or value == "null":
+        return None
+    return float(value)
+
 class ObjectPulley:
+    """ An object of a pulley scene
+
+    Compact: the fields are slots, the categorical attributes (color, shape, dynamics, class_type,
+    motion) are interned so that all the objects share the same few strings, and mass / tension
+    are floats, None when they do not apply (ropes have no mass, loads no tension).
+    The trajectory kinematics are only allocated for the objects they are attached to.
+    """
+    __slots__ = ("color", "mass", "shape", "dynamics", "class_type", "motion", "tension", "name", "_kinematics")
+
     def __init__(self, color, mass, shape, dynamics, class_type, motion, tension=0):
-        self.color = color
-        self.mass = mass
-        self.shape = shape
-        self.dynamics = dynamics
-        self.class_type = class_type
-        self.motion = motion
-        self.tension = tension
+        self.color = sys.intern(color)
+        self.mass = _null_float(mass)
+        self.shape = sys.intern(shape)
+        self.dynamics = sys.intern(dynamics)
+        self.class_type = sys.intern(class_type)
+        self.motion = sys.intern(motion)
+        self.tension = _null_float(tension)
+        self.name = None # set by SimulationPulley.add_object
+
+        # trajectory derived kinematics, set by kinematics.attach_kinematics when the 4D data is available
+        self._kinematics = None
+
+
+def _kinematics_property(field):
+    def get(self):
+        return self._kinematics.get(field) if self._kinematics is not None else None
+    def set(self, value):
+        if self._kinematics is None:
+            self._kinematics = {}
+        self._kinematics[field] = value
+    return property(get, set)
+
+for _field in KINEMATICS:
+    setattr(ObjectPulley, _field, _kinematics_property(_field))
 
 class SimulationPulley:
     def __init__(self):
         self.objects = []
-        self.relations = {}
+        self.relations = {} # obj -> {related obj: None}, a dict is used as an insertion ordered set
         self.counterfactual = {}
         self.rope_group=[]
 
         self.name_object_map = {}
         self.object_rope_map = {}
         self.link_dy_pulley = []
+        self.rope_graph = RopeGraph() # rope topology, set by read_annotation_pulley
+
+        # indexes kept in sync by add_object / remove_object
+        self.object_keys = {} # attribute key -> obj, for deduplication
+        self.object_set = set()
+        self.objects_by_color = {}
+        self.objects_by_class = {}
+
+    @staticmethod
+    def object_key(obj):
+        return (obj.color, obj.mass, obj.shape, obj.dynamics, obj.class_type, obj.motion, obj.tension)
 
     def add_object(self, obj, name):
-        for existing_obj in self.objects:
-            if all([
-                existing_obj.color == obj.color,
-                existing_obj.mass == obj.mass,
-                existing_obj.shape == obj.shape,
-                existing_obj.dynamics == obj.dynamics,
-                existing_obj.class_type == obj.class_type,
-                existing_obj.motion == obj.motion,
-                existing_obj.tension == obj.tension,
-            ]):
-                return False
-        obj.name = name
+        # an object already in the sim is a duplicate of itself, even if its attributes changed since
+        if obj in self.object_set or self.object_key(obj) in self.object_keys:
+            return False
+        obj.name = sys.intern(name)
         self.objects.append(obj)
         self.name_object_map[name] = obj
+        self.object_keys[self.object_key(obj)] = obj
+        self.object_set.add(obj)
+        self.objects_by_color.setdefault(obj.color, []).append(obj)
+        self.objects_by_class.setdefault(obj.class_type, []).append(obj)
         return True
 
+    def set_mass(self, obj, mass):
+        """ Change the mass of an object of the sim, the mass is part of its deduplication key """
+        key = self.object_key(obj)
+        if self.object_keys.get(key) is obj:
+            del self.object_keys[key]
+        obj.mass = _null_float(mass)
+        self.object_keys.setdefault(self.object_key(obj), obj)
+
     def remove_object(self, obj):
         breakpoint() # should not happen
         self.objects.remove(obj)
+        self.object_set.discard(obj)
+        self.object_keys = {k: o for k, o in self.object_keys.items() if o is not obj}
+        self.objects_by_color[obj.color].remove(obj)
+        self.objects_by_class[obj.class_type].remove(obj)
         if obj in self.relations:
-            del self.relations[obj]
-        for other_obj in self.relations:
-            if obj in self.relations[other_obj]:
-                self.relations[other_obj].remove(obj)
+            for other_obj in self.relations.pop(obj):
+                self.relations[other_obj].pop(obj, None)
 
     def add_relation(self, obj1, obj2):
-        if obj1 not in self.objects or obj2 not in self.objects:
+        if obj1 not in self.object_set or obj2 not in self.object_set:
             return False
-        if obj1 not in self.relations:
-            self.relations[obj1] = []
-        if obj2 not in self.relations[obj1]:
-            self.relations[obj1].append(obj2)
-
-        if obj2 not in self.relations:
-            self.relations[obj2] = []
-        if obj1 not in self.relations[obj2]:
-            self.relations[obj2].append(obj1)
+        self.relations.setdefault(obj1, {})[obj2] = None
+        self.relations.setdefault(obj2, {})[obj1] = None
         return True
     
     def add_rope_map(self, object, rope):
@@ -73,8 +120,8 @@ class SimulationPulley:
 
     def remove_relation(self, obj1, obj2):
         if obj1 in self.relations and obj2 in self.relations[obj1]:
-            self.relations[obj1].remove(obj2)
-            self.relations[obj2].remove(obj1)
+            del self.relations[obj1][obj2]
+            del self.relations[obj2][obj1]
             return True
         return False
     
@@ -95,8 +142,8 @@ class SimulationPulley:
         return False
     
     def find_object_by_color(self, obj_color):
-        for obj in self.objects:
-            if obj.color == obj_color and obj.class_type == "object":
+        for obj in self.objects_by_color.get(obj_color, []):
+            if obj.class_type == "object":
                 return obj
         return None
 
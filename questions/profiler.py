@@ -0,0 +1,124 @@
+""" Opt-in per-stage profiling of the question generation
+
+Every video goes through the stages
+  read                outputs.json bytes
+  boxes               with --boxes, conversion of the 2D bounding boxes (read_file_boxes)
+  parse               read_annotation_pulley (or the scene cache)
+  engine              QuestionEnginePulley and its per-scene precompute
+  generate/<key>      the generator of a template key
+  randomize/<key>     choice shuffling and question items of a template key
+  write               json file or jsonl store
+The counterfactual walk shared by the counterfactual and goal-driven families is counted in
+the first of them that is generated.
+
+For each stage we record the wall time and the net number of allocated memory blocks
+(sys.getallocatedblocks), and with trace_memory the peak of the traced memory above the
+start of the stage (tracemalloc, slows the generation down noticeably).
+The records of a video are sent back with its timings, so the stages of all the Pool
+workers end up in one summary table and one trace file in the Chrome trace event format
+(chrome://tracing, https://ui.perfetto.dev).
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from prettytable import PrettyTable
+
+
+class StageProfiler:
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name, key=None):
+        """ Context manager recording a stage of the current video, does nothing when disabled """
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name, key)
+
+    @contextmanager
+    def _stage(self, name, key):
+        record = {"stage": name if key is None else f'{name}/{key}', "pid": os.getpid(), "start": time.time()}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        blocks = sys.getallocatedblocks()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["time"] = time.perf_counter() - t0
+            record["blocks"] = sys.getallocatedblocks() - blocks
+            if self.trace_memory:
+                record["peak"] = tracemalloc.get_traced_memory()[1] - traced
+            self.records.append(record)
+
+    def timed(self, name, fn, *args):
+        """ (fn(*args), record or None) without touching the records, for calls made from other threads
+
+        Only the wall time is recorded, the allocation counters are shared by all the threads.
+        """
+        if not self.enabled:
+            return fn(*args), None
+        start, t0 = time.time(), time.perf_counter()
+        result = fn(*args)
+        return result, {"stage": name, "pid": os.getpid(), "start": start, "time": time.perf_counter() - t0}
+
+    def pop(self):
+        """ The records of the current video, None when disabled """
+        if not self.enabled:
+            return None
+        records, self.records = self.records, []
+        return records
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def report_stages(timings):
+    """ Print the stages of all the profiled videos of `timings` (video_id -> {"stages": [...]}) """
+    by_stage = {}
+    for v in timings.values():
+        for record in v.get("stages") or []:
+            by_stage.setdefault(record["stage"], []).append(record)
+    if not by_stage:
+        return
+    total = sum(r["time"] for records in by_stage.values() for r in records)
+
+    table = PrettyTable()
+    table.field_names = ["stage", "calls", "total (s)", "share", "mean (ms)", "p95 (ms)", "max (ms)", "blocks / call", "peak (KB)"]
+    table.align = "r"
+    table.align["stage"] = "l"
+    for name, records in sorted(by_stage.items(), key=lambda kv: -sum(r["time"] for r in kv[1])):
+        times = sorted(r["time"] for r in records)
+        blocks = [r["blocks"] for r in records if "blocks" in r]
+        peaks = [r["peak"] for r in records if "peak" in r]
+        table.add_row([
+            name, len(records), f'{sum(times):.3f}', f'{sum(times) / total:.1%}',
+            f'{1e3 * sum(times) / len(times):.2f}', f'{1e3 * percentile(times, 0.95):.2f}', f'{1e3 * times[-1]:.2f}',
+            f'{sum(blocks) / len(blocks):.0f}' if blocks else '-',
+            f'{max(peaks) / 1024:.0f}' if peaks else '-',
+        ])
+    print(table)
+
+def write_trace(timings, trace_path):
+    """ Dump the stages as complete events of the Chrome trace event format, one row per worker process """
+    events = []
+    for video_id, v in timings.items():
+        for record in v.get("stages") or []:
+            event_args = {"video_id": video_id}
+            event_args.update({k: record[k] for k in ("blocks", "peak") if k in record})
+            events.append({
+                "name": record["stage"], "cat": record["stage"].split('/')[0], "ph": "X",
+                "ts": record["start"] * 1e6, "dur": record["time"] * 1e6,
+                "pid": record["pid"], "tid": 0, "args": event_args,
+            })
+    events.sort(key=lambda e: e["ts"])
+    with open(trace_path, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -2,14 +2,21 @@ import os
 import json
 import random
 import shutil
-from itertools import permutations, product
+from itertools import product
+from collections import Counter
+import numpy as np
 
 EPS = 1e-5
+# mass comparison of a pair against the factor, see _build_pair_table
+GREATER, LESS, EQUAL = 0, 1, 2
+# which object of a pair hangs from a dynamic pulley: the factor is then 2 or 0.5 instead of 1
+NO_DYNAMIC, FIRST_DYNAMIC, SECOND_DYNAMIC = 0, 1, 2
 
 class QuestionEnginePulley:
-    def __init__(self, simulation, templates):
+    def __init__(self, simulation, templates, rng=None):
         self.simulation = simulation
         self.templates = templates
+        self.rng = rng if rng is not None else random # random.Random of the video, or the global random module
         self.template_generators = {
             "mass": self.generate_mass,
             "tension": self.generate_tension,
@@ -42,76 +49,181 @@ class QuestionEnginePulley:
             'twice ': 2,
             'half ': 0.5,
         }
+        self.abbr_cache = None # built on first use by _build_abbr_table
+        self.prepare()
+
+    def prepare(self):
+        """ Per-scene precompute shared by all the generators, the engine is then reused for every template key of the video """
+        sim = self.simulation
+        graph = sim.rope_graph
+        # object name -> rope object it hangs on
+        self.object_rope = {graph.nodes[node]: sim.name_object_map[rope_n] for node, rope_n in graph.node_rope.items() if rope_n in sim.name_object_map}
+        self._build_pair_table()
+        self._build_abbr_table()
+        self.mass_cf_index = None # built on first use by _walk_counterfactuals
+        self.goal_index = None
+
+    def _walk_counterfactuals(self):
+        """ Single pass over the counterfactual annotations of the scene, shared by generate_cf, generate_cf2 and generate_gd
+
+        mass_cf_index: one item per COUNTERFACTUAL_change_one_object_mass annotation with obj_name
+            (abbreviated target), lighter (the mass decreases), and rotation / motion lists of
+            (abbreviated object name, result value) without the shafts
+        goal_index: (rotation_gd, motion_gd), lower case object name -> the ('mass', change, target)
+            leading to result 0, 1 and -1 (list index), without the shafts and fixed points
+        """
+        self.mass_cf_index = []
+        rotation_gd, motion_gd = {}, {}
+        for item in self.simulation.counterfactual.values():
+            if item.get("mode") != "COUNTERFACTUAL_change_one_object_mass":
+                continue
+            prior_mass = round(float(item["TargetObj_Mass_Before_After"]["Item1"]),2)
+            next_mass = round(float(item["TargetObj_Mass_Before_After"]["Item2"]),2)
+            obj_name = self.abbr_object_name(item["TargetObj_Name"].split('(')[0].strip().lower())
+            change = "Decrease" if prior_mass > next_mass else "Increase"
+
+            cf_item = {"obj_name": obj_name, "lighter": prior_mass > next_mass}
+            for kind, results, gd in [("rotation", item["ResultRotation"], rotation_gd), ("motion", item["ResultMotion"], motion_gd)]:
+                cf_item[kind] = []
+                for k, v in results.items():
+                    name = k.split('(')[0].strip().lower()
+                    if 'Shaft' not in k:
+                        cf_item[kind].append((self.abbr_object_name(name), v))
+                    if 'shaft' in name or 'fixed' in name:
+                        continue
+                    if name not in gd:
+                        gd[name] = [[],[],[]] # 0, 1, -1
+                    gd[name][int(v)].append(('mass', change, obj_name))
+            self.mass_cf_index.append(cf_item)
+        self.goal_index = (rotation_gd, motion_gd)
+
+    def mass_counterfactuals(self):
+        if self.mass_cf_index is None:
+            self._walk_counterfactuals()
+        return self.mass_cf_index
+
+    def goal_driven_results(self):
+        if self.goal_index is None:
+            self._walk_counterfactuals()
+        return self.goal_index
+
+    def generate_scene(self, template_keys=None, debug=False, rngs=None):
+        """ Generate every template family of the scene, yield (key, (questions, answers, features))
+
+        The counterfactual annotations are walked once for all the counterfactual and goal-driven
+        families. The families are generated lazily in order, so a caller consuming the random
+        generator between two keys (e.g. to shuffle the choices) gets the same outputs as calling
+        generate for each key. rngs (key -> random generator) switches the generator per family.
+        """
+        if template_keys is None:
+            template_keys = list(self.template_generators.keys())
+        if self.mass_cf_index is None:
+            self._walk_counterfactuals()
+        for key in template_keys:
+            if rngs is not None:
+                self.rng = rngs[key]
+            yield key, self.generate(key, debug=debug)
+
+    def _build_pair_table(self):
+        """ Compare all the ordered pairs of objects with a known mass at once
+
+        Per object arrays of the mass, the dynamic pulley flag and the rope, and the relation
+        matrix from the rope groups of the rope graph, then one entry per pair in the order of permutations(objects, 2):
+            (o1, o2, same name, related, case, comparison, rope of o1, rope of o2)
+        with case in NO_DYNAMIC / FIRST_DYNAMIC / SECOND_DYNAMIC and comparison in GREATER / LESS / EQUAL
+        of the mass of o1 against factor * the mass of o2. Only the random balancing of the
+        answers is left per pair, see _balance_comp_factor.
+        """
+        sim = self.simulation
+        loads = [o for o in sim.objects if o.mass is not None]
+        n = len(loads)
+        graph = sim.rope_graph
+        name_ids = {}
+        names = np.array([name_ids.setdefault(o.name, len(name_ids)) for o in loads], dtype=np.int64)
+        mass = np.array([float(o.mass) for o in loads], dtype=np.float64)
+        dynamic = np.array([graph.on_dynamic_pulley(o.name) for o in loads], dtype=bool)
+        ropes = [self.object_rope.get(o.name) for o in loads]
+        # groups of every load, none for the loads on no rope
+        groups = np.zeros((n, graph.membership.shape[1]), dtype=np.int64)
+        for i, o in enumerate(loads):
+            if o.name in graph.index:
+                groups[i] = graph.membership[graph.index[o.name]]
+        related = (groups @ groups.T) > 0
+
+        first, second = np.nonzero(~np.eye(n, dtype=bool)) # row-major, same order as permutations
+        # both on a dynamic pulley should not happen, they are then compared as on static pulleys
+        case = np.where(dynamic[first] & ~dynamic[second], FIRST_DYNAMIC,
+                        np.where(dynamic[second] & ~dynamic[first], SECOND_DYNAMIC, NO_DYNAMIC))
+        scaled = np.array([1, 2, 0.5])[case] * mass[second]
+        comparison = np.where(mass[first] > scaled + EPS, GREATER, np.where(mass[first] < scaled - EPS, LESS, EQUAL))
+
+        first_l, second_l = first.tolist(), second.tolist()
+        self.mass_pairs = list(zip(
+            [loads[i] for i in first_l], [loads[j] for j in second_l],
+            (names[first] == names[second]).tolist(), related[first, second].tolist(),
+            case.tolist(), comparison.tolist(),
+            [ropes[i] for i in first_l], [ropes[j] for j in second_l],
+        ))
+
+    def _parse_object_name(self, obj_name):
+        """ (color, type, pshape, dyn) of an object name, None for the missing parts """
+        def _parse(obj_name_list, candidates):
+            # first matching word of the name, so that the result does not depend on the set order
+            for c in obj_name_list:
+                if c in candidates:
+                    return c
+            return None
+
+        name_list = obj_name.strip().split(' ')
+        type = _parse(name_list, self.types)
+        return (
+            _parse(name_list, self.colors),
+            'fixed point' if type == 'fixed' else type,
+            _parse(name_list, self.pshape),
+            _parse(name_list, self.dyn),
+        )
+
+    def _build_abbr_table(self):
+        """ Count the objects of the simulation by (color, type), (color, type, pshape) and (color, type, dyn) in one pass """
+        self.abbr_counts = [Counter(), Counter(), Counter()]
+        for o in self.simulation.objects:
+            c, t, p, d = self._parse_object_name(o.name)
+            self.abbr_counts[0][(c, t)] += 1
+            self.abbr_counts[1][(c, t, p)] += 1
+            self.abbr_counts[2][(c, t, d)] += 1
+        self.abbr_cache = {}
 
     def abbr_object_name(self, obj_name):
-        def _parse_color(obj_name_list):
-            for color in self.colors:
-                if color in obj_name_list:
-                    return color
-            return None
-        
-        def _parse_type(obj_name_list):
-            for type in self.types:
-                if type in obj_name_list:
-                    return 'fixed point' if type == 'fixed' else type
-            return None
-        
-        def _parse_pshape(obj_name_list):
-            for pshape in self.pshape:
-                if pshape in obj_name_list:
-                    return pshape
-            return None
-        
-        def _parse_dyn(obj_name_list):
-            for dyn in self.dyn:
-                if dyn in obj_name_list:
-                    return dyn
-            return None
-        
-        target_name_list = obj_name.strip().split(' ')
-        color = _parse_color(target_name_list)
-        type = _parse_type(target_name_list)
-        pshape = _parse_pshape(target_name_list)
-        dyn = _parse_dyn(target_name_list)
+        """ Shortest name that uniquely identifies the object among self.simulation.objects """
+        if self.abbr_cache is None:
+            self._build_abbr_table()
+        if obj_name in self.abbr_cache:
+            return self.abbr_cache[obj_name]
 
+        color, type, pshape, dyn = self._parse_object_name(obj_name)
         if color is None or type is None:
             breakpoint()
 
-        is_only = 0
-        for o in self.simulation.objects:
-            nl = o.name.strip().split(' ')
-            c = _parse_color(nl)
-            t = _parse_type(nl)
-            if c == color and t == type:
-                is_only += 1
-
+        count_ct, count_ctp, count_ctd = self.abbr_counts
+        is_only = count_ct[(color, type)]
         if is_only == 0:
             breakpoint()
+            return None
         elif is_only == 1:
-            return color + ' ' + type
+            abbr = color + ' ' + type
         else:
-            is_only = 0
-            for o in self.simulation.objects:
-                nl = o.name.strip().split(' ')
-                c = _parse_color(nl)
-                t = _parse_type(nl)
-                p = _parse_pshape(nl)
-                if c == color and t == type and p == pshape:
-                    is_only += 1
+            is_only = count_ctp[(color, type, pshape)]
             if is_only == 1:
-                return obj_name if is_only > 1 else color + ' ' + pshape + ' ' + type
-            if is_only == 0:
+                abbr = color + ' ' + pshape + ' ' + type
+            elif is_only == 0:
                 breakpoint()
+                return None
             else:
-                is_only = 0
-                for o in self.simulation.objects:
-                    nl = o.name.strip().split(' ')
-                    c = _parse_color(nl)
-                    t = _parse_type(nl)
-                    d = _parse_dyn(nl)
-                    if c == color and t == type and d == dyn:
-                        is_only += 1
-                return obj_name if is_only > 1 else color + ' ' + dyn + ' ' + type
+                is_only = count_ctd[(color, type, dyn)]
+                abbr = obj_name if is_only > 1 else color + ' ' + dyn + ' ' + type
+
+        self.abbr_cache[obj_name] = abbr
+        return abbr
 
     def localize_object(self, obj):
         # function for uniquely localizing an object based on its properties
@@ -143,9 +255,9 @@ class QuestionEnginePulley:
         res_f = []
         template = self.templates["color"]
 
-        for color in self.colors:
+        for color in sorted(self.colors):
             if type(template) == list:
-                template = random.choice(template)
+                template = self.rng.choice(template)
 
             question = template.format(color)
             res_q.append(question)
@@ -162,10 +274,10 @@ class QuestionEnginePulley:
         res_f = []
         template = self.templates["shape"]
 
-        unique_shapes = self.shapes
+        unique_shapes = sorted(self.shapes)
         for shape in unique_shapes:
             if type(template) == list:
-                template = random.choice(template)
+                template = self.rng.choice(template)
                 
             question = template.format(shape)
             res_q.append(question)
@@ -182,12 +294,12 @@ class QuestionEnginePulley:
         res_f = []
 
         template = self.templates["existence"]
-        colors = self.colors
-        shapes = self.exact_shapes
+        colors = sorted(self.colors)
+        shapes = sorted(self.exact_shapes)
 
         for color, shape in product(colors, shapes):
             if type(template) == list:
-                template = random.choice(template)
+                template = self.rng.choice(template)
                 
             question = template.format(color, shape)
             res_q.append(question)
@@ -201,6 +313,16 @@ class QuestionEnginePulley:
         return res_a, res_q, res_f
     
     def _fetch_comp_factor(self, obj1, obj2):
+        """ _balance_comp_factor of a single pair, the generators use the precomputed self.mass_pairs """
+        graph = self.simulation.rope_graph
+        related = graph.same_group(obj1.name, obj2.name)
+        dy1, dy2 = graph.on_dynamic_pulley(obj1.name), graph.on_dynamic_pulley(obj2.name)
+        case = FIRST_DYNAMIC if dy1 and not dy2 else SECOND_DYNAMIC if dy2 and not dy1 else NO_DYNAMIC
+        m1, m2 = float(obj1.mass), float(obj2.mass) * [1, 2, 0.5][case]
+        comparison = GREATER if m1 > m2 + EPS else LESS if m1 < m2 - EPS else EQUAL
+        return self._balance_comp_factor(related, case, comparison)
+
+    def _balance_comp_factor(self, can_ans, case, comparison):
         """
         Return:
           ('yes'/'no'/'can not answer', comp, factor)
@@ -213,36 +335,27 @@ class QuestionEnginePulley:
 
         For situation 2 and 3, we balance the right ans and wrong ans probilities.
         Also, we generate some obvious factor for 2.
+        `case` and `comparison` tell the situation and how the masses compare, see _build_pair_table.
         """
         
-        can_ans = self.simulation.check_relation(obj1, obj2)
         # situation 1
         if not can_ans:
-            comp = random.choice(list(self.comp_dict.keys()))
+            comp = self.rng.choice(list(self.comp_dict.keys()))
             fac = ''
             cannot_ans_return_prob = 0.3
-            r_value = random.random()
+            r_value = self.rng.random()
             if r_value < cannot_ans_return_prob:
                 return 'can not answer', comp, fac
             else:
                 return None, comp, fac
                 
-            # fac = random.choice(list(self.factor_dict.keys()))
+            # fac = self.rng.choice(list(self.factor_dict.keys()))
         
-        dy_pulley_objects = self.simulation.link_dy_pulley
-
-        # should not happen
-        if obj1 in dy_pulley_objects and obj2 in dy_pulley_objects:
-            # conside as situation 3
-            # breakpoint()
-            dy_pulley_objects = []
-            
-        m1, m2 = float(obj1.mass), float(obj2.mass)
         return_tuple = None
 
         # situation 3
-        if obj1 not in dy_pulley_objects and obj2 not in dy_pulley_objects:
-            if m1 > m2+EPS:
+        if case == NO_DYNAMIC:
+            if comparison == GREATER:
                 """
                 c1) obj1 > obj2
                 d1) We will return:
@@ -256,14 +369,14 @@ class QuestionEnginePulley:
                 """
                 # right_diverse_thr = 0.1
                 # right_tuple = ('yes', 'greater than', '')
-                # d_value = random.random()
+                # d_value = self.rng.random()
                 # if d_value < right_diverse_thr:
                 #     right_tuple = ('yes', 'greater than', 'half of')
 
                 # wrong_diverse_thr = 0.1
-                # ele = random.choice(['equal to', 'less than'])
+                # ele = self.rng.choice(['equal to', 'less than'])
                 # wrong_tuple = ('no', ele, '')
-                # d_value = random.random()
+                # d_value = self.rng.random()
                 # if d_value < wrong_diverse_thr:
                 #     wrong_tuple = ('no', ele, 'half of')
 
@@ -277,10 +390,10 @@ class QuestionEnginePulley:
                 """
                 right_tuple = ('yes', 'greater than', '')
 
-                w_ele = random.choice(['less than', 'equal to'])
+                w_ele = self.rng.choice(['less than', 'equal to'])
                 wrong_tuple = ('no', w_ele, '')
 
-            elif m1 < m2-EPS:
+            elif comparison == LESS:
                 """
                 c1) obj1 > obj2
                 d1) We will return:
@@ -294,14 +407,14 @@ class QuestionEnginePulley:
                 """
                 # right_diverse_thr = 0.1
                 # right_tuple = ('yes', 'less than', '')
-                # d_value = random.random()
+                # d_value = self.rng.random()
                 # if d_value < right_diverse_thr:
                 #     right_tuple = ('yes', 'less than', 'twice of')
 
                 # wrong_diverse_thr = 0.1
-                # ele = random.choice(['equal to', 'greater than'])
+                # ele = self.rng.choice(['equal to', 'greater than'])
                 # wrong_tuple = ('no', ele, '')
-                # d_value = random.random()
+                # d_value = self.rng.random()
                 # if d_value < wrong_diverse_thr:
                 #     wrong_tuple = ('no', ele, 'twice of')
 
@@ -315,7 +428,7 @@ class QuestionEnginePulley:
                 """
                 right_tuple = ('yes', 'less than', '')
 
-                w_ele = random.choice(['greater than', 'equal to'])
+                w_ele = self.rng.choice(['greater than', 'equal to'])
                 wrong_tuple = ('no', w_ele, '')
 
             else: # m1 == m2
@@ -332,16 +445,16 @@ class QuestionEnginePulley:
 
                 # wrong_diverse_thr1 = 0.4
                 # wrong_diverse_thr2 = 0.8
-                # ele1 = random.choice(['', 'twice of'])
+                # ele1 = self.rng.choice(['', 'twice of'])
                 # wrong_tuple = ('no', 'equal to', ele1)
-                # d_value = random.random()
+                # d_value = self.rng.random()
                 # if d_value < wrong_diverse_thr1:
-                #     ele2 = random.choice(['less than', 'greater than'])
+                #     ele2 = self.rng.choice(['less than', 'greater than'])
                 #     wrong_tuple = ('no', ele2, '')
                 # elif d_value > wrong_diverse_thr2:
                 #     wrong_tuple1 = ('no', 'greater than', 'twice of')
                 #     wrong_tuple2 = ('no', 'less than', 'half of')
-                #     wrong_tuple = random.choice([wrong_tuple1, wrong_tuple2])
+                #     wrong_tuple = self.rng.choice([wrong_tuple1, wrong_tuple2])
 
                 """
                 c2) obj1 == obj2
@@ -353,11 +466,11 @@ class QuestionEnginePulley:
                 """
                 right_tuple = ('yes', 'equal to', '')
 
-                w_ele = random.choice(['less than', 'greater than'])
+                w_ele = self.rng.choice(['less than', 'greater than'])
                 wrong_tuple = ('no', w_ele, '')
 
-        elif obj1 in dy_pulley_objects: # obj1 links with dynamic pulley
-            if m1 > 2*m2+EPS:
+        elif case == FIRST_DYNAMIC: # obj1 links with dynamic pulley
+            if comparison == GREATER:
                 """
                 c1) obj1 > 2*obj2
                 d1) We will return:
@@ -370,20 +483,20 @@ class QuestionEnginePulley:
                 """
                 right_diverse_thr = 0.1
                 right_tuple = ('yes', 'greater than', 'twice ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < right_diverse_thr:
-                    r_ele = random.choice(['half ', ''])
+                    r_ele = self.rng.choice(['half ', ''])
                     right_tuple = ('yes', 'greater than', r_ele)
 
                 wrong_diverse_thr = 0.1
-                w_ele = random.choice(['equal to', 'less than'])
+                w_ele = self.rng.choice(['equal to', 'less than'])
                 wrong_tuple = ('no', w_ele, 'twice ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < wrong_diverse_thr:
-                    w_ele2 = random.choice(['half ', ''])
+                    w_ele2 = self.rng.choice(['half ', ''])
                     wrong_tuple = ('no', w_ele, w_ele2)
             
-            elif m1 < 2*m2 - EPS:
+            elif comparison == LESS:
                 """
                 c1) obj1 < 2*obj2
                 d1) We will return:
@@ -394,7 +507,7 @@ class QuestionEnginePulley:
                 """
                 right_tuple = ('yes', 'less than', 'twice ')
 
-                w_ele = random.choice(['greater than', 'equal to'])
+                w_ele = self.rng.choice(['greater than', 'equal to'])
                 wrong_tuple = ('no', w_ele, 'twice ')
 
             else: # m1 == 2*m2
@@ -409,15 +522,15 @@ class QuestionEnginePulley:
                 right_tuple = ('yes', 'equal to', 'twice ')
 
                 wrong_diverse_thr = 0.1
-                w_ele = random.choice(['greater than', 'less than'])
+                w_ele = self.rng.choice(['greater than', 'less than'])
                 wrong_tuple = ('no', w_ele, 'twice ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < wrong_diverse_thr:
-                    w_ele2 = random.choice(['half ', ''])
+                    w_ele2 = self.rng.choice(['half ', ''])
                     wrong_tuple = ('no', 'equal to', w_ele2)
 
-        elif obj2 in dy_pulley_objects:
-            if m1 > 0.5*m2+EPS:
+        elif case == SECOND_DYNAMIC:
+            if comparison == GREATER:
                 """
                 c1) obj1 > 0.5*obj2
                 d1) We will return:
@@ -428,10 +541,10 @@ class QuestionEnginePulley:
                 """
                 right_tuple = ('yes', 'greater than', 'half ')
 
-                w_ele = random.choice(['less than', 'equal to'])
+                w_ele = self.rng.choice(['less than', 'equal to'])
                 wrong_tuple = ('no', w_ele, 'half ')
             
-            elif m1 < 0.5*m2 - EPS:
+            elif comparison == LESS:
                 """
                 c1) obj1 < 0.5*obj2
                 d1) We will return:
@@ -444,17 +557,17 @@ class QuestionEnginePulley:
                 """
                 right_diverse_thr = 0.1
                 right_tuple = ('yes', 'less than', 'half ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < right_diverse_thr:
-                    r_ele = random.choice(['twice ', ''])
+                    r_ele = self.rng.choice(['twice ', ''])
                     right_tuple = ('yes', 'less than', r_ele)
 
                 wrong_diverse_thr = 0.1
-                w_ele = random.choice(['equal to', 'greater than'])
+                w_ele = self.rng.choice(['equal to', 'greater than'])
                 wrong_tuple = ('no', w_ele, 'half ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < wrong_diverse_thr:
-                    w_ele2 = random.choice(['twice ', ''])
+                    w_ele2 = self.rng.choice(['twice ', ''])
                     wrong_tuple = ('no', w_ele, w_ele2)
 
             else: # m1 == 0.5*m2
@@ -469,11 +582,11 @@ class QuestionEnginePulley:
                 right_tuple = ('yes', 'equal to', 'half ')
 
                 wrong_diverse_thr = 0.1
-                w_ele = random.choice(['greater than', 'less than'])
+                w_ele = self.rng.choice(['greater than', 'less than'])
                 wrong_tuple = ('no', w_ele, 'half ')
-                d_value = random.random()
+                d_value = self.rng.random()
                 if d_value < wrong_diverse_thr:
-                    w_ele2 = random.choice(['twice ', ''])
+                    w_ele2 = self.rng.choice(['twice ', ''])
                     wrong_tuple = ('no', 'equal to', w_ele2)
         
         else:
@@ -482,7 +595,7 @@ class QuestionEnginePulley:
             pass
 
         right_wrong_prob = 0.5
-        wr_value = random.random()
+        wr_value = self.rng.random()
         if wr_value < right_wrong_prob:
             return_tuple = right_tuple
         else:
@@ -498,18 +611,14 @@ class QuestionEnginePulley:
         res_f = []
         template = self.templates["mass"]
 
-        for o1, o2 in permutations(objs, 2):
-            if o1.mass == "null" or o2.mass == "null":
-                continue
-
+        for o1, o2, same_name, related, case, comparison, _, _ in self.mass_pairs:
             if type(template) == list:
-                template = random.choice(template)
+                template = self.rng.choice(template)
                 
-            m1, m2 = float(o1.mass), float(o2.mass)
-            if o1.name == o2.name:
+            if same_name:
                 continue
 
-            ans, comp, factor = self._fetch_comp_factor(o1, o2)
+            ans, comp, factor = self._balance_comp_factor(related, case, comparison)
             if ans == None:
                 continue
             
@@ -529,29 +638,21 @@ class QuestionEnginePulley:
         res_f = []
         template = self.templates["tension"]
 
-        for o1, o2 in permutations(objs, 2):
-            if o1.mass == "null" or o2.mass == "null":
-                continue
-
+        for o1, o2, same_name, related, case, comparison, rope1, rope2 in self.mass_pairs:
             if type(template) == list:
-                template = random.choice(template)
+                template = self.rng.choice(template)
                 
-            m1, m2 = float(o1.mass), float(o2.mass)
-            ans, comp, factor = self._fetch_comp_factor(o1, o2)
+            ans, comp, factor = self._balance_comp_factor(related, case, comparison)
             if ans == None:
                 continue
 
-            obj1_n, obj2_n = o1.name, o2.name
-            if obj1_n == obj2_n:
+            if same_name:
                 continue
-            try:
-                rope1_n, rope2_n = self.simulation.object_rope_map[obj1_n], self.simulation.object_rope_map[obj2_n]
-                if rope1_n == rope2_n:
-                    continue
-                rope1, rope2 = self.simulation.name_object_map[rope1_n], self.simulation.name_object_map[rope2_n]
-            except:
+            if rope1 is None or rope2 is None:
                 breakpoint()
                 continue
+            if rope1 is rope2:
+                continue
 
             feature = [rope1.color.lower(), rope1.shape.lower(), comp, factor, rope2.color.lower(), rope2.shape.lower()]
 
@@ -572,9 +673,8 @@ class QuestionEnginePulley:
         templates = self.templates["rope_counterfactual"]
         templates_q = templates['question']
         templates_c = templates['choice']
-        counterfactual = self.simulation.counterfactual
 
-        for item in counterfactual.values():
+        for item in self.mass_counterfactuals():
             true_choices, false_choices = [], []
             question = None
 
@@ -591,7 +691,7 @@ class QuestionEnginePulley:
             #     rotation_temp = templates_c['rotate']
             #     motion_temp = templates_c['move']
 
-            #     template_q = random.choice(templates_q)
+            #     template_q = self.rng.choice(templates_q)
             #     question = template_q.format(obj_name, direction)
 
             #     # rotation
@@ -644,156 +744,142 @@ class QuestionEnginePulley:
             #         else:
             #             raise ValueError("Motion value is not in [-1, 0, 1]")
                     
-            if "mode" in list(item.keys()) and item["mode"] == "COUNTERFACTUAL_change_one_object_mass":
-                obj_name = item["TargetObj_Name"].split('(')[0].strip()
-                obj_name = self.abbr_object_name(obj_name.lower())
+            obj_name = item["obj_name"]
+            change = "lighter" if item["lighter"] else "heavier"
 
-                prior_mass = round(float(item["TargetObj_Mass_Before_After"]["Item1"]),2)
-                next_mass = round(float(item["TargetObj_Mass_Before_After"]["Item2"]),2)
+            # get the dictionaries
+            result_rotation = item["rotation"]
+            result_motion = item["motion"]
 
-                change = "lighter" if prior_mass > next_mass else "heavier"
+            rotation_temp = templates_c['rotate']
+            motion_temp = templates_c['move']
 
-                # get the dictionaries
-                result_rotation = item["ResultRotation"]
-                result_motion = item["ResultMotion"]
-
-                rotation_temp = templates_c['rotate']
-                motion_temp = templates_c['move']
-
-                template_q = random.choice(templates_q)
-                question = template_q.format(obj_name, change)
-                
-                f_change = "increase" if change == "heavier" else "decrease"
-                question_f = [obj_name, f_change, 'mass']
+            template_q = self.rng.choice(templates_q)
+            question = template_q.format(obj_name, change)
+            
+            f_change = "increase" if change == "heavier" else "decrease"
+            question_f = [obj_name, f_change, 'mass']
 
-                # rotation
-                for k, v in result_rotation.items():
-                    if 'Shaft' in k:
-                        continue
+            # rotation
+            for c_name, v in result_rotation:
 
-                    c_name = self.abbr_object_name(k.split('(')[0].strip().lower())
-                    template_c = rotation_temp
-                    template_c_r = "The {} would not rotate"
+                template_c = rotation_temp
+                template_c_r = "The {} would not rotate"
 
-                    if 'fixed' in c_name:
-                        continue
+                if 'fixed' in c_name:
+                    continue
 
-                    if v == -1:
-                        choice = template_c.format(c_name, "anti-clockwise")
-                        f_choice = f'{c_name}|rotation|anti-clockwise'
-                        choice = choice + '||' + f_choice
-                        true_choices.append(choice) 
-                        choice = template_c.format(c_name, "clockwise")
-                        f_choice = f'{c_name}|rotation|clockwise'
+                if v == -1:
+                    choice = template_c.format(c_name, "anti-clockwise")
+                    f_choice = f'{c_name}|rotation|anti-clockwise'
+                    choice = choice + '||' + f_choice
+                    true_choices.append(choice) 
+                    choice = template_c.format(c_name, "clockwise")
+                    f_choice = f'{c_name}|rotation|clockwise'
+                    choice = choice + '||' + f_choice
+                    false_choices.append(choice) 
+
+                    if self.rng.random() < 0.1:
+                        choice = template_c_r.format(c_name)
+                        f_choice = f'{c_name}|rotation|stationary'
                         choice = choice + '||' + f_choice
-                        false_choices.append(choice) 
+                        false_choices.append(choice)
 
-                        if random.random() < 0.1:
-                            choice = template_c_r.format(c_name)
-                            f_choice = f'{c_name}|rotation|stationary'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
+                elif v == 1:
+                    choice = template_c.format(c_name, "clockwise")
+                    f_choice = f'{c_name}|rotation|clockwise'
+                    choice = choice + '||' + f_choice
+                    true_choices.append(choice)
+                    choice = template_c.format(c_name, "anti-clockwise")
+                    f_choice = f'{c_name}|rotation|anti-clockwise'
+                    choice = choice + '||' + f_choice
+                    false_choices.append(choice) 
+
+                    if self.rng.random() < 0.1:
+                        choice = template_c_r.format(c_name)
+                        f_choice = f'{c_name}|rotation|stationary'
+                        choice = choice + '||' + f_choice
+                        false_choices.append(choice)
 
-                    elif v == 1:
+                elif v == 0:
+                    if self.rng.random()<0.5:
                         choice = template_c.format(c_name, "clockwise")
                         f_choice = f'{c_name}|rotation|clockwise'
                         choice = choice + '||' + f_choice
-                        true_choices.append(choice)
+                        false_choices.append(choice)
+                    else:
                         choice = template_c.format(c_name, "anti-clockwise")
                         f_choice = f'{c_name}|rotation|anti-clockwise'
                         choice = choice + '||' + f_choice
-                        false_choices.append(choice) 
-
-                        if random.random() < 0.1:
-                            choice = template_c_r.format(c_name)
-                            f_choice = f'{c_name}|rotation|stationary'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-
-                    elif v == 0:
-                        if random.random()<0.5:
-                            choice = template_c.format(c_name, "clockwise")
-                            f_choice = f'{c_name}|rotation|clockwise'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-                        else:
-                            choice = template_c.format(c_name, "anti-clockwise")
-                            f_choice = f'{c_name}|rotation|anti-clockwise'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
+                        false_choices.append(choice)
 
-                        choice = template_c_r.format(c_name)
-                        f_choice = f'{c_name}|rotation|stationary'
-                        choice = choice + '||' + f_choice
-                        true_choices.append(choice)
-                        
-                    else:
-                        raise ValueError("Rotation value is not in [-1, 0, 1]")
+                    choice = template_c_r.format(c_name)
+                    f_choice = f'{c_name}|rotation|stationary'
+                    choice = choice + '||' + f_choice
+                    true_choices.append(choice)
                     
-                # motion
-                for k, v in result_motion.items():
-                    if 'Shaft' in k:
-                        continue
-                    
-                    c_name = self.abbr_object_name(k.split('(')[0].strip().lower())
-                    template_c = motion_temp
-                    template_c_r = "The {} would not move"
+                else:
+                    raise ValueError("Rotation value is not in [-1, 0, 1]")
+                
+            # motion
+            for c_name, v in result_motion:
+                
+                template_c = motion_temp
+                template_c_r = "The {} would not move"
 
-                    if 'fixed' in c_name:
-                        continue
+                if 'fixed' in c_name:
+                    continue
 
-                    if v == -1:
-                        choice = template_c.format(c_name, "down")
-                        f_choice = f'{c_name}|motion|down'
+                if v == -1:
+                    choice = template_c.format(c_name, "down")
+                    f_choice = f'{c_name}|motion|down'
+                    choice = choice + '||' + f_choice
+                    true_choices.append(choice)
+                    choice = template_c.format(c_name, "up")
+                    f_choice = f'{c_name}|motion|up'
+                    choice = choice + '||' + f_choice
+                    false_choices.append(choice)
+
+                    if self.rng.random() < 0.1:
+                        choice = template_c_r.format(c_name)
+                        f_choice = f'{c_name}|motion|stationary'
                         choice = choice + '||' + f_choice
-                        true_choices.append(choice)
-                        choice = template_c.format(c_name, "up")
-                        f_choice = f'{c_name}|motion|up'
+                        false_choices.append(choice)
+                elif v == 1:
+                    choice = template_c.format(c_name, "up")
+                    f_choice = f'{c_name}|motion|up'
+                    choice = choice + '||' + f_choice
+                    true_choices.append(choice)
+                    choice = template_c.format(c_name, "down")
+                    f_choice = f'{c_name}|motion|down'
+                    choice = choice + '||' + f_choice
+                    false_choices.append(choice)
+
+                    if self.rng.random() < 0.1:
+                        choice = template_c_r.format(c_name)
+                        f_choice = f'{c_name}|motion|stationary'
                         choice = choice + '||' + f_choice
                         false_choices.append(choice)
-
-                        if random.random() < 0.1:
-                            choice = template_c_r.format(c_name)
-                            f_choice = f'{c_name}|motion|stationary'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-                    elif v == 1:
+                elif v == 0:
+                    if self.rng.random()<0.5:
                         choice = template_c.format(c_name, "up")
                         f_choice = f'{c_name}|motion|up'
                         choice = choice + '||' + f_choice
-                        true_choices.append(choice)
+                        false_choices.append(choice)
+                    else:
                         choice = template_c.format(c_name, "down")
                         f_choice = f'{c_name}|motion|down'
                         choice = choice + '||' + f_choice
                         false_choices.append(choice)
 
-                        if random.random() < 0.1:
-                            choice = template_c_r.format(c_name)
-                            f_choice = f'{c_name}|motion|stationary'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-                    elif v == 0:
-                        if random.random()<0.5:
-                            choice = template_c.format(c_name, "up")
-                            f_choice = f'{c_name}|motion|up'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-                        else:
-                            choice = template_c.format(c_name, "down")
-                            f_choice = f'{c_name}|motion|down'
-                            choice = choice + '||' + f_choice
-                            false_choices.append(choice)
-
-                        if random.random()<0.2:
-                            choice = template_c_r.format(c_name)
-                            f_choice = f'{c_name}|motion|stationary'
-                            choice = choice + '||' + f_choice
-                            true_choices.append(choice)
-                    else:
-                        raise ValueError("Motion value is not in [-1, 0, 1]")
+                    if self.rng.random()<0.2:
+                        choice = template_c_r.format(c_name)
+                        f_choice = f'{c_name}|motion|stationary'
+                        choice = choice + '||' + f_choice
+                        true_choices.append(choice)
+                else:
+                    raise ValueError("Motion value is not in [-1, 0, 1]")
 
-            else:
-                continue
 
             if len(true_choices) == 0 or len(false_choices) == 0:
                 continue
@@ -803,10 +889,10 @@ class QuestionEnginePulley:
                 f_choices = dict()
 
                 all_choices.append((true_choices[0], 1))
-                _f_temp = random.sample(false_choices, 2)
+                _f_temp = self.rng.sample(false_choices, 2)
                 all_choices.append((_f_temp[0], 0))
                 all_choices.append((_f_temp[1], 0))
-                random.shuffle(all_choices)
+                self.rng.shuffle(all_choices)
 
                 for i, (choice, b) in enumerate(all_choices):
                     choice, f_choice = choice.split('||')
@@ -833,10 +919,10 @@ class QuestionEnginePulley:
                 f_choices = dict()
 
                 all_choices.append((false_choices[0], 0))
-                _t_temp = random.sample(true_choices, 2)
+                _t_temp = self.rng.sample(true_choices, 2)
                 all_choices.append((_t_temp[0], 0))
                 all_choices.append((_t_temp[1], 0))
-                random.shuffle(all_choices)
+                self.rng.shuffle(all_choices)
 
                 for i, (choice, b) in enumerate(all_choices):
                     choice, f_choice = choice.split('||')
@@ -858,12 +944,12 @@ class QuestionEnginePulley:
                 res_f.append(f_a)
                 continue
 
-            random.shuffle(true_choices)
-            random.shuffle(false_choices)
+            self.rng.shuffle(true_choices)
+            self.rng.shuffle(false_choices)
             if len(false_choices) > len(true_choices):
-                false_choices = random.sample(false_choices, len(true_choices))
+                false_choices = self.rng.sample(false_choices, len(true_choices))
             else:
-                true_choices = random.sample(true_choices, len(false_choices))
+                true_choices = self.rng.sample(true_choices, len(false_choices))
 
             try:
                 while True:
@@ -875,10 +961,10 @@ class QuestionEnginePulley:
                     c = true_choices.pop()
                     all_choices.append((c,1))
 
-                    ans_num = random.randint(2, 4) # 3--5
+                    ans_num = self.rng.randint(2, 4) # 3--5
                     for i in range(ans_num):
                         p = len(false_choices) / (len(false_choices) + len(true_choices))
-                        rand_num = random.random()
+                        rand_num = self.rng.random()
                         if rand_num < p:
                             c = false_choices.pop()
                             all_choices.append((c,0))
@@ -894,7 +980,7 @@ class QuestionEnginePulley:
                     if len(_debug_choices) != len(set(_debug_choices)):
                         breakpoint()
 
-                    random.shuffle(all_choices)
+                    self.rng.shuffle(all_choices)
 
                     for i, (choice, b) in enumerate(all_choices):
                         choice, f_choice = choice.split('||')
@@ -929,100 +1015,85 @@ class QuestionEnginePulley:
         res_f = []
 
         templates = self.templates["rope_counterfactual2"]
-        counterfactual = self.simulation.counterfactual
-
-        for item in counterfactual.values():
-            if "mode" in list(item.keys()) and item["mode"] == "COUNTERFACTUAL_change_one_object_mass":
-                obj_name = item["TargetObj_Name"].split('(')[0].strip()
-                obj_name = self.abbr_object_name(obj_name.lower())
-
-                prior_mass = round(float(item["TargetObj_Mass_Before_After"]["Item1"]),2)
-                next_mass = round(float(item["TargetObj_Mass_Before_After"]["Item2"]),2)
-
-                change = "lighter" if prior_mass > next_mass else "heavier"
-
-                # get the dictionaries
-                result_rotation = item["ResultRotation"]
-                result_motion = item["ResultMotion"]
-
-                # rotation
-                templates_r = templates['rotate']
-                template_q_idx = random.randint(0,1)
-                reverse_format = template_q_idx == 1
-                template_q = templates_r['question'][template_q_idx]
-                f_change = "increase" if change == "heavier" else "decrease"
-                question_f = [obj_name, f_change, 'mass']
-                for k, v in result_rotation.items():
-                    if 'Shaft' in k:
-                        continue
-                    c_name = self.abbr_object_name(k.split('(')[0].strip().lower())
-                    if 'fixed' in c_name:
-                        continue
 
-                    if not reverse_format:
-                        question = template_q.format(obj_name, change, c_name) + '\n' + templates_r['choice']
-                    else:
-                        question = template_q.format(c_name, obj_name, change) + '\n' + templates_r['choice']
-                    f_all = {
-                        'question': question_f,
-                        'choices': {
-                            'A': [c_name, 'rotation', 'clockwise'],
-                            'B': [c_name, 'rotation', 'anti-clockwise'],
-                            'C': [c_name, 'rotation', 'stationary']
-                        }
+        for item in self.mass_counterfactuals():
+            obj_name = item["obj_name"]
+            change = "lighter" if item["lighter"] else "heavier"
+
+            # get the dictionaries
+            result_rotation = item["rotation"]
+            result_motion = item["motion"]
+
+            # rotation
+            templates_r = templates['rotate']
+            template_q_idx = self.rng.randint(0,1)
+            reverse_format = template_q_idx == 1
+            template_q = templates_r['question'][template_q_idx]
+            f_change = "increase" if change == "heavier" else "decrease"
+            question_f = [obj_name, f_change, 'mass']
+            for c_name, v in result_rotation:
+                if 'fixed' in c_name:
+                    continue
+
+                if not reverse_format:
+                    question = template_q.format(obj_name, change, c_name) + '\n' + templates_r['choice']
+                else:
+                    question = template_q.format(c_name, obj_name, change) + '\n' + templates_r['choice']
+                f_all = {
+                    'question': question_f,
+                    'choices': {
+                        'A': [c_name, 'rotation', 'clockwise'],
+                        'B': [c_name, 'rotation', 'anti-clockwise'],
+                        'C': [c_name, 'rotation', 'stationary']
                     }
-                    if v == -1:
-                        ans = 'B'
-                    elif v == 1:
-                        ans = 'A'
-                    elif v == 0:
-                        ans = 'C'
-                    else:
-                        raise ValueError("Rotation value is not in [-1, 0, 1]")
-                    
-                    res_q.append(question)
-                    res_a.append(ans)
-                    res_f.append(f_all)
-                    
-                # motion
-                templates_r = templates['move']
-                template_q_idx = random.randint(0,1)
-                reverse_format = template_q_idx == 1
-                template_q = templates_r['question'][template_q_idx]
-                for k, v in result_motion.items():
-                    if 'Shaft' in k:
-                        continue
-                    c_name = self.abbr_object_name(k.split('(')[0].strip().lower())
-                    if 'fixed' in c_name:
-                        continue
+                }
+                if v == -1:
+                    ans = 'B'
+                elif v == 1:
+                    ans = 'A'
+                elif v == 0:
+                    ans = 'C'
+                else:
+                    raise ValueError("Rotation value is not in [-1, 0, 1]")
+                
+                res_q.append(question)
+                res_a.append(ans)
+                res_f.append(f_all)
+                
+            # motion
+            templates_r = templates['move']
+            template_q_idx = self.rng.randint(0,1)
+            reverse_format = template_q_idx == 1
+            template_q = templates_r['question'][template_q_idx]
+            for c_name, v in result_motion:
+                if 'fixed' in c_name:
+                    continue
 
-                    if not reverse_format:
-                        question = template_q.format(obj_name, change, c_name) + '\n' + templates_r['choice']
-                    else:
-                        question = template_q.format(c_name, obj_name, change) + '\n' + templates_r['choice']
-                    f_all = {
-                        'question': question_f,
-                        'choices': {
-                            'A': [c_name, 'motion', 'down'],
-                            'B': [c_name, 'motion', 'up'],
-                            'C': [c_name, 'motion', 'stationary']
-                        }
+                if not reverse_format:
+                    question = template_q.format(obj_name, change, c_name) + '\n' + templates_r['choice']
+                else:
+                    question = template_q.format(c_name, obj_name, change) + '\n' + templates_r['choice']
+                f_all = {
+                    'question': question_f,
+                    'choices': {
+                        'A': [c_name, 'motion', 'down'],
+                        'B': [c_name, 'motion', 'up'],
+                        'C': [c_name, 'motion', 'stationary']
                     }
+                }
 
-                    if v == -1:
-                        ans = 'A'
-                    elif v == 1:
-                        ans = 'B'
-                    elif v == 0:
-                        ans = 'C'
-                    else:
-                        raise ValueError("Motion value is not in [-1, 0, 1]")
+                if v == -1:
+                    ans = 'A'
+                elif v == 1:
+                    ans = 'B'
+                elif v == 0:
+                    ans = 'C'
+                else:
+                    raise ValueError("Motion value is not in [-1, 0, 1]")
 
-                    res_q.append(question)
-                    res_a.append(ans)
-                    res_f.append(f_all)
-            else:
-                continue
+                res_q.append(question)
+                res_a.append(ans)
+                res_f.append(f_all)
 
 
         return res_a, res_q, res_f
@@ -1037,72 +1108,12 @@ class QuestionEnginePulley:
         templates = self.templates["rope_goaldriven"]
         templates_q = templates['question']
         templates_c = templates['choice']
-        counterfactual = self.simulation.counterfactual
 
         # create dictionaries to store keys for gd
-        rotation_gd = {}
-        motion_gd = {}
-
-        for item in counterfactual.values():    
-            # if "mode" in list(item.keys()) and item["mode"] == "COUNTERFACTUAL_pull_object_up_or_down":
-            #     obj_name = item["TargetMovingAgent"]["name"].split('(')[0].strip()
-            #     obj_name = self.abbr_object_name(obj_name.lower())
-            #     direction = item["TargetMovingAgent"]["direction"]
-
-            #     # get the dictionaries
-            #     result_rotation = item["ResultRotation"]
-            #     result_motion = item["ResultMotion"]
-
-            #     for key, value in result_rotation.items():
-            #         _name_t = key.lower().split('(')[0].strip()
-            #         if 'shaft' in _name_t or 'fixed' in _name_t:
-            #             continue
-            #         if _name_t not in rotation_gd:
-            #             rotation_gd[_name_t] = [[],[],[]] # 0, 1, -1
-            #         rotation_gd[_name_t][int(value)].append(('pull', obj_name, direction))
-                    
-            #     for key, value in result_motion.items():
-            #         _name_t = key.lower().split('(')[0].strip()
-            #         if 'shaft' in _name_t or 'fixed' in _name_t:
-            #             continue
-            #         if _name_t not in motion_gd:
-            #             motion_gd[_name_t] = [[],[],[]] # 0, 1, -1
-            #         motion_gd[_name_t][int(value)].append(('pull', obj_name, direction))
-
-            if "mode" in list(item.keys()) and item["mode"] == "COUNTERFACTUAL_change_one_object_mass":
-                obj_name = item["TargetObj_Name"].split('(')[0].strip()
-                obj_name = self.abbr_object_name(obj_name.lower())
-
-                prior_mass = round(float(item["TargetObj_Mass_Before_After"]["Item1"]),2)
-                next_mass = round(float(item["TargetObj_Mass_Before_After"]["Item2"]),2)
-                change = "Decrease" if prior_mass > next_mass else "Increase"
-
-                # get the dictionaries
-                result_rotation = item["ResultRotation"]
-                result_motion = item["ResultMotion"]
+        rotation_gd, motion_gd = self.goal_driven_results()
 
-                for key, value in result_rotation.items():
-                    _name_t = key.lower().split('(')[0].strip()
-                    if 'shaft' in _name_t or 'fixed' in _name_t:
-                        continue
-                    if _name_t not in rotation_gd:
-                        rotation_gd[_name_t] = [[],[],[]] # 0, 1, -1
-                    rotation_gd[_name_t][int(value)].append(('mass', change, obj_name))
-                    
-                for key, value in result_motion.items():
-                    _name_t = key.lower().split('(')[0].strip()
-                    if 'shaft' in _name_t or 'fixed' in _name_t:
-                        continue
-                    if _name_t not in motion_gd:
-                        motion_gd[_name_t] = [[],[],[]] # 0, 1, -1
-                    motion_gd[_name_t][int(value)].append(('mass', change, obj_name))
-
-            else:
-                continue
-
-        # rotation
         for key, value in rotation_gd.items():
-            choice_idx = random.randint(0,1)*2-1
+            choice_idx = self.rng.randint(0,1)*2-1
             if len(value[1]) + len(value[-1]) == 0:
                 continue
             if len(value[choice_idx]) == 0:
@@ -1112,7 +1123,7 @@ class QuestionEnginePulley:
             elif choice_idx == -1:
                 direction = "rotate anti-clockwise"
 
-            template_q = random.choice(templates_q)
+            template_q = self.rng.choice(templates_q)
             obj_name = self.abbr_object_name(key.lower())
             question = template_q.format(obj_name, direction)
             f_question = [obj_name, 'rotation', direction.split(' ')[-1]]
@@ -1134,8 +1145,8 @@ class QuestionEnginePulley:
             if len(true_choices) == 0 or len(false_choices) == 0:
                 continue
 
-            random.shuffle(true_choices)
-            random.shuffle(false_choices)
+            self.rng.shuffle(true_choices)
+            self.rng.shuffle(false_choices)
 
             all_choices = []
             f_choices = dict()
@@ -1154,7 +1165,7 @@ class QuestionEnginePulley:
             else:
                 c = true_choices.pop()
                 all_choices.append((c,1))
-                ans_num = random.randint(2, 4) # 3--5
+                ans_num = self.rng.randint(2, 4) # 3--5
                 
                 if len(false_choices)+len(true_choices) <= ans_num:
                     all_choices.extend([(c,1) for c in true_choices])
@@ -1162,7 +1173,7 @@ class QuestionEnginePulley:
                 else:
                     for i in range(ans_num):
                         p = len(false_choices) / (len(false_choices) + len(true_choices))
-                        rand_num = random.random()
+                        rand_num = self.rng.random()
                         if rand_num < p:
                             try:
                                 c = false_choices.pop()
@@ -1178,7 +1189,7 @@ class QuestionEnginePulley:
                                 c = false_choices.pop()
                                 all_choices.append((c,0))
 
-            random.shuffle(all_choices)
+            self.rng.shuffle(all_choices)
             for i, (choice, b) in enumerate(all_choices):
                 choice, f_choice = choice.split('||')
                 if choice in question:
@@ -1201,7 +1212,7 @@ class QuestionEnginePulley:
 
         # rotation
         for key, value in motion_gd.items():
-            choice_idx = random.randint(0,1)*2-1
+            choice_idx = self.rng.randint(0,1)*2-1
             if len(value[1]) + len(value[-1]) == 0:
                 continue
             if len(value[choice_idx]) == 0:
@@ -1211,7 +1222,7 @@ class QuestionEnginePulley:
             elif choice_idx == -1:
                 direction = "move down"
 
-            template_q = random.choice(templates_q)
+            template_q = self.rng.choice(templates_q)
             obj_name = self.abbr_object_name(key.lower())
             question = template_q.format(obj_name, direction)
             f_question = [obj_name, 'motion', direction.split(' ')[-1]]
@@ -1233,8 +1244,8 @@ class QuestionEnginePulley:
             if len(true_choices) == 0 or len(false_choices) == 0:
                 continue
 
-            random.shuffle(true_choices)
-            random.shuffle(false_choices)
+            self.rng.shuffle(true_choices)
+            self.rng.shuffle(false_choices)
 
             all_choices = []
             f_choices = dict()
@@ -1253,7 +1264,7 @@ class QuestionEnginePulley:
             else:
                 c = true_choices.pop()
                 all_choices.append((c,1))
-                ans_num = random.randint(2, 4) # 3--5
+                ans_num = self.rng.randint(2, 4) # 3--5
                 
                 if len(false_choices)+len(true_choices) <= ans_num:
                     all_choices.extend([(c,1) for c in true_choices])
@@ -1261,7 +1272,7 @@ class QuestionEnginePulley:
                 else:
                     for i in range(ans_num):
                         p = len(false_choices) / (len(false_choices) + len(true_choices))
-                        rand_num = random.random()
+                        rand_num = self.rng.random()
                         if rand_num < p:
                             try:
                                 c = false_choices.pop()
@@ -1277,7 +1288,7 @@ class QuestionEnginePulley:
                                 c = false_choices.pop()
                                 all_choices.append((c,0))
 
-            random.shuffle(all_choices)
+            self.rng.shuffle(all_choices)
             for i, (choice, b) in enumerate(all_choices):
                 choice, f_choice = choice.split('||')
                 if choice in question:
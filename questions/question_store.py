@@ -0,0 +1,133 @@
+""" Append-only store of the generated questions
+
+A store is a directory of shards. Each writing process appends to its own shard, so no
+locking is needed:
+  part-<id>.jsonl[.gz]   one {"video_id": ..., "question_dict": ...} record per video
+  part-<id>.idx          one {"video_id": ..., "offset": ..., "length": ...} line per record
+With compression every record is an independent gzip member, the shard is still a valid
+gzip file but a record can also be read alone from its offset.
+
+A record is only visible once its index line is written, so a record cut by a crash is
+ignored and the video is generated again on resume.
+"""
+
+import os
+import gzip
+import json
+import glob
+import uuid
+
+
+class ShardWriter:
+    def __init__(self, root, compress=False):
+        os.makedirs(root, exist_ok=True)
+        self.compress = compress
+        name = f'part-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.data_path = os.path.join(root, name + ('.jsonl.gz' if compress else '.jsonl'))
+        self.index_path = os.path.join(root, name + '.idx')
+        self.data_file = open(self.data_path, 'ab')
+        self.index_file = open(self.index_path, 'a')
+
+    def write(self, video_id, question_dict):
+        record = json.dumps({"video_id": video_id, "question_dict": question_dict}, separators=(',', ':')) + '\n'
+        record = record.encode()
+        if self.compress:
+            record = gzip.compress(record)
+        offset = self.data_file.tell()
+        self.data_file.write(record)
+        self.data_file.flush()
+        self.index_file.write(json.dumps({"video_id": video_id, "offset": offset, "length": len(record)}) + '\n')
+        self.index_file.flush()
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+
+class QuestionStore:
+    def __init__(self, root, compress=False):
+        self.root = root
+        self.compress = compress
+        self._writer = None
+
+    def _shards(self):
+        """ [(data_path, index_path)] sorted by name """
+        shards = []
+        for index_path in sorted(glob.glob(os.path.join(self.root, 'part-*.idx'))):
+            base = index_path[:-len('.idx')]
+            data_path = base + '.jsonl.gz' if os.path.exists(base + '.jsonl.gz') else base + '.jsonl'
+            shards.append((data_path, index_path))
+        return shards
+
+    def index(self):
+        """ video_id -> (data_path, offset, length), the last record of a video wins """
+        index = {}
+        for data_path, index_path in self._shards():
+            with open(index_path, 'r') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break # cut by a crash
+                    entry = json.loads(line)
+                    index[entry["video_id"]] = (data_path, entry["offset"], entry["length"])
+        return index
+
+    def done_video_ids(self):
+        return set(self.index().keys())
+
+    def clear(self):
+        for data_path, index_path in self._shards():
+            os.remove(index_path)
+            if os.path.exists(data_path):
+                os.remove(data_path)
+
+    def write(self, video_id, question_dict):
+        """ Append the questions of a video to the shard of the current process """
+        if self._writer is None:
+            self._writer = ShardWriter(self.root, self.compress)
+        self._writer.write(video_id, question_dict)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    @staticmethod
+    def _decode(record):
+        if record[:2] == b'\x1f\x8b':
+            record = gzip.decompress(record)
+        return json.loads(record)
+
+    def read_video(self, video_id, index=None):
+        """ Record of a video, `index` avoids reading the index files again when reading many videos """
+        index = index if index is not None else self.index()
+        data_path, offset, length = index[video_id]
+        with open(data_path, 'rb') as f:
+            f.seek(offset)
+            return self._decode(f.read(length))
+
+    def __iter__(self):
+        """ Yield the records of all the videos, one sequential pass per shard """
+        return self.records()
+
+    def records(self, video_ids=None):
+        """ Yield the records of all the videos, or of `video_ids` in that order
+
+        By default the shards are read one after the other in offset order, the order then
+        depends on which process wrote which video.
+        """
+        index = self.index()
+        if video_ids is None:
+            entries = sorted(index.values())
+        else:
+            entries = [index[video_id] for video_id in video_ids]
+        files = {}
+        try:
+            for data_path, offset, length in entries:
+                if data_path not in files:
+                    files[data_path] = open(data_path, 'rb')
+                f = files[data_path]
+                f.seek(offset)
+                yield self._decode(f.read(length))
+        finally:
+            for f in files.values():
+                f.close()
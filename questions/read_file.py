@@ -1,181 +1,231 @@
 import os
+import re
 import json
 import random
 import shutil
+import numpy as np
 from object import ObjectPulley
+from rope_graph import RopeGraph
 from itertools import combinations
+from collections import namedtuple
+from functools import lru_cache
 from math import ceil
 
+# top-level sections of outputs.json used by read_annotation_pulley
+ANNOTATION_KEYS = ("validity", "outputMass", "relatedGroups", "relatedGroupsInRope", "ResultTension", "CounterFactualAnnotations")
 
-def read_annotation_pulley(path, sim):
-    if os.path.isfile(path) and path.endswith(".json"):
+_WS = re.compile(r'[ \t\n\r]*')
+_GRID = re.compile(r'\((-?\d+) (-?\d+)\)')
+_DECODER = json.JSONDecoder()
+
+
+class _StructuralIndex:
+    """ Positions of all brackets outside of strings, with the nesting depth after each one.
+
+    Built with numpy over the raw bytes, so that a large subtree can be skipped
+    without decoding it. Only valid for ASCII files (byte offset == str offset).
+    """
+    def __init__(self, raw):
+        buf = np.frombuffer(raw, dtype=np.uint8)
+        quotes = np.flatnonzero(buf == ord('"'))
+        # drop escaped quotes, i.e. the ones preceded by an odd number of backslashes
+        escaped = quotes[(quotes > 0) & (buf[quotes - 1] == ord('\\'))]
+        if len(escaped):
+            drop = []
+            for q in escaped:
+                n, j = 0, q - 1
+                while j >= 0 and buf[j] == ord('\\'):
+                    n, j = n + 1, j - 1
+                if n % 2 == 1:
+                    drop.append(q)
+            quotes = np.setdiff1d(quotes, drop)
+
+        brackets = np.flatnonzero((buf == ord('{')) | (buf == ord('}')) | (buf == ord('[')) | (buf == ord(']')))
+        # a bracket is inside a string if an odd number of quotes precede it
+        brackets = brackets[(np.searchsorted(quotes, brackets) & 1) == 0]
+        is_open = (buf[brackets] == ord('{')) | (buf[brackets] == ord('['))
+        self.brackets = brackets
+        self.depth = np.cumsum(np.where(is_open, 1, -1), dtype=np.int32)
+
+    def skip(self, pos):
+        """ Return the position right after the container opened at `pos` """
+        i = np.searchsorted(self.brackets, pos)
+        d = self.depth[i]
+        j = i + 1 + np.argmax(self.depth[i+1:] < d)
+        return int(self.brackets[j]) + 1
+
+
+# an entity name of the annotations, e.g. "Blue Solid Static Pulley (0 1)", parsed by parse_entity_name
+#   key         name without the parenthesis, lower case: the name of the object in the sim
+#   lower       whole name, lower case: the names of the rope map
+#   kind        'fixed point', 'pulley', 'rope', 'load' (cube, sphere) or 'other'
+#   color, shape, fill ('Solid' / 'Hollow'), dynamics ('static' / 'dynamic'), grid ((x, y) of the pulleys)
+#   is_load, is_dynamic, is_rope   the substring tests of the loader ('ube' / 'phere', 'ynamic', 'ope')
+EntityName = namedtuple("EntityName", ["name", "key", "lower", "kind", "color", "shape", "fill", "dynamics", "grid", "is_load", "is_dynamic", "is_rope"])
+
+# distinct entity names: 12 colors x (2 loads + rope + fixed point + 4 pulleys x 8 x 8 grid cells) ~ 3.1k
+@lru_cache(maxsize=4096)
+def parse_entity_name(name):
+    """ Tokenize an entity name once, the records are shared by all the scenes of the process """
+    stripped = name.split('(')[0].strip()
+    tokens = stripped.split(' ')
+    is_load = 'ube' in name or 'phere' in name
+    fill = dynamics = grid = None
+    if "Fixed Point" in name:
+        kind, color, shape, dynamics = 'fixed point', ' '.join(tokens[:-2]), "Fixed Point", 'static'
+    elif "Dynamic Pulley" in name or "Static Pulley" in name:
+        kind, color, fill = 'pulley', ' '.join(tokens[:-3]), tokens[-3]
+        shape, dynamics = fill + " Pulley", 'dynamic' if "Dynamic Pulley" in name else 'static'
+        match = _GRID.search(name)
+        grid = (int(match.group(1)), int(match.group(2))) if match else None
+    elif tokens[-1] == "Rope":
+        kind, color, shape, dynamics = 'rope', ' '.join(tokens[:-1]), "Rope", 'dynamic'
+    else:
+        # loads are named "{color} {shape}"
+        tokens = name.split(' ')
+        kind, color, shape, dynamics = 'load' if is_load else 'other', ' '.join(tokens[:-1]), tokens[-1], 'dynamic'
+    return EntityName(name, stripped.lower(), name.lower().strip(), kind, color, shape, fill, dynamics, grid,
+                      is_load, 'ynamic' in name, 'ope' in name)
+
+def load_annotation_json(path, keys=ANNOTATION_KEYS, selective=True, raw=None):
+    """ Load the top-level sections `keys` of an outputs.json
+
+    With selective=False this is a plain json.load. Otherwise only the requested
+    sections are decoded, everything else (perFrameAnnotations, metaSamplingData, ...)
+    is skipped through a bracket index, and we return as soon as all keys are found
+    or "validity" is false. `raw` is the content of the file when it was already read.
+    """
+    if raw is None:
+        with open(path, "rb") as f:
+            raw = f.read()
+    if not selective or not raw.isascii():
+        data = json.loads(raw)
+        return data if not selective else {k: data[k] for k in keys if k in data}
+
+    text = raw.decode("ascii")
+    keys = set(keys)
+    data = {}
+    index = None
+
+    pos = _WS.match(text, 0).end()
+    if text[pos] != '{':
+        raise ValueError(f"{path}: expected a JSON object")
+    pos = _WS.match(text, pos + 1).end()
+    while text[pos] != '}':
+        key, pos = _DECODER.raw_decode(text, pos)
+        pos = _WS.match(text, pos).end()
+        if text[pos] != ':':
+            raise ValueError(f"{path}: expected ':' at {pos}")
+        pos = _WS.match(text, pos + 1).end()
+
+        if key in keys:
+            data[key], pos = _DECODER.raw_decode(text, pos)
+            if (key == "validity" and data[key] == False) or len(data) == len(keys):
+                return data
+        elif text[pos] in '{[':
+            if index is None:
+                index = _StructuralIndex(raw)
+            pos = index.skip(pos)
+        else:
+            _, pos = _DECODER.raw_decode(text, pos)
+
+        pos = _WS.match(text, pos).end()
+        if text[pos] == ',':
+            pos = _WS.match(text, pos + 1).end()
+    return data
+
+
+def read_annotation_pulley(path, sim, selective=True, raw=None):
+    if (raw is not None or os.path.isfile(path)) and path.endswith(".json"):
         # Read the JSON data from the file and append it to the list
-        with open(path, "r") as f:
-            data = json.load(f)
-            if data["validity"] == False:
-                return False
-            
-            mass_info = data["outputMass"]
+        data = load_annotation_json(path, selective=selective, raw=raw)
+        if data["validity"] == False:
+            return False
+        
+        mass_info = data["outputMass"]
  
-            # create the objects from the mass_info dictionary and add them to the sim
-            for name, mass in mass_info.items():
-                # extract the color and shape from the object name (assuming format "{color} {shape}")
-                n_split = name.split(' ')
-                shape = n_split[-1]
-                color = ""
-                for i in range(len(n_split)-2):
-                    color = color + n_split[i] + " "
-                color = color + n_split[len(n_split)-2]
-                # create a new object with the extracted properties and the given mass
-                # mass_real = round(float(mass),2)
-                mass_real = ceil(float(mass*100))/100
-                if len(str(mass_real)) > 3 and str(mass_real)[-1] != '0' and str(mass_real)[-1] != '5':
-                    breakpoint()
-                obj = ObjectPulley(color=color, mass=mass_real, shape=shape, dynamics='dynamic', class_type='object', motion='stationary', tension='null')
-                # if the object already exists in sim.objects, update its mass
-                for existing_obj in sim.objects:
-                    if existing_obj.color == obj.color and existing_obj.shape == obj.shape:
-                        existing_obj.mass = obj.mass
-                        obj = existing_obj
-                        break
-                # add the object to the sim
+        # create the objects from the mass_info dictionary and add them to the sim
+        for name, mass in mass_info.items():
+            # the color and shape of the object name (assuming format "{color} {shape}")
+            entity = parse_entity_name(name)
+            # create a new object with the extracted properties and the given mass
+            # mass_real = round(float(mass),2)
+            mass_real = ceil(float(mass*100))/100
+            if len(str(mass_real)) > 3 and str(mass_real)[-1] != '0' and str(mass_real)[-1] != '5':
+                breakpoint()
+            obj = ObjectPulley(color=entity.color, mass=mass_real, shape=entity.shape, dynamics='dynamic', class_type='object', motion='stationary', tension=None)
+            # if the object already exists in sim.objects, update its mass
+            for existing_obj in sim.objects_by_color.get(obj.color, []):
+                if existing_obj.shape == obj.shape:
+                    sim.set_mass(existing_obj, obj.mass)
+                    obj = existing_obj
+                    break
+            # add the object to the sim
 
-                sim.add_object(obj, name.split('(')[0].lower().strip())
-            
-            relation_info = data["relatedGroups"]
-            # add the relation information to the sim.relations
-            for group in relation_info:
-                group_set = set(group)
-                for obj1_n, obj2_n in combinations(group_set, 2):
-                    obj1_name, obj2_name = obj1_n.split('(')[0].strip().lower(), obj2_n.split('(')[0].strip().lower()
-                    if obj1_name in sim.name_object_map:
-                        obj1 = sim.name_object_map[obj1_name]
-                    else:
-                        continue
+            sim.add_object(obj, entity.key)
+        
+        relation_info = data["relatedGroups"]
+        # the rope topology, then the relations, dynamic pulley loads and rope map of the sim from it
+        graph = RopeGraph([[parse_entity_name(name) for name in group] for group in relation_info])
+        sim.rope_graph = graph
+        for members in graph.groups:
+            # only the loads are in the sim at this point
+            objs = [sim.name_object_map[name] for name in members if name in sim.name_object_map]
+            for obj1, obj2 in combinations(objs, 2):
+                sim.add_relation(obj1, obj2)
+        for node in graph.dynamic_load:
+            sim.link_dy_pulley.append(sim.name_object_map[graph.nodes[node]])
+        for node, rope in graph.node_rope.items():
+            sim.add_rope_map(graph.nodes[node], rope)
 
-                    if obj2_name in sim.name_object_map:
-                        obj2 = sim.name_object_map[obj2_name]
+        relation_rope_info = data["relatedGroupsInRope"]
+        tension_rope_info = data["ResultTension"]
+        # add the rope to the sim.objects
+        for group in relation_rope_info:
+            rope_objs = []
+            for rope_name in group.keys():
+                entity = parse_entity_name(rope_name)
+                tension = list(tension_rope_info[entity.color + " Rope"].values())[0]
+                obj = ObjectPulley(color=entity.color, mass=None, shape="Rope", dynamics='dynamic', class_type='rope', motion='stationary', tension=abs(tension))
+                # add the object to the sim
+                sim.add_object(obj, entity.key)
+                rope_objs.append(obj)
+            # add relations between ropes in the same group
+            for i in range(len(rope_objs)):
+                for j in range(i+1, len(rope_objs)):
+                    sim.add_relation(rope_objs[i], rope_objs[j])
+                    
+        # add the pulley, fixed point to the sim.objects
+        for group in relation_rope_info:
+            for obj_linked in group.values():
+                for obj_name in obj_linked:
+                    # ignore any content in parentheses when adding object information
+                    entity = parse_entity_name(obj_name)
+                    # create a new object with the extracted properties
+                    if entity.kind == 'fixed point':
+                        obj = ObjectPulley(color=entity.color, mass=None, shape="Fixed Point", dynamics='static', class_type='fixed point', motion='stationary', tension=None)
+                    elif entity.kind == 'pulley':
+                        obj = ObjectPulley(color=entity.color, mass=None, shape=entity.shape, dynamics=entity.dynamics, class_type='pulley', motion='stationary', tension=None)
                     else:
-                        continue
-
-                    sim.add_relation(obj1, obj2)
-
-                for i in range(len(group)):
-                    if 'ynamic' in group[i]:
-                        obj_name = None
-                        if i-2 >= 0:
-                            if 'ube' in group[i-2] or 'phere' in group[i-2]:
-                                obj_name = group[i-2].split('(')[0].strip().lower()
-                        if i+2 < len(group):
-                            if 'ube' in group[i+2] or 'phere' in group[i+2]:
-                                obj_name = group[i+2].split('(')[0].strip().lower()
-
-                        if obj_name is not None:
-                            obj = sim.name_object_map[obj_name]
-                            sim.link_dy_pulley.append(obj)
-                        else:
-                            continue
-
-                    if 'ube' in group[i] or 'phere' in group[i]:
-                        if i == 0:
-                            obj = group[i].lower().strip()
-                            rope = group[i+1].lower().strip()
-                            if 'rope' not in rope:
-                                # breakpoint()
-                                continue
-                            sim.add_rope_map(obj, rope)
-
-                        elif i == len(group)-1:
-                            obj = group[i].lower().strip()
-                            rope = group[i-1].lower().strip()
-                            if 'rope' not in rope:
-                                # breakpoint()
-                                continue
-                            sim.add_rope_map(obj, rope)
-
-                        else:
-                            obj = group[i].lower().strip()
-                            if 'ynamic' in group[i+2]:
-                                rope = group[i+1].lower().strip()
-                            elif 'ynamic' in group[i-2]:
-                                rope = group[i-1].lower().strip()
-                            else:
-                                if 'ope' in group[i-1]:
-                                    rope = group[i-1].lower().strip()
-                                elif 'ope' in group[i+1]:
-                                    rope = group[i+1].lower().strip()
-                                else:
-                                    breakpoint()
-                                    continue
-                            sim.add_rope_map(obj, rope)
-                        
-            relation_rope_info = data["relatedGroupsInRope"]
-            tension_rope_info = data["ResultTension"]
-            # add the rope to the sim.objects
-            for group in relation_rope_info:
-                rope_objs = []
-                g_list = list(group.keys())
-                for i in range(len(g_list)):
-                    rope_name = g_list[i].split('(')[0].strip()
-                    n_split = rope_name.split(' ')
-                    color = ""
-                    for j in range(len(n_split)-2):
-                        color = color + n_split[j] + " "
-                    color = color + n_split[len(n_split)-2]
-                    tension = list(tension_rope_info[color + " Rope"].values())[0]
-                    obj = ObjectPulley(color=color, mass="null", shape="Rope", dynamics='dynamic', class_type='rope', motion='stationary', tension=abs(tension))
+                        continue # the loads and ropes were added above
                     # add the object to the sim
-                    sim.add_object(obj, rope_name.lower())
-                    rope_objs.append(obj)
-                # add relations between ropes in the same group
-                for i in range(len(rope_objs)):
-                    for j in range(i+1, len(rope_objs)):
-                        sim.add_relation(rope_objs[i], rope_objs[j])
-                        
-            # add the pulley, fixed point to the sim.objects
-            for group in relation_rope_info:
-                for obj_linked in group.values():
-                    for obj_name in obj_linked:
-                        # ignore any content in parentheses when adding object information
-                        obj_color_shape = obj_name.split('(')[0].strip()
-                        n_split = obj_color_shape.split(' ')
-                        # create a new object with the extracted properties
-                        if "Fixed Point" in obj_name:
-                            color = ""
-                            for i in range(len(n_split)-3):
-                                color = color + n_split[i] + " "
-                            color = color + n_split[len(n_split)-3]
-                            obj = ObjectPulley(color=color, mass="null", shape="Fixed Point", dynamics='static', class_type='fixed point', motion='stationary', tension='null')
-                        elif "Dynamic Pulley" in obj_name:
-                            color = ""
-                            for i in range(len(n_split)-4):
-                                color = color + n_split[i] + " "
-                            color = color + n_split[len(n_split)-4]
-                            obj = ObjectPulley(color=color, mass="null", shape=n_split[-3] + " Pulley", dynamics='dynamic', class_type='pulley', motion='stationary', tension='null')
-                        elif "Static Pulley" in obj_name:
-                            color = ""
-                            for i in range(len(n_split)-4):
-                                color = color + n_split[i] + " "
-                            color = color + n_split[len(n_split)-4]
-                            obj = ObjectPulley(color=color, mass="null", shape=n_split[-3] + " Pulley", dynamics='static', class_type='pulley', motion='stationary', tension='null')
-                        # add the object to the sim
-                        sim.add_object(obj, obj_name.split('(')[0].lower().strip())
-                        
-            # read CounterFactualAnnotations
-            counterfactual_info = data["CounterFactualAnnotations"]
-
-            for item in counterfactual_info:
-                c_dict=counterfactual_info[item]
-                try:
-                    c_dict0=c_dict["0"]
-                    c_dict1=c_dict["1"]
-                    sim.counterfactual[item+"_0"]=c_dict0
-                    sim.counterfactual[item+"_1"]=c_dict1
-                except:
-                    print("Counterfactual not exists")
-                    continue
-                
-            group_info = data["relatedGroupsInRope"]
-            sim.rope_group=group_info
-            #print(sim.counterfactual)
-            return True
+                    sim.add_object(obj, entity.key)
+                    
+        # read CounterFactualAnnotations
+        counterfactual_info = data["CounterFactualAnnotations"]
+
+        for item in counterfactual_info:
+            c_dict=counterfactual_info[item]
+            try:
+                c_dict0=c_dict["0"]
+                c_dict1=c_dict["1"]
+                sim.counterfactual[item+"_0"]=c_dict0
+                sim.counterfactual[item+"_1"]=c_dict1
+            except:
+                print("Counterfactual not exists")
+                continue
+            
+        group_info = data["relatedGroupsInRope"]
+        sim.rope_group=group_info
+        #print(sim.counterfactual)
+        return True
@@ -0,0 +1,211 @@
+""" Columnar storage of outputs4D.json
+
+The nested lists of an outputs4D.json are converted once into float32 / int32 arrays,
+written back to back into a single binary file (outputs4D.bin) next to a small json
+index (outputs4D.index.json) holding the offset, shape and dtype of every array.
+Outputs4D memory-maps the binary file, so reading an object over a frame range is
+a zero-copy slice.
+
+Arrays per section:
+  rigidbodyCentroidStates    (frames, 2, 3)     position and euler rotation per frame
+  rigidbodyMeshVertices      (points, 3)        rest pose, not time dependent
+  rigidbodyVoxelPosition     (points, 3)        rest pose, not time dependent
+  rigidbodyMeshFaces         (indices,)         int32, not time dependent
+  softbodyTrackedParticles   (frames, points, 3)
+  softbodyMeshVertices       (frames, points, 3)
+  softbodyMeshFaces          (frames, indices)  int32
+Per frame arrays whose size changes over the frames (softbody meshes) are padded with
+NaN / -1 up to the largest frame, and get an extra "counts" array of shape (frames,).
+The index records the size and mtime of the outputs4D.json it was converted from, Outputs4D
+refuses a conversion older than its source (see is_converted).
+"""
+
+import os
+import json
+import glob
+import argparse
+import numpy as np
+from tqdm import tqdm
+from multiprocessing import Pool
+
+INDEX_VERSION = 2
+ALIGN = 64
+
+# section -> (dtype, shape of one point, one entry per frame)
+SECTIONS = {
+    "rigidbody4D": {
+        "rigidbodyCentroidStates": (np.float32, (3,), True),
+        "rigidbodyMeshVertices": (np.float32, (3,), False),
+        "rigidbodyVoxelPosition": (np.float32, (3,), False),
+        "rigidbodyMeshFaces": (np.int32, (), False),
+    },
+    "softbody4D": {
+        "softbodyTrackedParticles": (np.float32, (3,), True),
+        "softbodyMeshVertices": (np.float32, (3,), True),
+        "softbodyMeshFaces": (np.int32, (), True),
+    },
+}
+
+
+def _to_array(value, dtype, point_shape, per_frame):
+    """ Return (array, counts), counts is None unless the frames have different sizes """
+    if per_frame and len(value) > 0 and len(set(len(frame) for frame in value)) > 1:
+        counts = np.array([len(frame) for frame in value], dtype=np.int32)
+        pad = np.nan if np.issubdtype(dtype, np.floating) else -1
+        arr = np.full((len(value), counts.max()) + point_shape, pad, dtype=dtype)
+        for i, frame in enumerate(value):
+            if len(frame):
+                arr[i, :len(frame)] = frame
+        return arr, counts
+
+    arr = np.array(value, dtype=dtype)
+    if arr.size == 0:
+        # keep the trailing dims of empty entries, e.g. the centroid states of a fixed point
+        arr = arr.reshape(((0, 0) if per_frame else (0,)) + point_shape)
+    return arr, None
+
+def _source_stamp(json_path):
+    st = os.stat(json_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def is_converted(video_dir):
+    """ Whether the outputs4D.json of the video was converted since it last changed
+
+    A conversion whose outputs4D.json was deleted afterwards is still valid.
+    """
+    index_path = os.path.join(video_dir, "outputs4D.index.json")
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    if index.get("version") != INDEX_VERSION:
+        return False
+    json_path = os.path.join(video_dir, "outputs4D.json")
+    return not os.path.exists(json_path) or index.get("source") == _source_stamp(json_path)
+
+def convert_outputs4d(json_path, out_dir=None):
+    """ Convert an outputs4D.json into outputs4D.bin + outputs4D.index.json, return the index path """
+    out_dir = out_dir or os.path.dirname(json_path)
+    bin_path = os.path.join(out_dir, "outputs4D.bin")
+    index_path = os.path.join(out_dir, "outputs4D.index.json")
+    source = _source_stamp(json_path)
+    with open(json_path, "r") as f:
+        data = json.load(f)
+
+    index = {
+        "version": INDEX_VERSION,
+        "bin": os.path.basename(bin_path),
+        "source": source,
+        "num_frames": 0,
+        "rigidbodyStatesStaticity": data["rigidbody4D"].get("rigidbodyStatesStaticity", {}),
+        "arrays": {},
+    }
+
+    tmp_bin = f"{bin_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_bin, "wb") as f:
+            def _write(arr):
+                pad = -f.tell() % ALIGN
+                f.write(b"\0" * pad)
+                entry = {"offset": f.tell(), "shape": list(arr.shape), "dtype": arr.dtype.str}
+                f.write(np.ascontiguousarray(arr).tobytes())
+                return entry
+
+            for group, sections in SECTIONS.items():
+                for section, (dtype, point_shape, per_frame) in sections.items():
+                    entries = {}
+                    for name, value in data.get(group, {}).get(section, {}).items():
+                        arr, counts = _to_array(value, dtype, point_shape, per_frame)
+                        entries[name] = _write(arr)
+                        entries[name]["per_frame"] = per_frame
+                        if counts is not None:
+                            entries[name]["counts"] = _write(counts)
+                        if per_frame:
+                            index["num_frames"] = max(index["num_frames"], arr.shape[0])
+                    index["arrays"][section] = entries
+    except BaseException:
+        os.remove(tmp_bin)
+        raise
+    os.replace(tmp_bin, bin_path)
+
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    return index_path
+
+
+class Outputs4D:
+    """ Read-only, memory-mapped access to a converted outputs4D """
+    def __init__(self, path):
+        """ path: the outputs4D.index.json, or the video directory containing it
+
+        Raise ValueError if the conversion is older than the outputs4D.json next to it.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, "outputs4D.index.json")
+        if not is_converted(os.path.dirname(path)):
+            raise ValueError(f"{path} is out of date, convert the outputs4D.json again with read_file_4d.py")
+        with open(path, "r") as f:
+            self.index = json.load(f)
+        bin_path = os.path.join(os.path.dirname(path), self.index["bin"])
+        # np.memmap refuses empty files, e.g. a scene without frames
+        self.buffer = np.memmap(bin_path, dtype=np.uint8, mode="r") if os.path.getsize(bin_path) else np.zeros(0, dtype=np.uint8)
+        self.num_frames = self.index["num_frames"]
+        self.staticity = self.index["rigidbodyStatesStaticity"]
+
+    def _view(self, entry):
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape))
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=entry["offset"]).reshape(shape)
+
+    def sections(self):
+        return list(self.index["arrays"].keys())
+
+    def names(self, section):
+        return list(self.index["arrays"][section].keys())
+
+    def get(self, section, name, start=None, end=None):
+        """ Array of `name` in `section`; time dependent arrays are sliced to the frames [start, end) """
+        entry = self.index["arrays"][section][name]
+        arr = self._view(entry)
+        if entry["per_frame"]:
+            arr = arr[start:end]
+        return arr
+
+    def counts(self, section, name, start=None, end=None):
+        """ Number of valid points per frame of a padded array, None if the array is not padded """
+        entry = self.index["arrays"][section][name]
+        if "counts" not in entry:
+            return None
+        return self._view(entry["counts"])[start:end]
+
+    def centroid_states(self, name, start=None, end=None):
+        """ (frames, 2, 3): per frame position and euler rotation of a rigid body """
+        return self.get("rigidbodyCentroidStates", name, start, end)
+
+    def tracked_particles(self, name, start=None, end=None):
+        """ (frames, points, 3): tracked particles of a rope """
+        return self.get("softbodyTrackedParticles", name, start, end)
+
+
+def _convert_worker(json_path):
+    convert_outputs4d(json_path)
+    return json_path
+
+def build_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_video_ann_path", type=str, default="data/pulley_group", help="")
+    parser.add_argument("--num_workers", type=int, default=8, help="Number of worker processes")
+    parser.add_argument('--restart', action='store_true', help='Convert again the videos that are already converted')
+    args = parser.parse_args()
+    return args
+
+if __name__=="__main__":
+    args = build_args_parser()
+    print(args)
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs4D.json')))
+    if not args.restart:
+        all_jsons = [p for p in all_jsons if not is_converted(os.path.dirname(p))]
+    with Pool(args.num_workers) as p:
+        list(tqdm(p.imap_unordered(_convert_worker, all_jsons), total=len(all_jsons)))
@@ -0,0 +1,202 @@
+""" Columnar storage of the 2D bounding boxes of outputs.json
+
+imgAnnotationDescriptions.perFrameAnnotations holds, for every frame, the captures of the
+camera with their BoundingBox2DAnnotation lists. They are flattened once into one row per
+box, written back to back into a single binary file (boxes2D.bin) next to a small json index
+(boxes2D.index.json) holding the offset, shape and dtype of every array, like read_file_4d.
+
+Arrays, one entry per box, sorted by (frame, instance):
+  frame        int32     frame number, as in the keys of perFrameAnnotations
+  instance     int32     instanceId, the key of Id2ObjectNameDict
+  label        int32     labelId, the names are in the "labels" of the index
+  x, y, w, h   float32   origin and dimension of the box, in pixels
+  by_instance  int32     the rows sorted by (instance, frame)
+Boxes2D memory-maps the binary file, the boxes of a frame are found by a binary search on
+`frame` and the boxes of an object over a frame range by two on `by_instance`.
+"""
+
+import os
+import json
+import glob
+import argparse
+import numpy as np
+from tqdm import tqdm
+from multiprocessing import Pool
+
+from manifest import content_hash
+from read_file import load_annotation_json, parse_entity_name
+
+INDEX_VERSION = 1
+ALIGN = 64
+BOX_ANNOTATION = "type.unity.com/unity.solo.BoundingBox2DAnnotation"
+COLUMNS = {"frame": np.int32, "instance": np.int32, "label": np.int32,
+           "x": np.float32, "y": np.float32, "w": np.float32, "h": np.float32}
+
+
+def _flatten(per_frame):
+    """ Columns of all the boxes of perFrameAnnotations, and labelId -> labelName """
+    rows, labels = [], {}
+    for frame, captures in per_frame.items():
+        frame = int(frame)
+        for capture in captures:
+            for annotation in capture.get("annotations", []):
+                if annotation.get("@type") != BOX_ANNOTATION:
+                    continue
+                for box in annotation["values"]:
+                    labels[str(box["labelId"])] = box["labelName"]
+                    rows.append((frame, box["instanceId"], box["labelId"]) + tuple(box["origin"]) + tuple(box["dimension"]))
+    columns = {}
+    for i, (name, dtype) in enumerate(COLUMNS.items()):
+        columns[name] = np.array([row[i] for row in rows], dtype=dtype)
+    order = np.lexsort((columns["instance"], columns["frame"]))
+    columns = {name: column[order] for name, column in columns.items()}
+    # stable, so the rows of an instance stay sorted by frame
+    columns["by_instance"] = np.argsort(columns["instance"], kind="stable").astype(np.int32)
+    return columns, labels
+
+def convert_boxes(json_path, out_dir=None, raw=None):
+    """ Convert the boxes of an outputs.json into boxes2D.bin + boxes2D.index.json, return the index path
+
+    `raw` is the content of the outputs.json when it was already read.
+    """
+    out_dir = out_dir or os.path.dirname(json_path)
+    bin_path = os.path.join(out_dir, "boxes2D.bin")
+    index_path = os.path.join(out_dir, "boxes2D.index.json")
+    if raw is None:
+        with open(json_path, "rb") as f:
+            raw = f.read()
+    data = load_annotation_json(json_path, keys=("imgAnnotationDescriptions",), raw=raw)
+    descriptions = data.get("imgAnnotationDescriptions") or {}
+    columns, labels = _flatten(descriptions.get("perFrameAnnotations", {}))
+
+    index = {
+        "version": INDEX_VERSION,
+        "bin": os.path.basename(bin_path),
+        "source": content_hash(raw),
+        "num_boxes": len(columns["frame"]),
+        "objects": descriptions.get("Id2ObjectNameDict", {}),
+        "labels": labels,
+        "arrays": {},
+    }
+    tmp_bin = f"{bin_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_bin, "wb") as f:
+            for name, arr in columns.items():
+                f.write(b"\0" * (-f.tell() % ALIGN))
+                index["arrays"][name] = {"offset": f.tell(), "shape": list(arr.shape), "dtype": arr.dtype.str}
+                f.write(np.ascontiguousarray(arr).tobytes())
+    except BaseException:
+        os.remove(tmp_bin)
+        raise
+    os.replace(tmp_bin, bin_path)
+
+    tmp_index = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_index, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_index, index_path)
+    return index_path
+
+def is_converted(json_path, raw=None):
+    """ Whether the boxes of the outputs.json were converted from its current content """
+    index_path = os.path.join(os.path.dirname(json_path), "boxes2D.index.json")
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    if index.get("version") != INDEX_VERSION:
+        return False
+    if raw is None:
+        with open(json_path, "rb") as f:
+            raw = f.read()
+    return index.get("source") == content_hash(raw)
+
+
+class Boxes2D:
+    """ Read-only, memory-mapped access to the converted boxes of a video """
+    def __init__(self, path):
+        """ path: the boxes2D.index.json, or the video directory containing it """
+        if os.path.isdir(path):
+            path = os.path.join(path, "boxes2D.index.json")
+        with open(path, "r") as f:
+            self.index = json.load(f)
+        bin_path = os.path.join(os.path.dirname(path), self.index["bin"])
+        self.buffer = np.memmap(bin_path, dtype=np.uint8, mode="r") if self.index["num_boxes"] else np.zeros(0, dtype=np.uint8)
+        self.objects = {int(i): name for i, name in self.index["objects"].items()}
+        self.labels = {int(i): name for i, name in self.index["labels"].items()}
+        # object name, as in the annotations or as in the sim -> instance ids
+        self.name_instances = {}
+        for i, name in sorted(self.objects.items()):
+            for alias in {name, parse_entity_name(name).key}:
+                self.name_instances.setdefault(alias, []).append(i)
+        self.columns = {name: self._view(entry) for name, entry in self.index["arrays"].items()}
+        self.frame = self.columns["frame"]
+        self.instance = self.columns["instance"]
+        self.by_instance = self.columns["by_instance"]
+        self.instance_sorted = self.instance[self.by_instance]
+
+    def _view(self, entry):
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape))
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=entry["offset"]).reshape(shape)
+
+    def __len__(self):
+        return self.index["num_boxes"]
+
+    def rows(self, rows):
+        """ Columns frame, instance, label, x, y, w, h of the given rows (indices or slice) """
+        return {name: self.columns[name][rows] for name in COLUMNS}
+
+    def frame_rows(self, frame):
+        """ Slice of the rows of a frame """
+        return slice(int(np.searchsorted(self.frame, frame, side="left")), int(np.searchsorted(self.frame, frame, side="right")))
+
+    def visible(self, frame):
+        """ Instance ids of the objects with a box at the frame """
+        return self.instance[self.frame_rows(frame)]
+
+    def visible_objects(self, frame):
+        """ Names of the objects with a box at the frame, in instance order """
+        return [self.objects.get(int(i)) for i in self.visible(frame)]
+
+    def instance_rows(self, instance, start=None, end=None):
+        """ Rows of an instance for the frames [start, end), in frame order """
+        lo = np.searchsorted(self.instance_sorted, instance, side="left")
+        hi = np.searchsorted(self.instance_sorted, instance, side="right")
+        rows = self.by_instance[lo:hi]
+        frames = self.frame[rows]
+        first = 0 if start is None else np.searchsorted(frames, start, side="left")
+        last = len(rows) if end is None else np.searchsorted(frames, end, side="left")
+        return rows[first:last]
+
+    def boxes_of(self, name, start=None, end=None):
+        """ Boxes of an object (annotation or sim name) for the frames [start, end), see rows
+
+        An object with several instances, e.g. a rope, gets the boxes of all of them, by instance then frame.
+        """
+        instances = self.name_instances.get(name, [])
+        rows = np.concatenate([self.instance_rows(i, start, end) for i in instances]) if instances else np.zeros(0, dtype=np.int32)
+        return self.rows(rows)
+
+
+def _convert_worker(json_path):
+    convert_boxes(json_path)
+    return json_path
+
+def build_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_video_ann_path", type=str, default="data/pulley_group", help="")
+    parser.add_argument("--num_workers", type=int, default=8, help="Number of worker processes")
+    parser.add_argument('--restart', action='store_true', help='Convert again the videos that are already converted')
+    args = parser.parse_args()
+    return args
+
+if __name__=="__main__":
+    args = build_args_parser()
+    print(args)
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs.json')))
+    if not args.restart:
+        all_jsons = [p for p in all_jsons if not is_converted(p)]
+    with Pool(args.num_workers) as p:
+        list(tqdm(p.imap_unordered(_convert_worker, all_jsons), total=len(all_jsons)))
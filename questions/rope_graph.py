@@ -0,0 +1,153 @@
+""" Rope topology of a pulley scene
+
+Every relatedGroups entry is a chain  end, rope, pulley, rope, ..., rope, end, given to the
+graph as read_file.parse_entity_name records. The graph has a node per load, pulley and fixed
+point (by sim name, the `key` of the records) and an
+edge per rope segment between two consecutive nodes of a chain, labelled with its rope:
+  nodes, index         node names and name -> node id
+  edges, edge_rope     (E, 2) node ids and the rope name of every segment
+  indptr, indices      CSR adjacency, the neighbors of node i are indices[indptr[i]:indptr[i+1]]
+  membership           (nodes, groups) bool, the relatedGroups a node appears in
+  component            connected component of every node, through the rope segments
+  dynamic_load         the loads hanging from a dynamic pulley
+  node_rope            node id -> name of the rope a load hangs on
+Two loads are in the same rope group if they appear in a same relatedGroups entry, which is
+what the relations of the simulation were built from; components can be larger than the groups
+when the chains share a node.
+"""
+
+import numpy as np
+
+
+class RopeGraph:
+    def __init__(self, related_groups=()):
+        """ related_groups: the relatedGroups chains, as lists of EntityName records """
+        self.nodes = []
+        self.index = {}
+        edges, edge_rope = [], []
+        group_nodes = []
+        self.group_mask = [] # python int bitmask of the groups of every node, for the O(1) pair query
+        self.dynamic_load = {} # node id -> None, a dict is used as an insertion ordered set
+        self.node_rope = {}
+
+        for g, entities in enumerate(related_groups):
+            members = []
+            prev, rope = None, None
+            for entity in entities:
+                if entity.kind == 'rope':
+                    rope = entity.lower
+                    continue
+                node = self._add_node(entity.key)
+                members.append(node)
+                self.group_mask[node] |= 1 << g
+                if prev is not None:
+                    edges.append((prev, node))
+                    edge_rope.append(rope)
+                prev, rope = node, None
+            group_nodes.append(members)
+            self._link_loads(entities)
+
+        n = len(self.nodes)
+        self.edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+        self.edge_rope = edge_rope
+        self.membership = np.zeros((n, len(group_nodes)), dtype=bool)
+        for g, members in enumerate(group_nodes):
+            self.membership[members, g] = True
+
+        # CSR adjacency, both directions of every edge
+        src = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        dst = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self.component = self._components()
+
+    def _add_node(self, name):
+        if name not in self.index:
+            self.index[name] = len(self.nodes)
+            self.nodes.append(name)
+            self.group_mask.append(0)
+        return self.index[name]
+
+    def _link_loads(self, entities):
+        """ The dynamic pulley loads and the rope of every load of a chain
+
+        A load two positions away from a dynamic pulley hangs from it (the one after the pulley
+        if both are loads). An end load hangs on the rope next to it, a load in the middle of a
+        chain on the rope towards the dynamic pulley, or else the rope before it, or after it.
+        """
+        last = len(entities) - 1
+        for i, entity in enumerate(entities):
+            if entity.is_dynamic:
+                load = None
+                if i-2 >= 0 and entities[i-2].is_load:
+                    load = entities[i-2].key
+                if i+2 <= last and entities[i+2].is_load:
+                    load = entities[i+2].key
+                if load is None:
+                    continue
+                self.dynamic_load[self.index[load]] = None
+
+            if not entity.is_load:
+                continue
+            if i == 0 or i == last:
+                rope = entities[1 if i == 0 else i-1].lower if last > 0 else ''
+                if 'rope' not in rope:
+                    continue
+            elif i+2 <= last and entities[i+2].is_dynamic:
+                rope = entities[i+1].lower
+            elif i-2 >= 0 and entities[i-2].is_dynamic:
+                rope = entities[i-1].lower
+            elif entities[i-1].is_rope:
+                rope = entities[i-1].lower
+            elif entities[i+1].is_rope:
+                rope = entities[i+1].lower
+            else:
+                continue # should not happen
+            self.node_rope[self.index[entity.key]] = rope
+
+    def _components(self):
+        """ Connected component id of every node, numbered in order of their first node """
+        n = len(self.nodes)
+        component = np.full(n, -1, dtype=np.int32)
+        count = 0
+        for start in range(n):
+            if component[start] >= 0:
+                continue
+            component[start] = count
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                for other in self.indices[self.indptr[node]:self.indptr[node + 1]].tolist():
+                    if component[other] < 0:
+                        component[other] = count
+                        stack.append(other)
+            count += 1
+        return component
+
+    @property
+    def groups(self):
+        """ Node names of every relatedGroups entry, in order of appearance """
+        return [[self.nodes[i] for i in np.flatnonzero(column)] for column in self.membership.T]
+
+    def neighbors(self, name):
+        i = self.index[name]
+        return [self.nodes[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]].tolist()]
+
+    def same_group(self, name1, name2):
+        """ Whether the two nodes appear in a same relatedGroups entry """
+        i, j = self.index.get(name1), self.index.get(name2)
+        return i is not None and j is not None and self.group_mask[i] & self.group_mask[j] != 0
+
+    def connected(self, name1, name2):
+        """ Whether the two nodes are linked through rope segments, possibly across groups """
+        i, j = self.index.get(name1), self.index.get(name2)
+        return i is not None and j is not None and self.component[i] == self.component[j]
+
+    def on_dynamic_pulley(self, name):
+        return self.index.get(name) in self.dynamic_load
+
+    def rope_of(self, name):
+        """ Name of the rope the load hangs on, None if unknown """
+        return self.node_rope.get(self.index.get(name))
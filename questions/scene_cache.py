@@ -0,0 +1,48 @@
+import os
+import pickle
+import hashlib
+
+from object import SimulationPulley
+from read_file import read_annotation_pulley
+
+# bump when SimulationPulley / ObjectPulley or the reader change, old entries are then ignored
+CACHE_VERSION = 6
+
+
+def _source_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+def _cache_file(path, cache_dir):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(cache_dir, digest + '.pkl')
+
+def load_scene_pulley(path, cache_dir):
+    """ Return (sim, valid) for an outputs.json, going through the scene cache
+
+    The cache holds the fully built SimulationPulley (objects, relations, rope map,
+    link_dy_pulley, rope graph, counterfactuals, rope groups) pickled per source file. An entry
+    is only used if the source path, mtime and size still match, otherwise the scene
+    is parsed again and the entry rewritten.
+    """
+    key = _source_key(path)
+    cache_path = _cache_file(path, cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                version, cached_key, valid, sim = pickle.load(f)
+            if version == CACHE_VERSION and cached_key == key:
+                return sim, valid
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            pass # corrupted or stale entry, rebuild it
+
+    sim = SimulationPulley()
+    valid = bool(read_annotation_pulley(path, sim))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a private file first so concurrent workers never read a partial entry
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((CACHE_VERSION, key, valid, sim), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return sim, valid
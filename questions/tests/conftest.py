@@ -0,0 +1,54 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+QUESTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, QUESTIONS_DIR)
+sys.path.insert(0, os.path.join(QUESTIONS_DIR, 'tools'))
+
+SAMPLE_DIR = os.path.join(QUESTIONS_DIR, 'data', 'pulley_group')
+SAMPLE_JSON = os.path.join(SAMPLE_DIR, '0', 'outputs.json')
+
+
+@pytest.fixture
+def sample_json():
+    return SAMPLE_JSON
+
+@pytest.fixture
+def sample_video(tmp_path):
+    """ A copy of the shipped sample video directory, for the tests that write sidecars next to it """
+    video_dir = tmp_path / 'videos' / '0'
+    video_dir.mkdir(parents=True)
+    for fn in ['outputs.json', 'outputs4D.json']:
+        shutil.copy(os.path.join(SAMPLE_DIR, '0', fn), video_dir / fn)
+    return video_dir
+
+@pytest.fixture
+def sample_videos(tmp_path):
+    """ Input directory with the sample outputs.json as videos 0, 1 and 2 """
+    input_dir = tmp_path / 'pulley_group'
+    for video_id in ['0', '1', '2']:
+        (input_dir / video_id).mkdir(parents=True)
+        shutil.copy(SAMPLE_JSON, input_dir / video_id / 'outputs.json')
+    return input_dir
+
+@pytest.fixture
+def make_args(monkeypatch):
+    """ make_args(*argv): the args of agent_pulley_dev.py for a command line """
+    def make(*argv):
+        from agent_pulley_dev import build_args_parser
+        monkeypatch.setattr(sys, 'argv', ['agent_pulley_dev.py'] + [str(a) for a in argv])
+        return build_args_parser()
+    return make
+
+def read_outputs(output_dir):
+    """ video_id -> question_dict of the json files written by the agent """
+    import json
+    outputs = {}
+    for fn in sorted(os.listdir(output_dir)):
+        if fn.endswith('.json'):
+            with open(os.path.join(output_dir, fn)) as f:
+                outputs[fn[:-len('.json')]] = json.load(f)["question_dict"]
+    return outputs
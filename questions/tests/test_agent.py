@@ -0,0 +1,36 @@
+from conftest import read_outputs
+from agent_pulley_dev import AgentPulley
+
+
+def _generate(make_args, input_dir, output_dir, *argv):
+    args = make_args('--input_video_ann_path', input_dir, '--output_ques_ann_path', output_dir, '--restart', *argv)
+    agent = AgentPulley(args)
+    if args.multithread:
+        agent.generate_all_multithread()
+    else:
+        agent.generate_all()
+    return read_outputs(output_dir / 'pulley')
+
+def test_pool_matches_serial(make_args, sample_videos, tmp_path):
+    # the pool workers build their own agent, they must generate the same questions as one agent in process
+    serial = _generate(make_args, sample_videos, tmp_path / 'serial', '--seed', 7, '--multithread', '') # bool('') is False
+    pool = _generate(make_args, sample_videos, tmp_path / 'pool', '--seed', 7, '--num_workers', 2, '--chunksize', 1)
+    assert set(serial) == {'0', '1', '2'}
+    assert pool == serial
+
+def test_seed_is_reproducible(make_args, sample_videos, tmp_path):
+    first = _generate(make_args, sample_videos, tmp_path / 'first', '--seed', 7, '--multithread', '')
+    second = _generate(make_args, sample_videos, tmp_path / 'second', '--seed', 7, '--multithread', '')
+    other = _generate(make_args, sample_videos, tmp_path / 'other', '--seed', 8, '--multithread', '')
+    assert first == second
+    assert other != first
+    # the generator depends on the video id, not on the order the videos are processed in
+    assert first['0'] != first['1']
+
+def test_family_generator_is_independent(make_args, sample_videos, tmp_path):
+    # a family generated alone gets the same questions as in a full run
+    full = _generate(make_args, sample_videos, tmp_path / 'full', '--seed', 7, '--multithread', '')
+    for key in list(full['0'])[-2:]:
+        alone = _generate(make_args, sample_videos, tmp_path / key, '--seed', 7, '--multithread', '', '--key', key)
+        assert {video_id: questions[key] for video_id, questions in alone.items()} == \
+               {video_id: questions[key] for video_id, questions in full.items()}
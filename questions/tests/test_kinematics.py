@@ -0,0 +1,89 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from agent_pulley_dev import AgentPulley
+from kinematics import ONSET_DISPLACEMENT, compute_kinematics
+from read_file import parse_entity_name
+from read_file_4d import convert_outputs4d
+
+
+def _states(positions, angles):
+    """ (1, frames, 2, 3) centroid states from per frame positions (frames, 3) and euler z angles (frames,) """
+    states = np.zeros((1, len(angles), 2, 3))
+    states[0, :, 0] = positions
+    states[0, :, 1, 2] = angles
+    return states
+
+def test_rotation_across_360():
+    frames = 12
+    still = np.zeros((frames, 3))
+    increasing = (350 + 5 * np.arange(frames)) % 360 # 350, 355, 0, 5, ...
+    decreasing = (10 - 5 * np.arange(frames)) % 360 # 10, 5, 0, 355, ...
+    kin = compute_kinematics(np.concatenate([_states(still, increasing), _states(still, decreasing)]))
+    np.testing.assert_allclose(kin["rotation_angle"], [55, -55])
+    np.testing.assert_allclose(np.diff(kin["rotation"][:, :, 2], axis=1), [[5] * (frames - 1), [-5] * (frames - 1)])
+    # the euler z angle decreasing is clockwise
+    assert kin["rotation_direction"].tolist() == [-1, 1]
+    assert kin["motion_direction"].tolist() == [0, 0]
+
+def test_motion_onset():
+    frames = 20
+    still = np.zeros((frames, 3))
+    jitter = np.zeros((frames, 3))
+    jitter[::2, 0] = ONSET_DISPLACEMENT / 2
+    falling = np.zeros((frames, 3))
+    falling[7:, 1] = -0.15 * np.arange(1, frames - 6) # leaves its pose by more than ONSET_DISPLACEMENT at frame 7
+    rising_turning = np.zeros((frames, 3))
+    angles = np.zeros(frames)
+    angles[12:] = 2.0 # turns first
+    rising_turning[15:, 1] = 1.0
+    kin = compute_kinematics(np.concatenate([_states(still, np.zeros(frames)), _states(jitter, np.zeros(frames)),
+                                             _states(falling, np.zeros(frames)), _states(rising_turning, angles)]))
+    assert kin["motion_onset"].tolist() == [-1, -1, 7, 12]
+    assert kin["motion_direction"].tolist() == [0, 0, -1, 1]
+    np.testing.assert_allclose(kin["velocity"][2, 7:, 1], -0.15)
+    np.testing.assert_allclose(kin["displacement"][3], [0, 1, 0])
+
+def _read(make_args, video_dir):
+    args = make_args('--input_video_ann_path', video_dir.parent, '--kinematics')
+    agent = AgentPulley(args)
+    agent.set_video(video_dir.name)
+    assert agent.read_json(str(video_dir / 'outputs.json'))
+    return agent.simulation
+
+def test_sample_labels(make_args, sample_video):
+    convert_outputs4d(str(sample_video / 'outputs4D.json'))
+    sim = _read(make_args, sample_video)
+    with open(sample_video / 'outputs.json') as f:
+        data = json.load(f)
+
+    checked = 0
+    for result, field in [("ResultMotion", "motion_direction"), ("ResultRotation", "rotation_direction")]:
+        for name, label in data[result].items():
+            entity = parse_entity_name(name)
+            if not (entity.is_load or entity.kind == 'pulley'):
+                continue
+            obj = sim.name_object_map[entity.key]
+            assert getattr(obj, field) == label, (name, field)
+            checked += 1
+    assert checked == 11 # 3 loads and 4 pulleys, 4 pulleys
+    # the loads that move started moving
+    for obj in sim.objects:
+        if obj.motion_direction:
+            assert obj.motion_onset >= 0
+
+def test_stale_conversion_has_no_kinematics(make_args, sample_video, capsys):
+    convert_outputs4d(str(sample_video / 'outputs4D.json'))
+    st = os.stat(sample_video / 'outputs4D.json')
+    os.utime(sample_video / 'outputs4D.json', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    sim = _read(make_args, sample_video)
+    assert "changed since its conversion" in capsys.readouterr().out
+    assert all(obj.motion_direction is None for obj in sim.objects)
+
+def test_no_conversion_has_no_kinematics(make_args, sample_video, capsys):
+    sim = _read(make_args, sample_video)
+    assert capsys.readouterr().out == ""
+    assert all(obj.rotation_direction is None for obj in sim.objects)
@@ -0,0 +1,89 @@
+import os
+import json
+
+import pytest
+
+from agent_pulley_dev import AgentPulley
+from conftest import read_outputs
+from manifest import Manifest
+
+
+def _run(make_args, input_dir, output_dir, *argv):
+    """ Serial run without --restart, return video_id -> status """
+    timing_path = output_dir.parent / f'{output_dir.name}_timings.json'
+    args = make_args('--input_video_ann_path', input_dir, '--output_ques_ann_path', output_dir, '--seed', 7,
+                     '--multithread', '', '--timing_path', timing_path, *argv)
+    AgentPulley(args).generate_all()
+    with open(timing_path) as f:
+        return {video_id: timing["status"] for video_id, timing in json.load(f).items()}
+
+def test_plan(tmp_path):
+    manifest = Manifest(tmp_path / 'manifest.json')
+    families = {"mass": "a", "color": "b"}
+    assert manifest.plan('0', 'x', families) == ["mass", "color"]
+    manifest.update('0', {"input": 'x', "families": families})
+    manifest.update('1', {"input": 'y', "invalid": True, "families": {}})
+    assert manifest.plan('0', 'x', families) == []
+    assert manifest.plan('0', 'x', {"mass": "a", "color": "c"}) == ["color"]
+    assert manifest.plan('0', 'z', families) == ["mass", "color"]
+    assert manifest.is_invalid('1', 'y') and not manifest.is_invalid('1', 'z')
+
+    manifest.checkpoint(every=3)
+    assert not os.path.exists(tmp_path / 'manifest.json')
+    manifest.update('2', {"input": 'w', "families": families})
+    manifest.checkpoint(every=3)
+    assert Manifest(tmp_path / 'manifest.json').entries == manifest.entries
+    assert manifest.pending == 0
+
+def test_resume(make_args, sample_videos, tmp_path):
+    output_dir = tmp_path / 'output'
+    assert _run(make_args, sample_videos, output_dir) == {'0': 'generated', '1': 'generated', '2': 'generated'}
+    # the manifest is not among the question files
+    assert sorted(os.listdir(output_dir)) == ['manifest_pulley.json', 'pulley']
+    questions = read_outputs(output_dir / 'pulley')
+    assert sorted(questions) == ['0', '1', '2']
+
+    assert _run(make_args, sample_videos, output_dir) == {'0': 'skipped', '1': 'skipped', '2': 'skipped'}
+
+    # an outputs.json rewritten with other bytes is generated again, the others are skipped
+    json_path = sample_videos / '1' / 'outputs.json'
+    with open(json_path) as f:
+        data = json.load(f)
+    with open(json_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    assert _run(make_args, sample_videos, output_dir) == {'0': 'skipped', '1': 'generated', '2': 'skipped'}
+    assert read_outputs(output_dir / 'pulley') == questions
+
+def test_questions_without_manifest_are_kept(make_args, sample_videos, tmp_path):
+    output_dir = tmp_path / 'output'
+    _run(make_args, sample_videos, output_dir)
+    os.remove(output_dir / 'manifest_pulley.json')
+    os.remove(output_dir / 'pulley' / '2.json')
+    assert _run(make_args, sample_videos, output_dir) == {'0': 'skipped', '1': 'skipped', '2': 'generated'}
+    assert sorted(Manifest(output_dir / 'manifest_pulley.json').entries) == ['2']
+
+def test_interrupted_run_saves_the_manifest(make_args, sample_videos, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    generate_video = AgentPulley.generate_video
+    def interrupted(self, json_path, *args, **kwargs):
+        if json_path.split('/')[-2] == '2':
+            raise KeyboardInterrupt
+        return generate_video(self, json_path, *args, **kwargs)
+    monkeypatch.setattr(AgentPulley, 'generate_video', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _run(make_args, sample_videos, output_dir)
+    assert sorted(Manifest(output_dir / 'manifest_pulley.json').entries) == ['0', '1']
+
+    monkeypatch.setattr(AgentPulley, 'generate_video', generate_video)
+    assert _run(make_args, sample_videos, output_dir) == {'0': 'skipped', '1': 'skipped', '2': 'generated'}
+
+def test_checkpoint_during_the_run(make_args, sample_videos, tmp_path, monkeypatch):
+    saved = []
+    save = Manifest.save
+    def record(self):
+        saved.append(sorted(self.entries))
+        save(self)
+    monkeypatch.setattr(Manifest, 'save', record)
+    monkeypatch.setattr(Manifest.checkpoint, '__defaults__', (2,)) # SAVE_EVERY
+    _run(make_args, sample_videos, tmp_path / 'output')
+    assert saved == [['0', '1'], ['0', '1', '2']]
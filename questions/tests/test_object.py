@@ -0,0 +1,80 @@
+import pickle
+
+from object import ObjectPulley, SimulationPulley
+from read_file import read_annotation_pulley
+
+
+def _is_duplicate_linear(objects, obj):
+    """ The linear scan of add_object before the indexes """
+    return any(o.color == obj.color and o.mass == obj.mass and o.shape == obj.shape and o.dynamics == obj.dynamics
+               and o.class_type == obj.class_type and o.motion == obj.motion and o.tension == obj.tension for o in objects)
+
+def _load(color, shape, mass):
+    return ObjectPulley(color=color, mass=mass, shape=shape, dynamics='dynamic', class_type='object', motion='stationary', tension=None)
+
+def _check_indexes(sim):
+    assert sim.object_set == set(sim.objects)
+    assert sim.object_keys == {sim.object_key(o): o for o in sim.objects}
+    for color, objs in sim.objects_by_color.items():
+        assert objs == [o for o in sim.objects if o.color == color]
+    for class_type, objs in sim.objects_by_class.items():
+        assert objs == [o for o in sim.objects if o.class_type == class_type]
+
+
+def test_indexes_of_sample(sample_json):
+    sim = SimulationPulley()
+    assert read_annotation_pulley(sample_json, sim)
+    _check_indexes(sim)
+    for obj in sim.objects:
+        assert sim.name_object_map[obj.name] is obj
+    # survives the scene cache
+    _check_indexes(pickle.loads(pickle.dumps(sim)))
+
+def test_dedup_matches_linear_scan():
+    sim = SimulationPulley()
+    candidates = [_load('Red', 'Cube', 0.1), _load('Red', 'Cube', 0.1), _load('Red', 'Cube', 0.2), _load('Blue', 'Cube', 0.1),
+                  _load('Red', 'Sphere', 0.1), _load('Red', 'Cube', "null")]
+    for i, obj in enumerate(candidates):
+        expected = not _is_duplicate_linear(sim.objects, obj)
+        assert sim.add_object(obj, f'object {i}') == expected
+    assert len(sim.objects) == 5
+    # an object of the sim is a duplicate of itself
+    assert not sim.add_object(sim.objects[0], 'again')
+    _check_indexes(sim)
+
+def test_set_mass_rekeys():
+    sim = SimulationPulley()
+    obj = _load('Red', 'Cube', 0.1)
+    sim.add_object(obj, 'red cube')
+    sim.set_mass(obj, 0.3)
+    _check_indexes(sim)
+    # the old mass is free again, the new one is taken
+    assert sim.add_object(_load('Red', 'Cube', 0.1), 'red cube 2')
+    assert not sim.add_object(_load('Red', 'Cube', 0.3), 'red cube 3')
+    _check_indexes(sim)
+
+def test_relations():
+    sim = SimulationPulley()
+    a, b, c = _load('Red', 'Cube', 0.1), _load('Blue', 'Cube', 0.1), _load('Green', 'Cube', 0.1)
+    sim.add_object(a, 'red cube')
+    sim.add_object(b, 'blue cube')
+    assert not sim.add_relation(a, c) # not in the sim
+    assert sim.add_relation(a, b)
+    assert sim.add_relation(a, b)
+    assert sim.check_relation(a, b) and sim.check_relation(b, a)
+    assert list(sim.relations[a]) == [b]
+    assert sim.remove_relation(b, a)
+    assert not sim.check_relation(a, b)
+    assert not sim.remove_relation(a, b)
+
+def test_reader_keeps_indexes_when_a_mass_is_updated(tmp_path):
+    # reading a scene into a sim that already has its loads updates their mass in place
+    path = tmp_path / 'outputs.json'
+    scene = '''{"validity": true, "outputMass": {"Red Cube": %s},
+        "relatedGroups": [], "relatedGroupsInRope": [], "ResultTension": {}, "CounterFactualAnnotations": {}}'''
+    sim = SimulationPulley()
+    for mass in ['0.1', '0.2']:
+        path.write_text(scene % mass)
+        assert read_annotation_pulley(str(path), sim)
+    assert [o.mass for o in sim.objects] == [0.2]
+    _check_indexes(sim)
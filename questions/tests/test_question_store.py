@@ -0,0 +1,66 @@
+import os
+import gzip
+import json
+
+import pytest
+
+from conftest import read_outputs
+from question_store import QuestionStore
+from test_agent import _generate
+
+
+def _records(n):
+    return {str(i): {"mass": [{"question": f"q{i}", "answer": [i]}]} for i in range(n)}
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, compress):
+    records = _records(5)
+    first, second = QuestionStore(tmp_path, compress), QuestionStore(tmp_path, compress)
+    for video_id, question_dict in records.items():
+        (first if int(video_id) % 2 else second).write(video_id, question_dict)
+    first.close()
+    second.close()
+
+    store = QuestionStore(tmp_path, compress)
+    assert len(store._shards()) == 2
+    assert store.done_video_ids() == set(records)
+    index = store.index()
+    for video_id, question_dict in records.items():
+        assert store.read_video(video_id, index) == {"video_id": video_id, "question_dict": question_dict}
+    assert [r["video_id"] for r in store.records(['3', '0', '4'])] == ['3', '0', '4']
+    assert {r["video_id"]: r["question_dict"] for r in store} == records
+    if compress:
+        # every record is a gzip member, the shard is still a valid gzip file
+        data_path = store._shards()[0][0]
+        with gzip.open(data_path, 'rt') as f:
+            assert all(json.loads(line)["video_id"] in records for line in f)
+
+def test_last_record_wins(tmp_path):
+    store = QuestionStore(tmp_path)
+    store.write('0', {"mass": []})
+    store.write('0', {"mass": [1]})
+    store.close()
+    assert store.read_video('0')["question_dict"] == {"mass": [1]}
+
+def test_cut_index_line_is_ignored(tmp_path):
+    store = QuestionStore(tmp_path)
+    store.write('0', {"mass": []})
+    store.write('1', {"mass": []})
+    store.close()
+    index_path = store._shards()[0][1]
+    with open(index_path, 'rb+') as f:
+        f.truncate(os.path.getsize(index_path) - 1) # the newline of the last line
+    assert store.done_video_ids() == {'0'}
+
+def test_clear(tmp_path):
+    store = QuestionStore(tmp_path, compress=True)
+    store.write('0', {})
+    store.close()
+    store.clear()
+    assert os.listdir(tmp_path) == []
+
+def test_agent_store_matches_json(make_args, sample_videos, tmp_path):
+    json_outputs = _generate(make_args, sample_videos, tmp_path / 'json', '--seed', 7, '--multithread', '')
+    _generate(make_args, sample_videos, tmp_path / 'jsonl', '--seed', 7, '--multithread', '', '--output_format', 'jsonl', '--compress')
+    store = QuestionStore(tmp_path / 'jsonl' / 'pulley' / 'store')
+    assert {r["video_id"]: r["question_dict"] for r in store} == json_outputs
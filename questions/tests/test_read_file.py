@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from read_file import ANNOTATION_KEYS, _StructuralIndex, load_annotation_json
+
+
+def test_selective_matches_json_load(sample_json):
+    with open(sample_json) as f:
+        full = json.load(f)
+    data = load_annotation_json(sample_json)
+    assert data == {k: full[k] for k in ANNOTATION_KEYS if k in full}
+    assert load_annotation_json(sample_json, selective=False) == full
+
+def test_selective_from_raw(sample_json):
+    with open(sample_json, 'rb') as f:
+        raw = f.read()
+    assert load_annotation_json(sample_json, keys=("outputMass",), raw=raw) == {"outputMass": json.loads(raw)["outputMass"]}
+
+def test_invalid_returns_early(tmp_path):
+    path = tmp_path / 'outputs.json'
+    path.write_text(json.dumps({"validity": False, "outputMass": {"Red Cube": 1.0}}))
+    assert load_annotation_json(str(path)) == {"validity": False}
+
+@pytest.mark.parametrize("skipped", [
+    {"a": [1, 2, {"b": "]}"}], "c": "\"[\\\\"},
+    [[], [[]], {"x": "{\\\"}"}],
+    {},
+])
+def test_structural_index_skips_containers(tmp_path, skipped):
+    # the brackets and escaped quotes inside strings must not be counted
+    doc = {"skipped": skipped, "kept": {"value": "[1]"}}
+    path = tmp_path / 'outputs.json'
+    path.write_text(json.dumps(doc))
+    assert load_annotation_json(str(path), keys=("kept",)) == {"kept": doc["kept"]}
+
+    raw = json.dumps(skipped).encode()
+    assert _StructuralIndex(raw).skip(0) == len(raw)
@@ -0,0 +1,66 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from read_file_4d import SECTIONS, Outputs4D, convert_outputs4d, is_converted
+
+
+def _check_entry(outputs, section, name, value, dtype, point_shape):
+    """ Compare a converted array with the nested lists of the json, frame by frame if padded """
+    arr = outputs.get(section, name)
+    counts = outputs.counts(section, name)
+    if counts is None:
+        np.testing.assert_array_equal(arr, np.array(value, dtype=dtype).reshape(arr.shape))
+        return
+    assert counts.tolist() == [len(frame) for frame in value]
+    for i, frame in enumerate(value):
+        np.testing.assert_array_equal(arr[i, :counts[i]], np.array(frame, dtype=dtype).reshape((-1,) + point_shape))
+        assert np.all(np.isnan(arr[i, counts[i]:]) if np.issubdtype(dtype, np.floating) else arr[i, counts[i]:] == -1)
+
+def test_round_trip(sample_video):
+    convert_outputs4d(str(sample_video / 'outputs4D.json'))
+    assert is_converted(str(sample_video))
+    outputs = Outputs4D(str(sample_video))
+    with open(sample_video / 'outputs4D.json') as f:
+        data = json.load(f)
+
+    assert outputs.staticity == data["rigidbody4D"]["rigidbodyStatesStaticity"]
+    for group, sections in SECTIONS.items():
+        for section, (dtype, point_shape, per_frame) in sections.items():
+            assert outputs.names(section) == list(data[group][section])
+            for name, value in data[group][section].items():
+                _check_entry(outputs, section, name, value, dtype, point_shape)
+
+    name = next(n for n, v in data["rigidbody4D"]["rigidbodyCentroidStates"].items() if len(v) > 20)
+    np.testing.assert_array_equal(outputs.centroid_states(name, 10, 20),
+                                  np.array(data["rigidbody4D"]["rigidbodyCentroidStates"][name][10:20], dtype=np.float32))
+
+def test_deleted_source_is_still_valid(sample_video):
+    convert_outputs4d(str(sample_video / 'outputs4D.json'))
+    os.remove(sample_video / 'outputs4D.json')
+    assert is_converted(str(sample_video))
+    Outputs4D(str(sample_video))
+
+def test_stale_conversion_is_refused(sample_video):
+    json_path = sample_video / 'outputs4D.json'
+    assert not is_converted(str(sample_video))
+    convert_outputs4d(str(json_path))
+    st = os.stat(json_path)
+    os.utime(json_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not is_converted(str(sample_video))
+    with pytest.raises(ValueError):
+        Outputs4D(str(sample_video))
+    convert_outputs4d(str(json_path))
+    assert is_converted(str(sample_video))
+
+def test_empty_scene(tmp_path):
+    json_path = tmp_path / 'outputs4D.json'
+    json_path.write_text(json.dumps({"rigidbody4D": {"rigidbodyCentroidStates": {"Red Cube": []}}, "softbody4D": {}}))
+    convert_outputs4d(str(json_path))
+    assert os.path.getsize(tmp_path / 'outputs4D.bin') == 0
+    outputs = Outputs4D(str(tmp_path))
+    assert outputs.num_frames == 0
+    assert outputs.centroid_states("Red Cube").size == 0
+    assert outputs.names("softbodyTrackedParticles") == []
@@ -0,0 +1,77 @@
+import os
+import json
+
+import numpy as np
+
+from read_file import parse_entity_name
+from read_file_boxes import BOX_ANNOTATION, Boxes2D, convert_boxes, is_converted
+
+
+def _walk_boxes(json_path):
+    """ (frame, instance) -> (label, x, y, w, h) of every box, by a walk of the json """
+    with open(json_path) as f:
+        data = json.load(f)
+    boxes = {}
+    for frame, captures in data["imgAnnotationDescriptions"]["perFrameAnnotations"].items():
+        for capture in captures:
+            for annotation in capture.get("annotations", []):
+                if annotation.get("@type") == BOX_ANNOTATION:
+                    for box in annotation["values"]:
+                        boxes[int(frame), box["instanceId"]] = (box["labelId"],) + tuple(np.float32(v) for v in box["origin"] + box["dimension"])
+    return boxes, data["imgAnnotationDescriptions"]["Id2ObjectNameDict"]
+
+def _as_boxes(columns):
+    return {(int(f), int(i)): (int(l), x, y, w, h) for f, i, l, x, y, w, h in
+            zip(*[columns[name] for name in ["frame", "instance", "label", "x", "y", "w", "h"]])}
+
+def test_round_trip(sample_video):
+    json_path = str(sample_video / 'outputs.json')
+    convert_boxes(json_path)
+    assert is_converted(json_path)
+    boxes = Boxes2D(str(sample_video))
+    expected, objects = _walk_boxes(json_path)
+    assert len(expected) > 0 and len(boxes) == len(expected)
+    assert boxes.objects == {int(i): name for i, name in objects.items()}
+
+    assert _as_boxes(boxes.rows(slice(None))) == expected
+    frames = sorted({frame for frame, _ in expected})
+    for frame in frames[:: max(1, len(frames) // 20)] + [frames[-1] + 1]:
+        visible = sorted(i for f, i in expected if f == frame)
+        assert boxes.visible(frame).tolist() == visible
+        assert boxes.visible_objects(frame) == [objects.get(str(i)) for i in visible]
+
+    start, end = frames[len(frames) // 3], frames[2 * len(frames) // 3]
+    for instance, name in boxes.objects.items():
+        rows = boxes.instance_rows(instance, start, end)
+        assert boxes.frame[rows].tolist() == sorted(f for f, i in expected if i == instance and start <= f < end)
+        assert np.all(boxes.instance[rows] == instance)
+        # the sim name of the object finds its boxes as well
+        sim_boxes = _as_boxes(boxes.boxes_of(parse_entity_name(name).key, start, end))
+        assert {key: expected[key] for key in sim_boxes if key[1] == instance} == \
+               {(f, i): box for (f, i), box in expected.items() if i == instance and start <= f < end}
+    assert len(boxes.boxes_of('Missing Cube')["frame"]) == 0
+
+def test_stale_conversion(sample_video):
+    json_path = str(sample_video / 'outputs.json')
+    assert not is_converted(json_path)
+    convert_boxes(json_path)
+    with open(json_path) as f:
+        data = json.load(f)
+    with open(json_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    assert not is_converted(json_path)
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    convert_boxes(json_path, raw=raw)
+    assert is_converted(json_path, raw)
+
+def test_no_boxes(tmp_path):
+    json_path = str(tmp_path / 'outputs.json')
+    with open(json_path, 'w') as f:
+        json.dump({"validity": True, "imgAnnotationDescriptions": {"Id2ObjectNameDict": {"1": "Red Cube"}, "perFrameAnnotations": {}}}, f)
+    convert_boxes(json_path)
+    assert os.path.getsize(tmp_path / 'boxes2D.bin') == 0
+    boxes = Boxes2D(str(tmp_path))
+    assert len(boxes) == 0
+    assert boxes.visible(0).tolist() == []
+    assert len(boxes.boxes_of('Red Cube')["x"]) == 0
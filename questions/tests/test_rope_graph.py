@@ -0,0 +1,140 @@
+import json
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from object import SimulationPulley
+from read_file import parse_entity_name, read_annotation_pulley
+from rope_graph import RopeGraph
+
+COLORS = ["Red", "Blue", "Green", "Yellow", "Purple", "Pink", "Gray", "Brown"]
+
+
+def _old_links(relation_info):
+    """ Related load pairs, dynamic pulley loads and rope map, as read_annotation_pulley derived them from the chains """
+    pairs, dynamic, rope_map = set(), [], {}
+    for group in relation_info:
+        entities = [parse_entity_name(name) for name in group]
+        for name1, name2 in combinations(set(group), 2):
+            entity1, entity2 = parse_entity_name(name1), parse_entity_name(name2)
+            if entity1.is_load and entity2.is_load and entity1.key != entity2.key:
+                pairs.add(frozenset([entity1.key, entity2.key]))
+        for i, entity in enumerate(entities):
+            if entity.is_dynamic:
+                obj_name = None
+                if i-2 >= 0 and entities[i-2].is_load:
+                    obj_name = entities[i-2].key
+                if i+2 < len(group) and entities[i+2].is_load:
+                    obj_name = entities[i+2].key
+                if obj_name is None:
+                    continue
+                dynamic.append(obj_name)
+            if entity.is_load:
+                if i == 0 or i == len(group)-1:
+                    rope = entities[1 if i == 0 else i-1].lower
+                    if 'rope' not in rope:
+                        continue
+                elif entities[i+2].is_dynamic:
+                    rope = entities[i+1].lower
+                elif entities[i-2].is_dynamic:
+                    rope = entities[i-1].lower
+                elif entities[i-1].is_rope:
+                    rope = entities[i-1].lower
+                else:
+                    rope = entities[i+1].lower
+                rope_map[entity.lower] = rope
+    return pairs, list(dict.fromkeys(dynamic)), rope_map
+
+def _new_links(graph):
+    loads = [[name for name in members if parse_entity_name(name).is_load] for members in graph.groups]
+    pairs = {frozenset(pair) for members in loads for pair in combinations(members, 2)}
+    dynamic = [graph.nodes[node] for node in graph.dynamic_load]
+    rope_map = {graph.nodes[node]: rope for node, rope in graph.node_rope.items()}
+    return pairs, dynamic, rope_map
+
+def _random_chains(rng, num_groups):
+    """ relatedGroups chains of loads, fixed points and pulleys joined by ropes, sharing some of their nodes """
+    shared = []
+    groups = []
+    for _ in range(num_groups):
+        rope = f"{rng.choice(COLORS)} Rope"
+        nodes = []
+        for position in range(rng.randint(2, 6)):
+            if shared and rng.random() < 0.15:
+                node = rng.choice(shared)
+            elif position in (0,) or rng.random() < 0.2:
+                node = f"{rng.choice(COLORS)} {rng.choice(['Cube', 'Sphere', 'Fixed Point'])}"
+            else:
+                node = f"{rng.choice(COLORS)} {rng.choice(['Solid', 'Hollow'])} {rng.choice(['Static', 'Dynamic'])} Pulley ({rng.randint(0, 7)} {rng.randint(0, 7)})"
+            shared.append(node)
+            nodes.append(node)
+        nodes.append(f"{rng.choice(COLORS)} {rng.choice(['Cube', 'Sphere', 'Fixed Point'])}")
+        chain = [nodes[0]]
+        for node in nodes[1:]:
+            chain += [rope, node]
+        groups.append(chain)
+    return groups
+
+def _check_structure(graph, relation_info):
+    n = len(graph.nodes)
+    assert graph.index == {name: i for i, name in enumerate(graph.nodes)}
+    adjacency = [[] for _ in range(n)]
+    for a, b in graph.edges.tolist():
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+    for i, name in enumerate(graph.nodes):
+        assert sorted(graph.neighbors(name)) == sorted(graph.nodes[j] for j in adjacency[i])
+
+    # components: the same labels as a flood fill over the edges, numbered by first node
+    label = {}
+    for start in range(n):
+        if start in label:
+            continue
+        stack, label[start] = [start], len(set(label.values()))
+        while stack:
+            for other in adjacency[stack.pop()]:
+                if other not in label:
+                    label[other] = label[start]
+                    stack.append(other)
+    assert graph.component.tolist() == [label[i] for i in range(n)]
+
+    groups = [{parse_entity_name(name).key for name in group if not parse_entity_name(name).is_rope} for group in relation_info]
+    assert [set(members) for members in graph.groups] == groups
+    for name1 in graph.nodes:
+        for name2 in graph.nodes:
+            assert graph.same_group(name1, name2) == any(name1 in g and name2 in g for g in groups)
+            assert graph.connected(name1, name2) == (label[graph.index[name1]] == label[graph.index[name2]])
+    assert not graph.same_group(graph.nodes[0], 'missing')
+
+def test_sample(sample_json):
+    with open(sample_json) as f:
+        relation_info = json.load(f)["relatedGroups"]
+    graph = RopeGraph([[parse_entity_name(name) for name in group] for group in relation_info])
+    _check_structure(graph, relation_info)
+    assert _new_links(graph) == _old_links(relation_info)
+
+    sim = SimulationPulley()
+    read_annotation_pulley(sample_json, sim)
+    pairs = {frozenset([obj.name, other.name]) for obj, others in sim.relations.items() for other in others}
+    assert pairs == _old_links(relation_info)[0]
+    assert [obj.name for obj in sim.link_dy_pulley] == _old_links(relation_info)[1]
+    assert sim.object_rope_map == _old_links(relation_info)[2]
+    for obj in sim.link_dy_pulley:
+        assert sim.rope_graph.on_dynamic_pulley(obj.name)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_random_chains(seed):
+    relation_info = _random_chains(random.Random(seed), 1 + seed % 5)
+    graph = RopeGraph([[parse_entity_name(name) for name in group] for group in relation_info])
+    _check_structure(graph, relation_info)
+    assert _new_links(graph) == _old_links(relation_info)
+    for name, rope in _old_links(relation_info)[2].items():
+        assert graph.rope_of(name) == rope
+
+def test_empty():
+    graph = RopeGraph()
+    assert graph.nodes == [] and graph.edges.shape == (0, 2)
+    assert graph.indptr.tolist() == [0]
+    assert graph.groups == []
@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+
+from sampler import QTYPE_GROUPS, Vocab, encode_split, evaluate_baselines, fit_baselines, qtype_group
+
+QTYPES = ["mass", "color", "rope_counterfactual", "rope_goaldriven"]
+
+
+def _questions(n, seed, qtypes=QTYPES):
+    rng = random.Random(seed)
+    return [{"qtype": rng.choice(qtypes), "answer": rng.choice(["yes", "no", "red", "blue", "0", "1"]),
+             "answer_type": rng.choice(["binary", "color", "count"])} for _ in range(n)]
+
+def get_frequence_answer(train_list):
+    """ Frequent answer and distinct answers per qtype, as the dict based baselines computed them """
+    counts = {}
+    for ele in train_list:
+        qtype_counts = counts.setdefault(ele["qtype"], {})
+        qtype_counts[ele["answer"]] = qtype_counts.get(ele["answer"], 0) + 1
+    frequent_answer_dict = {qtype: sorted(c.items(), key=lambda item: item[1])[-1][0] for qtype, c in counts.items()}
+    random_answer_dict = {qtype: list(c) for qtype, c in counts.items()}
+    return frequent_answer_dict, random_answer_dict
+
+def _encode(train_list, val_list):
+    vocabs = {"qtype": Vocab(), "answer": Vocab(), "answer_type": Vocab()}
+    train, val = encode_split(train_list, vocabs), encode_split(val_list, vocabs)
+    baselines = fit_baselines(train, len(vocabs["qtype"].words), len(vocabs["answer"].words))
+    return vocabs, train, val, baselines
+
+def test_frequent_answer_matches_dicts():
+    # small splits, for ties between the answer counts
+    for seed in range(20):
+        train_list = _questions(15, seed)
+        vocabs, _, _, (frequent, answers, offset) = _encode(train_list, [])
+        frequent_answer_dict, random_answer_dict = get_frequence_answer(train_list)
+        for q, qtype in enumerate(vocabs["qtype"].words):
+            assert vocabs["answer"].words[frequent[q]] == frequent_answer_dict[qtype]
+            assert sorted(vocabs["answer"].words[a] for a in answers[offset[q]:offset[q + 1]]) == sorted(random_answer_dict[qtype])
+
+def test_accuracy_matches_loop():
+    train_list = _questions(300, 0, QTYPES[:-1])
+    val_list = _questions(200, 1)
+    vocabs, _, val, baselines = _encode(train_list, val_list)
+    frequent_answer_dict, random_answer_dict = get_frequence_answer(train_list)
+    groupings = {"qtype": (val["qtype"], len(vocabs["qtype"].words)),
+                 "group": (np.array([QTYPE_GROUPS.index(qtype_group(ele["qtype"])) for ele in val_list]), len(QTYPE_GROUPS))}
+    results = evaluate_baselines(val, *baselines, groupings, trials=2000, seed=0)
+
+    # reference: the per-question loops of the dict based evaluation, with the expected accuracy of random.choice
+    for name, label_of in [("qtype", lambda ele: vocabs["qtype"].codes[ele["qtype"]]),
+                           ("group", lambda ele: QTYPE_GROUPS.index(qtype_group(ele["qtype"])))]:
+        num_groups = groupings[name][1]
+        total, frequent, expected = np.zeros(num_groups), np.zeros(num_groups), np.zeros(num_groups)
+        for ele in val_list:
+            i = label_of(ele)
+            total[i] += 1
+            choices = random_answer_dict.get(ele["qtype"], []) # a qtype missing from train scores 0
+            frequent[i] += frequent_answer_dict.get(ele["qtype"]) == ele["answer"]
+            expected[i] += choices.count(ele["answer"]) / len(choices) if choices else 0
+        np.testing.assert_array_equal(results[name]["total"], total)
+        np.testing.assert_allclose(results[name]["frequent"], np.divide(frequent, total, out=np.zeros(num_groups), where=total > 0))
+        np.testing.assert_allclose(results[name]["random_expected"], np.divide(expected, total, out=np.zeros(num_groups), where=total > 0))
+        np.testing.assert_allclose(results[name]["random_mean"], results[name]["random_expected"], atol=0.02)
+        assert np.all(results[name]["random_ci_low"] <= results[name]["random_ci_high"])
+    assert results["qtype"]["frequent"][vocabs["qtype"].codes["rope_goaldriven"]] == 0
+
+def test_empty_train():
+    val_list = _questions(50, 2)
+    vocabs, _, val, baselines = _encode([], val_list)
+    results = evaluate_baselines(val, *baselines, {"qtype": (val["qtype"], len(vocabs["qtype"].words))}, trials=10)
+    np.testing.assert_array_equal(results["qtype"]["total"], np.bincount(val["qtype"]))
+    for key in ["frequent", "random_expected", "random_mean", "random_ci_high"]:
+        assert not results["qtype"][key].any()
@@ -0,0 +1,55 @@
+import re
+
+from utils import PULLEY_MATCHER, PULLEY_TEMPLATE_EXCLUDES, PULLEY_TEMPLATES, TemplateMatcher
+
+CHOICES = [
+    "The mass of the red cube is greater than the mass of the blue sphere.",
+    "The mass of the red cube is not greater than the mass of the blue sphere.",
+    "It is impossible to determine the relationship between the masses of the red cube and the blue sphere based on the information given.",
+    "It is possible to determine the relationship between the masses of the red cube and the blue sphere based on the information given.",
+    "The average tension of the green rope is less than the average tension of the purple rope.",
+    "The average tension of the green rope is not equal to the average tension of the purple rope.",
+    "It is impossible to determine the relationship between the average tension of the green rope and the purple rope based on the information given.",
+    "It is possible to determine the relationship between the average tension of the green rope and the purple rope based on the information given.",
+    "The number of cubes in the video is 2.",
+    "The number of red objects in the video is 3.",
+    "There exists a gray solid pulley in the video.",
+    "There does not exist a pink sphere in the video.",
+    "If we pull the red cube, the blue pulley would rotate clockwise",
+    "If we increase the mass of the red cube, the blue pulley would rotate clockwise",
+    "Pull the green rope.",
+    "Increase the mass of the red cube.",
+    "Decrease the mass of the blue sphere.",
+    "The red cube is heavier.",
+    "",
+    "mass",
+]
+
+
+def _brute_force(templates, excludes, choice):
+    """ All the templates matching `choice`, each template tried in order as pulley_analysis did """
+    keys = []
+    for key, pattern in templates.items():
+        match = re.match(pattern, choice)
+        if match and not (key in excludes and excludes[key](match)):
+            keys.append(key)
+    return keys
+
+def test_pulley_templates_match_brute_force():
+    for choice in CHOICES:
+        assert PULLEY_MATCHER.match_keys(choice) == _brute_force(PULLEY_TEMPLATES, PULLEY_TEMPLATE_EXCLUDES, choice)
+    keys, diagnostics = PULLEY_MATCHER.classify(CHOICES)
+    assert keys[:17] == list(PULLEY_TEMPLATES) + ["goal_mass"]
+    assert keys[17:] == [None, None, None]
+    assert [diag["index"] for diag in diagnostics] == [17, 18, 19]
+
+def test_custom_templates():
+    # a matcher uses its own templates, the ones without a literal prefix keep their place in the order
+    templates = {"any": r"(.+?) cube", "red": r"red (.+?)", "red cube": r"red cube", "blue": r"blue (.+)"}
+    excludes = {"blue": lambda match: match[1] == "sky"}
+    matcher = TemplateMatcher(templates, excludes)
+    for choice in ["red cube", "red sphere", "blue cube", "blue sky", "green cube", "mass of the red cube"]:
+        assert matcher.match_keys(choice) == _brute_force(templates, excludes, choice)
+    keys, diagnostics = matcher.classify(["red cube", "blue sky", "green sphere"])
+    assert keys == ["any", None, None]
+    assert [diag["matches"] for diag in diagnostics] == [["any", "red", "red cube"], [], []]
@@ -0,0 +1,79 @@
+import os
+import json
+import argparse
+
+from question_store import QuestionStore
+from utils import JsonListWriter, assign_splits, list_video_ids, run_sample_and_split, SPLIT_RATIO
+
+
+def _write_videos(out_dir, video_ids, empty=()):
+    out_dir.mkdir(parents=True)
+    for i, video_id in enumerate(video_ids):
+        question_dict = {} if video_id in empty else {
+            "mass": [{"question": f"mass {video_id} {j}", "answer": "yes", "question_family": "mass"} for j in range(3)],
+            "rope_counterfactual": [{"question": f"rope {video_id} {j}", "answer": "No answer.", "question_family": "rope"} for j in range(3)],
+        }
+        with open(out_dir / f'{video_id}.json', 'w') as f:
+            json.dump({"video_id": video_id, "question_dict": question_dict}, f)
+
+def _args(tmp_path, **kwargs):
+    args = dict(video_type='pulley', fact_ques_num=2, count_ques_num=2, output_ques_ann_path=str(tmp_path / 'output'),
+                merge_ques_path=str(tmp_path / 'merge' / 'merge.json'), debug=False, out_id='v1', seed=3, analysis='')
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+def _read_splits(tmp_path):
+    splits = {}
+    for split in SPLIT_RATIO:
+        with open(tmp_path / 'merge' / f'pulley_{split}_v1.json') as f:
+            splits[split] = json.load(f)
+    return splits
+
+def test_list_video_ids(tmp_path):
+    out_dir = tmp_path / 'pulley'
+    _write_videos(out_dir, ['10', '9', '100'])
+    (out_dir / 'manifest.json').write_text('{}')
+    (out_dir / 'notes.txt').write_text('')
+    assert list_video_ids(out_dir) == ['9', '10', '100']
+
+def test_json_list_writer(tmp_path):
+    elements = [{"a": 1}, [2, 3], "4"]
+    writer = JsonListWriter(tmp_path / 'list.json')
+    for ele in elements:
+        writer.write(ele)
+    writer.close()
+    assert (tmp_path / 'list.json').read_text() == json.dumps(elements)
+
+def test_splits_match_merge(tmp_path):
+    video_ids = [str(i) for i in range(12)]
+    _write_videos(tmp_path / 'output' / 'pulley', video_ids, empty={'0', '5'})
+    run_sample_and_split(_args(tmp_path))
+    with open(tmp_path / 'merge' / 'merge.json') as f:
+        merge = json.load(f)
+    assert [ele["question_id"] for ele in merge] == ['{:0>5d}'.format(i) for i in range(len(merge))]
+    assert all(ele["positive"] == [] for ele in merge if ele["answer"] == "No answer.")
+
+    # reference: split the whole merge.json in memory by the ids of the videos in it
+    sampled_ids = sorted({ele["video_id"] for ele in merge}, key=int)
+    assert '0' not in sampled_ids and '5' not in sampled_ids
+    vid_2_split = assign_splits(sampled_ids)
+    expected = {split: [] for split in SPLIT_RATIO}
+    for ele in merge:
+        expected[vid_2_split[ele["video_id"]]].append(dict(ele, split=vid_2_split[ele["video_id"]]))
+    assert _read_splits(tmp_path) == expected
+    assert all(expected.values())
+    assert not [fn for fn in os.listdir(tmp_path / 'merge') if fn.endswith('.jsonl')]
+
+def test_store_matches_json_files(tmp_path):
+    video_ids = [str(i) for i in range(6)]
+    _write_videos(tmp_path / 'output' / 'pulley', video_ids)
+    run_sample_and_split(_args(tmp_path))
+    from_files = _read_splits(tmp_path)
+
+    store = QuestionStore(tmp_path / 'store_output' / 'pulley' / 'store')
+    for video_id in reversed(video_ids):
+        with open(tmp_path / 'output' / 'pulley' / f'{video_id}.json') as f:
+            store.write(video_id, json.load(f)["question_dict"])
+    store.close()
+    run_sample_and_split(_args(tmp_path, output_ques_ann_path=str(tmp_path / 'store_output')))
+    assert _read_splits(tmp_path) == from_files
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+
+import pytest
+
+from agent_pulley_dev import AgentPulley
+from conftest import read_outputs
+from manifest import Manifest
+from test_agent import _generate
+from work_queue import ShardQueue, shard_of
+
+VIDEO_IDS = [str(i) for i in range(20)]
+
+
+def _make_stale(queue, shard):
+    lock_path = queue._lock_path(shard)
+    old = time.time() - 2 * queue.timeout
+    os.utime(lock_path, (old, old))
+
+def _report(shards, shard):
+    return {"videos": {video_id: {"status": "generated"} for video_id in shards[shard]}, "manifest": {}}
+
+def test_plan(tmp_path):
+    shards = ShardQueue(tmp_path, 4, owner='a').plan(VIDEO_IDS)
+    assert sorted(sum(shards.values(), [])) == sorted(VIDEO_IDS)
+    assert all(shard_of(video_id, 4) == shard for shard, video_ids in shards.items() for video_id in video_ids)
+    # the processes starting later load the same plan, in any order of the videos
+    assert ShardQueue(tmp_path, 4, owner='b').plan(VIDEO_IDS[::-1]) == shards
+    with pytest.raises(ValueError):
+        ShardQueue(tmp_path, 4, owner='c').plan(VIDEO_IDS[:-1])
+    with pytest.raises(ValueError):
+        ShardQueue(tmp_path, 5, owner='c').plan(VIDEO_IDS)
+
+def test_claims_are_exclusive(tmp_path):
+    queues = [ShardQueue(tmp_path, 4, owner=owner) for owner in 'abc']
+    claimed = []
+    while (shard := queues[len(claimed) % 3].claim()) is not None:
+        claimed.append(shard)
+    assert sorted(claimed) == [0, 1, 2, 3]
+    assert all(queue.claim() is None for queue in queues)
+    assert not queues[0].done()
+
+def test_complete_and_merge(tmp_path):
+    queue = ShardQueue(tmp_path, 3, owner='a')
+    shards = queue.plan(VIDEO_IDS)
+    while (shard := queue.claim()) is not None:
+        assert queue.heartbeat(shard)
+        assert queue.complete(shard, _report(shards, shard))
+        assert not os.path.exists(queue._lock_path(shard))
+    assert queue.done()
+    assert queue.wait_claim(poll=0.01) is None
+    reports, problems = queue.merge()
+    assert problems == []
+    assert sorted(reports) == [0, 1, 2]
+
+def test_merge_problems(tmp_path):
+    queue = ShardQueue(tmp_path, 3, owner='a')
+    shards = queue.plan(VIDEO_IDS)
+    assert queue.merge()[1] == ["shard 0 is not done", "shard 1 is not done", "shard 2 is not done"]
+    assert sorted(queue.claim() for _ in range(3)) == [0, 1, 2]
+    video_id = shards[0][0]
+    queue.complete(0, _report(shards, 0))
+    queue.complete(1, {"videos": dict(_report(shards, 1)["videos"], **{video_id: {}}), "manifest": {}})
+    report = _report(shards, 2)
+    del report["videos"][shards[2][0]]
+    queue.complete(2, report)
+    assert sorted(queue.merge()[1]) == sorted([f"video {shards[2][0]} of shard 2 was not processed",
+                                               f"video {video_id} was processed 2 times, by shards [0, 1]"])
+
+def test_stale_lock_is_taken_over(tmp_path):
+    first, second = ShardQueue(tmp_path, 1, timeout=10, owner='a'), ShardQueue(tmp_path, 1, timeout=10, owner='b')
+    shards = first.plan(VIDEO_IDS)
+    assert first.claim() == 0
+    assert second.claim() is None # the lock is fresh
+    _make_stale(first, 0)
+    assert second.claim() == 0
+    # the stalled process notices on its next heartbeat, and cannot report nor release the shard
+    assert not first.heartbeat(0)
+    assert not first.complete(0, _report(shards, 0))
+    first.abandon(0)
+    assert second.is_owner(0)
+    assert second.complete(0, _report(shards, 0))
+    assert second.merge()[1] == []
+
+def test_abandon_releases_the_shard(tmp_path):
+    first, second = ShardQueue(tmp_path, 1, owner='a'), ShardQueue(tmp_path, 1, owner='b')
+    first.plan(VIDEO_IDS)
+    assert first.claim() == 0
+    first.abandon(0)
+    assert second.claim() == 0
+
+def test_wait_claim_takes_over(tmp_path):
+    first, second = ShardQueue(tmp_path, 1, timeout=0.2, owner='a'), ShardQueue(tmp_path, 1, timeout=0.2, owner='b')
+    first.plan(VIDEO_IDS)
+    assert first.claim() == 0
+    # the lock is not touched anymore, the waiting process gets the shard once it is stale
+    assert second.wait_claim(poll=0.05) == 0
+
+def test_heartbeat_lost(tmp_path):
+    first, second = ShardQueue(tmp_path, 1, timeout=10, owner='a'), ShardQueue(tmp_path, 1, timeout=10, owner='b')
+    first.plan(VIDEO_IDS)
+    first.claim()
+    with first.keep_alive(0, interval=0.02) as heartbeat:
+        _make_stale(first, 0)
+        assert second.claim() == 0
+        assert heartbeat.lost.wait(5)
+
+def test_sharded_run_matches_serial(make_args, sample_videos, tmp_path):
+    serial = _generate(make_args, sample_videos, tmp_path / 'serial', '--seed', 7, '--multithread', '')
+    output_dir = tmp_path / 'sharded'
+    argv = ['--input_video_ann_path', sample_videos, '--output_ques_ann_path', output_dir, '--seed', 7,
+            '--num_shards', 2, '--num_workers', 2, '--chunksize', 1]
+    AgentPulley(make_args(*argv, '--worker_id', 'a')).generate_all_sharded()
+    AgentPulley(make_args(*argv, '--worker_id', 'b')).generate_all_sharded() # nothing left to claim
+    assert read_outputs(output_dir / 'pulley') == serial
+    assert AgentPulley(make_args(*argv, '--merge_shards')).merge_shards()
+    assert sorted(Manifest(output_dir / 'manifest_pulley.json').entries) == sorted(serial)
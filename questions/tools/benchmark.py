@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import glob
+import time
+import copy
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from multiprocessing import Pool
+from prettytable import PrettyTable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import read_file
+from read_file import load_annotation_json, read_annotation_pulley
+from object import SimulationPulley, ObjectPulley
+from agent_pulley_dev import AgentPulley, RandomizationFeature, _init_worker, _generate_worker
+from question_engine_pulley import QuestionEnginePulley
+from profiler import percentile
+from synthetic_scenes import write_scenes
+
+
+def build_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_video_ann_path", type=str, default="data/pulley_group", help="")
+    parser.add_argument("--bench", type=str, default="read", choices=["read", "generate", "shuffle", "scaling", "memory"], help="which benchmark to run")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions per video")
+    parser.add_argument("--key", type=str, default="", help="")
+    parser.add_argument("--scene_cache_path", type=str, default="", help="")
+    parser.add_argument('--kinematics', action='store_true', help='')
+    parser.add_argument("--seed", type=int, default=None, help="")
+    parser.add_argument( "--video_type", type=str, default="pulley", help="")
+    parser.add_argument("--output_ques_ann_path", type=str, default="output", help="")
+    parser.add_argument("--sizes", type=str, default="2:4:3:5,4:8:6:10,8:24:12:20,12:48:24:40", help="scaling: comma separated ropes:pulleys:loads:counterfactuals")
+    parser.add_argument("--workers", type=str, default="1,2,4", help="scaling: comma separated worker counts")
+    parser.add_argument("--videos", type=int, default=40, help="scaling: synthetic videos per scene size")
+    parser.add_argument("--frames", type=int, default=150, help="scaling: frames of bounding boxes per synthetic video")
+    parser.add_argument("--synthetic_path", type=str, default="", help="scaling: keep the synthetic scenes and questions there, a temporary directory otherwise")
+    args = parser.parse_args()
+    return args
+
+def _time_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1e3)
+    return times
+
+def bench_read(args):
+    """ Compare the full json.load of outputs.json against the selective loader """
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs.json')))
+    full_times, sel_times = [], []
+    for json_path in all_jsons:
+        full = load_annotation_json(json_path, selective=False)
+        sel = load_annotation_json(json_path)
+        if full["validity"]:
+            assert all(full[k] == sel[k] for k in sel), json_path
+        full_times += _time_ms(lambda: load_annotation_json(json_path, selective=False), args.repeat)
+        sel_times += _time_ms(lambda: load_annotation_json(json_path), args.repeat)
+
+    table = PrettyTable()
+    table.field_names = ["loader", "videos", "mean (ms)", "median (ms)", "speedup"]
+    full_mean, sel_mean = statistics.mean(full_times), statistics.mean(sel_times)
+    table.add_row(["json.load", len(all_jsons), f"{full_mean:.2f}", f"{statistics.median(full_times):.2f}", "1.00x"])
+    table.add_row(["selective", len(all_jsons), f"{sel_mean:.2f}", f"{statistics.median(sel_times):.2f}", f"{full_mean / sel_mean:.2f}x"])
+    print(table)
+
+def bench_generate(args):
+    """ Time a whole video (read + every template key) and each template key, averaged over all videos """
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs.json')))
+    agent = AgentPulley(args)
+    key_times = {key: [] for key in agent.templates}
+    video_times = []
+    for json_path in all_jsons:
+        video_id = json_path.split('/')[-2]
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            agent.set_video(video_id)
+            if not agent.read_json(json_path):
+                break
+            for key in agent.templates:
+                t1 = time.perf_counter()
+                agent.generate(key)
+                key_times[key].append((time.perf_counter() - t1) * 1e3)
+            video_times.append((time.perf_counter() - t0) * 1e3)
+
+    table = PrettyTable()
+    table.field_names = ["template", "mean (ms)", "median (ms)"]
+    for key, times in key_times.items():
+        if times:
+            table.add_row([key, f"{statistics.mean(times):.3f}", f"{statistics.median(times):.3f}"])
+    table.add_row(["video", f"{statistics.mean(video_times):.3f}", f"{statistics.median(video_times):.3f}"])
+    print(table)
+
+def _shuffle_deepcopy(questions, answers, features, rng):
+    """ RandomizationFeature.shuffle_choice before the index permutations, as the reference of bench_shuffle """
+    questions_shuffled, answers_shuffled, raw_options_shuffled, features_shuffled = [], [], [], []
+    for ques, ans, ft in zip(questions, answers, features):
+        ques_title, options = ques.split('\n')[0], ques.split('\n')[1:]
+        positive = [options[ord(choice) - ord('A')] for choice in ans.split()]
+        options_unshuffled = copy.deepcopy(options)
+        rng.shuffle(options)
+        shuffle_mapping = {options_unshuffled[i][0]: options[i][0] for i in range(len(options))}
+        ft_copy = copy.deepcopy(ft)
+        for k, v in shuffle_mapping.items():
+            ft['choices'][k] = ft_copy['choices'][v]
+        ans_shuffled = ' '.join(sorted([chr(ord('A') + options.index(choice)) for choice in positive]))
+        raw_opt_shuffled = [option[3:] for option in options]
+        opt_shuffled = [chr(ord('A') + i) + '. ' + opt for i, opt in enumerate(raw_opt_shuffled)]
+        questions_shuffled.append(ques_title + '\n' + '\n'.join(opt_shuffled))
+        answers_shuffled.append(ans_shuffled)
+        raw_options_shuffled.append(raw_opt_shuffled)
+        features_shuffled.append(ft)
+    return questions_shuffled, answers_shuffled, raw_options_shuffled, features_shuffled
+
+def bench_shuffle(args):
+    """ Time the option shuffling of the generated questions of a template (default rope_counterfactual2) """
+    key = args.key or "rope_counterfactual2"
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs.json')))
+    agent = AgentPulley(args)
+    old_times, new_times, num_questions = [], [], 0
+    for json_path in all_jsons:
+        agent.simulation = SimulationPulley()
+        if not agent.read_json(json_path):
+            continue
+        ques, ans, feats = QuestionEnginePulley(agent.simulation, agent.templates, rng=random.Random(0)).generate(key)
+        if not ques:
+            continue
+        num_questions += len(ques)
+        for i in range(args.repeat):
+            inputs = [copy.deepcopy(feats) for _ in range(2)]
+            t0 = time.perf_counter()
+            old = _shuffle_deepcopy(ques, ans, inputs[0], random.Random(i))
+            t1 = time.perf_counter()
+            new = RandomizationFeature(ques, ans, inputs[1], rng=random.Random(i)).shuffle_choice()
+            t2 = time.perf_counter()
+            assert old == new, json_path
+            old_times.append((t1 - t0) * 1e3)
+            new_times.append((t2 - t1) * 1e3)
+
+    table = PrettyTable()
+    table.field_names = ["shuffle", "questions", "mean per video (ms)", "median (ms)", "speedup"]
+    old_mean, new_mean = statistics.mean(old_times), statistics.mean(new_times)
+    table.add_row(["deepcopy", num_questions, f"{old_mean:.3f}", f"{statistics.median(old_times):.3f}", "1.00x"])
+    table.add_row(["permutation", num_questions, f"{new_mean:.3f}", f"{statistics.median(new_times):.3f}", f"{old_mean / new_mean:.2f}x"])
+    print(table)
+
+def _scaling_args(args, input_path, output_path, trace_memory=False):
+    """ Arguments of the agents of bench_scaling, every video generated from scratch with profiling on """
+    run_args = argparse.Namespace(**vars(args))
+    run_args.input_video_ann_path = input_path
+    run_args.output_ques_ann_path = output_path
+    run_args.restart = True
+    run_args.key = ''
+    run_args.scene_cache_path = ''
+    run_args.output_format = 'json'
+    run_args.profile = True
+    run_args.trace_memory = trace_memory
+    return run_args
+
+def _stage_totals(stages):
+    """ Stage category (read, parse, engine, generate, randomize, write) -> total seconds of a video """
+    totals = {}
+    for record in stages:
+        name = record["stage"].split('/')[0]
+        totals[name] = totals.get(name, 0) + record["time"]
+    return totals
+
+def bench_scaling(args):
+    """ Time the whole pipeline (generate_multithread in a Pool) on synthetic scenes of growing size
+
+    For every scene size and worker count: throughput and per-video latency percentiles, and
+    the mean time per video of every stage (see profiler.py). The peak memory of the stages is
+    measured in a separate serial pass with tracemalloc, which would slow the timed runs down.
+    """
+    sizes = [tuple(int(n) for n in size.split(':')) for size in args.sizes.split(',')]
+    worker_counts = [int(n) for n in args.workers.split(',')]
+    root = args.synthetic_path or tempfile.mkdtemp(prefix='pulley_scaling_')
+    stage_names = ["read", "parse", "engine", "generate", "randomize", "write"]
+
+    runs = PrettyTable()
+    runs.field_names = ["scene", "workers", "videos", "questions / video", "videos / s", "speedup", "p50 (ms)", "p95 (ms)", "p99 (ms)"]
+    stage_times = PrettyTable()
+    stage_times.field_names = ["scene", "workers"] + [f"{name} (ms)" for name in stage_names]
+    stage_peaks = PrettyTable()
+    stage_peaks.field_names = ["scene"] + [f"{name} (KB)" for name in stage_names]
+    try:
+        for num_ropes, num_pulleys, num_loads, num_counterfactuals in sizes:
+            scene = f"{num_ropes}:{num_pulleys}:{num_loads}:{num_counterfactuals}"
+            input_path = os.path.join(root, 'scenes', scene.replace(':', '-'))
+            output_path = os.path.join(root, 'questions', scene.replace(':', '-'))
+            all_jsons = write_scenes(input_path, args.videos, seed=args.seed or 0, num_ropes=num_ropes, num_pulleys=num_pulleys,
+                                     num_loads=num_loads, num_counterfactuals=num_counterfactuals, num_frames=args.frames)
+            os.makedirs(os.path.join(output_path, args.video_type), exist_ok=True)
+
+            base_throughput = None
+            for num_workers in worker_counts:
+                run_args = _scaling_args(args, input_path, output_path)
+                with Pool(num_workers, initializer=_init_worker, initargs=(run_args,)) as p:
+                    t0 = time.perf_counter()
+                    results = list(p.imap_unordered(_generate_worker, all_jsons))
+                    wall = time.perf_counter() - t0
+                latencies = sorted(1e3 * elapsed for _, _, elapsed, _, _, _ in results)
+                throughput = len(results) / wall
+                base_throughput = base_throughput or throughput
+                totals = [_stage_totals(stages) for *_, stages in results]
+                runs.add_row([scene, num_workers, len(results), _questions_per_video(output_path, args.video_type), f"{throughput:.1f}",
+                              f"{throughput / base_throughput:.2f}x", f"{percentile(latencies, 0.5):.2f}",
+                              f"{percentile(latencies, 0.95):.2f}", f"{percentile(latencies, 0.99):.2f}"])
+                stage_times.add_row([scene, num_workers] + [f"{1e3 * statistics.mean(t.get(name, 0) for t in totals):.2f}" for name in stage_names])
+
+            agent = AgentPulley(_scaling_args(args, input_path, output_path, trace_memory=True))
+            peaks = {}
+            for json_path in all_jsons:
+                agent.generate_multithread(json_path)
+                for record in agent.profiler.pop():
+                    name = record["stage"].split('/')[0]
+                    peaks[name] = max(peaks.get(name, 0), record["peak"])
+            tracemalloc.stop()
+            stage_peaks.add_row([scene] + [f"{peaks.get(name, 0) / 1024:.0f}" for name in stage_names])
+    finally:
+        if not args.synthetic_path:
+            shutil.rmtree(root)
+
+    print(runs)
+    print("mean time per video of every stage")
+    print(stage_times)
+    print("peak traced memory of every stage (serial pass)")
+    print(stage_peaks)
+
+def _questions_per_video(output_path, video_type):
+    counts = []
+    for path in glob.glob(os.path.join(output_path, video_type, '*.json')):
+        with open(path, 'r') as f:
+            counts.append(sum(len(items) for items in json.load(f)["question_dict"].values()))
+    return f"{statistics.mean(counts):.0f}" if counts else "0"
+
+class _ObjectPulleyDict:
+    """ ObjectPulley before the slots, as the reference of bench_memory """
+    def __init__(self, color, mass, shape, dynamics, class_type, motion, tension=0):
+        self.color = color
+        self.mass = mass
+        self.shape = shape
+        self.dynamics = dynamics
+        self.class_type = class_type
+        self.motion = motion
+        self.tension = tension
+
+        self.velocity = None
+        self.displacement = None
+        self.rotation_angle = None
+        self.motion_onset = None
+        self.motion_direction = None
+        self.rotation_direction = None
+
+def _object_bytes(objs):
+    """ Memory held by the objects: the instances, their __dict__ and the attribute values they do not share """
+    seen = set()
+    total = 0
+    for obj in objs:
+        total += sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            total += sys.getsizeof(obj.__dict__)
+        values = [getattr(obj, field) for field in ("color", "mass", "shape", "dynamics", "class_type", "motion", "tension", "name")]
+        if getattr(obj, '_kinematics', None) is not None:
+            values.append(obj._kinematics)
+        for value in values:
+            if value is None or id(value) in seen:
+                continue
+            seen.add(id(value))
+            total += sys.getsizeof(value)
+    return total
+
+def bench_memory(args):
+    """ Memory of a batch of parsed scenes (every video read args.repeat times), with ObjectPulley and the plain class it replaced """
+    all_jsons = sorted(glob.glob(os.path.join(args.input_video_ann_path, '*/outputs.json')))
+    table = PrettyTable()
+    table.field_names = ["ObjectPulley", "scenes", "objects", "bytes / object", "objects (KB)", "scenes traced (KB)"]
+    for label, cls in [("__dict__ (before)", _ObjectPulleyDict), ("__slots__ (after)", ObjectPulley)]:
+        read_file.ObjectPulley = cls
+        try:
+            tracemalloc.start()
+            sims = []
+            for _ in range(args.repeat):
+                for json_path in all_jsons:
+                    sim = SimulationPulley()
+                    if read_annotation_pulley(json_path, sim):
+                        sims.append(sim)
+            traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+        finally:
+            read_file.ObjectPulley = ObjectPulley
+        objs = [obj for sim in sims for obj in sim.objects]
+        obj_bytes = _object_bytes(objs)
+        table.add_row([label, len(sims), len(objs), f"{obj_bytes / len(objs):.0f}", f"{obj_bytes / 1024:.0f}", f"{traced / 1024:.0f}"])
+        del sims, objs
+    print(table)
+
+
+if __name__=="__main__":
+    args = build_args_parser()
+    print(args)
+    if args.bench == "read":
+        bench_read(args)
+    elif args.bench == "generate":
+        bench_generate(args)
+    elif args.bench == "shuffle":
+        bench_shuffle(args)
+    elif args.bench == "scaling":
+        bench_scaling(args)
+    elif args.bench == "memory":
+        bench_memory(args)
@@ -1,183 +1,160 @@
 import argparse
-import pdb
 import json
 import os
-import operator
-import random
-
-def get_frequence_answer(train_list):
-    ques_type_list = list(set([ele["qtype"] for ele in train_list]))
-    out_dict = {ele : {} for ele in ques_type_list}
-    for ele in train_list:
-        ans, qtype = ele["answer"], ele["qtype"]
-        tmp_dict = out_dict[qtype]
-        if ans not in tmp_dict:
-            tmp_dict[ans] = 1.0
-        else:
-            tmp_dict[ans] +=1
-        out_dict[qtype] = tmp_dict
-    out_dict_most_freq = {}
-    frequent_answer_dict, random_answer_dict = {}, {}
-    for qtype, tmp_dict in out_dict.items():
-        sorted_list = sorted(tmp_dict.items(), key=operator.itemgetter(1))
-        frequent_answer_dict[qtype] = sorted_list[-1][0]
-        random_answer_dict[qtype] = list(tmp_dict.keys())
-    return frequent_answer_dict, random_answer_dict
-    
-def eval_split(val_list, frequent_answer_dict, random_answer_dict):
-    ques_type_list = list(set([ele["qtype"] for ele in val_list]))
-    output_fre_acc_dict = {ele: 0.0 for ele in ques_type_list}
-    output_rdn_acc_dict = {ele: 0.0 for ele in ques_type_list}
-    output_total_dict = {ele: 0.0 for ele in ques_type_list}
-    for idx, ele in enumerate(val_list):
-        q_type, ans = ele["qtype"], ele["answer"]
-        output_total_dict[q_type] +=1
-        rdn_answer = random.choice(random_answer_dict[q_type])
-        fre_answer = frequent_answer_dict[q_type]
-        if rdn_answer == ans:
-            output_rdn_acc_dict[q_type] +=1  
-        if fre_answer == ans:
-            output_fre_acc_dict[q_type] +=1  
-    print("Evaluating split %s\n"%(ele["split"]))
-    key_list = ["factual", "counterfactual", "goal_driven"]
-    output_total_dict2 = {ele: 0.0 for ele in key_list}
-    output_rdn_acc_dict2 = {ele: 0.0 for ele in key_list}
-    output_fre_acc_dict2 = {ele: 0.0 for ele in key_list}
-    print("************************")
-    for key, rnd_acc in output_rdn_acc_dict.items():
-        fre_acc = output_fre_acc_dict[key]
-        total_num = output_total_dict[key]
-        print("%s: %f\n"%(key, rnd_acc/total_num))
-        print("%s: %f\n"%(key, fre_acc/total_num))
-        if "counterfactual" in key:
-            output_total_dict2["counterfactual"] +=total_num
-            output_rdn_acc_dict2["counterfactual"] += rnd_acc 
-            output_fre_acc_dict2["counterfactual"] += fre_acc 
-        elif "goal" in key:
-            output_total_dict2["goal_driven"] +=total_num
-            output_rdn_acc_dict2["goal_driven"] += rnd_acc 
-            output_fre_acc_dict2["goal_driven"] += fre_acc 
-        else:
-            output_total_dict2["factual"] +=total_num
-            output_rdn_acc_dict2["factual"] += rnd_acc 
-            output_fre_acc_dict2["factual"] += fre_acc 
-    print("************************")
-    for key, rnd_acc in output_rdn_acc_dict2.items():
-        fre_acc = output_fre_acc_dict2[key]
-        total_num = output_total_dict2[key]
-        print("random, num: %d, %s: %f\n"%(total_num, key, rnd_acc/total_num))
-        print("frequent, num: %d, %s: %f\n"%(total_num, key, fre_acc/total_num))
-
-def eval_split_v2(val_list, frequent_answer_dict, random_answer_dict, args=None):
-    ques_type_list = list(set([ele["qtype"] for ele in val_list]))
-    output_fre_acc_dict = {ele: 0.0 for ele in ques_type_list}
-    output_rdn_acc_dict = {ele: 0.0 for ele in ques_type_list}
-    output_total_dict = {ele: 0.0 for ele in ques_type_list}
-    
-    output_fre_acc_dict_opt = {ele: 0.0 for ele in ques_type_list}
-    output_rdn_acc_dict_opt = {ele: 0.0 for ele in ques_type_list}
-    output_total_dict_opt = {ele: 0.0 for ele in ques_type_list}
-    
-    for idx, ele in enumerate(val_list):
-        q_type, ans = ele["qtype"], ele["answer"]
-        output_total_dict[q_type] +=1
-        rdn_answer = random.choice(random_answer_dict[q_type])
-        fre_answer = frequent_answer_dict[q_type]
-        if rdn_answer == ans:
-            output_rdn_acc_dict[q_type] +=1  
-        if fre_answer == ans:
-            output_fre_acc_dict[q_type] +=1  
-    print("Evaluating split %s\n"%(ele["split"]))
-    key_list = ["factual", "counterfactual", "goal_driven"]
-    output_total_dict2 = {ele: 0.0 for ele in key_list}
-    output_rdn_acc_dict2 = {ele: 0.0 for ele in key_list}
-    output_fre_acc_dict2 = {ele: 0.0 for ele in key_list}
-    print("************************")
-    for key, rnd_acc in output_rdn_acc_dict.items():
-        fre_acc = output_fre_acc_dict[key]
-        total_num = output_total_dict[key]
-        if args is not None and args.print_type1: 
-            print("%s: %f\n"%(key, rnd_acc/total_num))
-            print("%s: %f\n"%(key, fre_acc/total_num))
-        
-        if "counterfactual" in key:
-            output_total_dict2["counterfactual"] +=total_num
-            output_rdn_acc_dict2["counterfactual"] += rnd_acc 
-            output_fre_acc_dict2["counterfactual"] += fre_acc 
-        elif "goal" in key:
-            output_total_dict2["goal_driven"] +=total_num
-            output_rdn_acc_dict2["goal_driven"] += rnd_acc 
-            output_fre_acc_dict2["goal_driven"] += fre_acc 
-        else:
-            output_total_dict2["factual"] +=total_num
-            output_rdn_acc_dict2["factual"] += rnd_acc 
-            output_fre_acc_dict2["factual"] += fre_acc 
-    print("************************")
-    for key, rnd_acc in output_rdn_acc_dict2.items():
-        fre_acc = output_fre_acc_dict2[key]
-        total_num = output_total_dict2[key]
-        if args is not None and args.print_type2: 
-            print("random, num: %d, %s: %f\n"%(total_num, key, rnd_acc/total_num))
-            print("frequent, num: %d, %s: %f\n"%(total_num, key, fre_acc/total_num))
-    
-    key_list = ["factual", "counterfactual", "goal_driven"]
-    ans_type_list = list(set([ele["answer_type"][0] for ele in val_list]))
-    output_total_dict3 = {ele: {ans_type: 0.0 for ans_type in ans_type_list} for ele in key_list}
-    output_rdn_acc_dict3 = {ele: {ans_type: 0.0 for ans_type in ans_type_list} for ele in key_list}
-    output_fre_acc_dict3 = {ele: {ans_type: 0.0 for ans_type in ans_type_list} for ele in key_list}
-    for idx, ele in enumerate(val_list):
-        q_type, ans, ans_type = ele["qtype"], ele["answer"], ele["answer_type"][0]
-        output_total_dict[q_type] +=1
-        rdn_answer = random.choice(random_answer_dict[q_type])
-        fre_answer = frequent_answer_dict[q_type]
-        if rdn_answer == ans:
-            if "counterfactual" in q_type:
-                output_rdn_acc_dict3["counterfactual"][ans_type] +=1 
-            elif "goal" in q_type:
-                output_rdn_acc_dict3["goal_driven"][ans_type] +=1 
-            else:
-                output_rdn_acc_dict3["factual"][ans_type] +=1 
-                 
-        if fre_answer == ans:
-            if "counterfactual" in q_type:
-                output_fre_acc_dict3["counterfactual"][ans_type] +=1 
-            elif "goal" in q_type:
-                output_fre_acc_dict3["goal_driven"][ans_type] +=1 
-            else:
-                output_fre_acc_dict3["factual"][ans_type] +=1 
-        
-        if "counterfactual" in q_type:
-            output_total_dict3["counterfactual"][ans_type] +=1 
-        elif "goal" in q_type:
-            output_total_dict3["goal_driven"][ans_type] +=1 
+import numpy as np
+
+QTYPE_GROUPS = ["factual", "counterfactual", "goal_driven"]
+
+def qtype_group(qtype):
+    if "counterfactual" in qtype:
+        return "counterfactual"
+    elif "goal" in qtype:
+        return "goal_driven"
+    return "factual"
+
+class Vocab:
+    """ str -> consecutive int codes, in order of first appearance """
+    def __init__(self):
+        self.codes = {}
+        self.words = []
+
+    def encode(self, words):
+        codes = np.empty(len(words), dtype=np.int64)
+        for i, word in enumerate(words):
+            code = self.codes.get(word)
+            if code is None:
+                code = self.codes[word] = len(self.words)
+                self.words.append(word)
+            codes[i] = code
+        return codes
+
+def encode_split(ques_list, vocabs):
+    """ Integer arrays of qtype, answer and answer_type of a split, with the vocabularies shared by all splits """
+    return {
+        "qtype": vocabs["qtype"].encode([ele["qtype"] for ele in ques_list]),
+        "answer": vocabs["answer"].encode([ele["answer"] for ele in ques_list]),
+        "answer_type": vocabs["answer_type"].encode([ele["answer_type"] for ele in ques_list]),
+    }
+
+def fit_baselines(train, num_qtype, num_answer):
+    """ Frequent answer per qtype (-1 if the qtype is not in train), and the distinct train answers per qtype as CSR arrays
+
+    Ties of the frequent answer go to the answer seen last for the first time, as with a stable sort of the counts.
+    """
+    pair = train["qtype"] * num_answer + train["answer"]
+    counts = np.bincount(pair, minlength=num_qtype * num_answer).reshape(num_qtype, num_answer)
+    first = np.full(num_qtype * num_answer, len(pair), dtype=np.int64)
+    np.minimum.at(first, pair, np.arange(len(pair)))
+    first = np.where(counts.ravel() > 0, first, -1).reshape(num_qtype, num_answer)
+    frequent = np.argmax(counts * (len(pair) + 1) + first, axis=1)
+    frequent[counts.sum(axis=1) == 0] = -1
+
+    qtypes, answers = np.nonzero(counts) # sorted by qtype
+    random_offset = np.zeros(num_qtype + 1, dtype=np.int64)
+    np.cumsum(np.bincount(qtypes, minlength=num_qtype), out=random_offset[1:])
+    return frequent, answers, random_offset
+
+def _accuracy(correct, totals):
+    return np.divide(correct, totals, out=np.zeros(np.broadcast(correct, totals).shape), where=totals > 0)
+
+def evaluate_baselines(split, frequent, random_answers, random_offset, groupings, trials=1000, seed=0):
+    """ Frequent and random baseline accuracy of a split for every grouping, in one pass
+
+    groupings: name -> (group code per question, number of groups). The random baseline picks
+    an answer uniformly among the train answers of the qtype, `trials` times per question.
+    Returns name -> per group arrays: total, frequent, random_expected and the mean / std /
+    2.5 and 97.5 percentiles of the random accuracy over the trials.
+    """
+    qtype, answer = split["qtype"], split["answer"]
+    num = len(qtype)
+    frequent_correct = (frequent[qtype] == answer).astype(np.float64)
+
+    # probability that a uniform pick among the train answers of the qtype is right
+    num_choices = random_offset[qtype + 1] - random_offset[qtype]
+    in_choices = np.zeros(num, dtype=bool)
+    for i in range(int(num_choices.max(initial=0))):
+        valid = num_choices > i
+        in_choices[valid] |= random_answers[random_offset[qtype[valid]] + i] == answer[valid]
+    random_expected = _accuracy(in_choices.astype(np.float64), num_choices)
+
+    rng = np.random.default_rng(seed)
+    random_correct = {name: np.zeros((trials, num_groups)) for name, (_, num_groups) in groupings.items()}
+    batch = max(1, 2 ** 22 // max(num, 1))
+    for t0 in range(0, trials, batch):
+        t1 = min(trials, t0 + batch)
+        pick = (rng.random((t1 - t0, num)) * num_choices).astype(np.int64)
+        if len(random_answers) == 0:
+            correct = np.zeros((t1 - t0, num), dtype=bool) # empty train split, nothing to pick from
         else:
-            output_total_dict3["factual"][ans_type] +=1 
-   
-    print("************************")
-    for key, rnd_acc_dict in output_rdn_acc_dict3.items():
-        fre_acc_dict = output_fre_acc_dict3[key]
-        total_num_dict = output_total_dict3[key]
-        for key2, rnd_acc in rnd_acc_dict.items():
-            freq_acc = fre_acc_dict[key2]
-            total_num = total_num_dict[key2]
-            if args is not None and args.print_type3 and total_num>0: 
-                print("random, num: %d, %s, %s: %f\n"%(total_num, key, key2, rnd_acc/total_num))
-                print("frequent, num: %d, %s %s: %f\n"%(total_num, key, key2,  fre_acc/total_num))
-    import pdb; pdb.set_trace()
+            correct = (num_choices > 0) & (random_answers[np.minimum(random_offset[qtype] + pick, len(random_answers) - 1)] == answer)
+        trial = np.arange(t1 - t0)[:, None]
+        for name, (group, num_groups) in groupings.items():
+            random_correct[name][t0:t1] = np.bincount((trial * num_groups + group).ravel(), weights=correct.ravel(),
+                minlength=(t1 - t0) * num_groups).reshape(t1 - t0, num_groups)
+
+    results = {}
+    for name, (group, num_groups) in groupings.items():
+        totals = np.bincount(group, minlength=num_groups).astype(np.float64)
+        random_acc = _accuracy(random_correct[name], totals)
+        results[name] = {
+            "total": totals,
+            "frequent": _accuracy(np.bincount(group, weights=frequent_correct, minlength=num_groups), totals),
+            "random_expected": _accuracy(np.bincount(group, weights=random_expected, minlength=num_groups), totals),
+            "random_mean": random_acc.mean(axis=0),
+            "random_std": random_acc.std(axis=0),
+            "random_ci_low": np.percentile(random_acc, 2.5, axis=0),
+            "random_ci_high": np.percentile(random_acc, 97.5, axis=0),
+        }
+    return results
+
+def eval_split_v3(split_name, split, vocabs, baselines, args):
+    """ Report of the baselines on a split grouped by qtype, qtype group and qtype group x answer type """
+    num_qtype, num_answer_type = len(vocabs["qtype"].words), len(vocabs["answer_type"].words)
+    qtype_to_group = np.array([QTYPE_GROUPS.index(qtype_group(qtype)) for qtype in vocabs["qtype"].words], dtype=np.int64)
+    group = qtype_to_group[split["qtype"]]
+    groupings = {
+        "qtype": (split["qtype"], num_qtype),
+        "group": (group, len(QTYPE_GROUPS)),
+        "group_answer_type": (group * num_answer_type + split["answer_type"], len(QTYPE_GROUPS) * num_answer_type),
+    }
+    labels = {
+        "qtype": list(vocabs["qtype"].words),
+        "group": QTYPE_GROUPS,
+        "group_answer_type": [f"{g}/{a}" for g in QTYPE_GROUPS for a in vocabs["answer_type"].words],
+    }
+    results = evaluate_baselines(split, *baselines, groupings, trials=args.trials, seed=args.seed)
+
+    report = {}
+    print("Evaluating split %s\n"%(split_name))
+    for name, result in results.items():
+        report[name] = {}
+        for i, label in enumerate(labels[name]):
+            if result["total"][i] == 0:
+                continue
+            report[name][label] = {k: (int(v[i]) if k == "total" else float(v[i])) for k, v in result.items()}
+            r = report[name][label]
+            if getattr(args, "print_" + {"qtype": "type1", "group": "type2", "group_answer_type": "type3"}[name]):
+                print("num: %d, %s: frequent %f, random %f (95%% CI %f-%f)" % (
+                    r["total"], label, r["frequent"], r["random_mean"], r["random_ci_low"], r["random_ci_high"]))
+    return report
 
 def frequent_performer(args):
     base_dir = args.base_dir
-    train_split_path = os.path.join(base_dir, args.video_type + "_train_"+args.out_id+".json")
-    val_split_path = os.path.join(base_dir, args.video_type + "_val_"+args.out_id+".json")
-    test_split_path = os.path.join(base_dir, args.video_type + "_test_"+args.out_id+".json")
-    train_list = json.load(open(train_split_path))
-    val_list = json.load(open(val_split_path))
-    test_list = json.load(open(test_split_path))
-    frequent_answer_dict, random_answer_dict = get_frequence_answer(train_list)
-   
-
-    eval_split_v2(val_list, frequent_answer_dict, random_answer_dict, args)
-    eval_split_v2(test_list, frequent_answer_dict, random_answer_dict, args)
+    split_lists = {}
+    for split in ["train", "val", "test"]:
+        with open(os.path.join(base_dir, args.video_type + "_"+split+"_"+args.out_id+".json")) as f:
+            split_lists[split] = json.load(f)
+
+    vocabs = {"qtype": Vocab(), "answer": Vocab(), "answer_type": Vocab()}
+    splits = {split: encode_split(ques_list, vocabs) for split, ques_list in split_lists.items()}
+    baselines = fit_baselines(splits["train"], len(vocabs["qtype"].words), len(vocabs["answer"].words))
+
+    report = {"trials": args.trials, "seed": args.seed}
+    for split in ["val", "test"]:
+        report[split] = eval_split_v3(split, splits[split], vocabs, baselines, args)
+    if args.report_path:
+        with open(args.report_path, 'w') as f:
+            json.dump(report, f, indent=4)
 
 def build_args_parser():
     parser = argparse.ArgumentParser()
@@ -192,6 +169,9 @@ def build_args_parser():
     parser.add_argument('--print_type1', action='store_true')
     parser.add_argument('--print_type2', action='store_true')
     parser.add_argument('--print_type3', action='store_true')
+    parser.add_argument("--trials", type=int, default=1000, help="Number of random baseline trials, for the confidence intervals")
+    parser.add_argument("--seed", type=int, default=0, help="")
+    parser.add_argument("--report_path", type=str, default="", help="Dump the baseline report to this json file")
     args = parser.parse_args()
     return args
 
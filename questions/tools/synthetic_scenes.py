@@ -0,0 +1,186 @@
+""" Synthetic pulley scenes for the scaling benchmarks
+
+Writes <output_dir>/<video_id>/outputs.json files in the format of the simulator, with the
+sections read by read_annotation_pulley (outputMass, relatedGroups, relatedGroupsInRope,
+ResultTension, CounterFactualAnnotations) and a perFrameAnnotations of bounding boxes, so
+that the reader has a realistic amount of data to skip.
+
+Every rope is a chain  end, rope, pulley, rope, pulley, ..., rope, end  whose ends are the
+loads or fixed points, a load next to a dynamic pulley hangs from it. The pulleys, loads
+and counterfactual annotations are spread over the ropes in turn.
+
+    python tools/synthetic_scenes.py --output_dir /tmp/synthetic --videos 20 --ropes 4 --pulleys 8 --loads 6 --counterfactuals 10
+"""
+
+import os
+import json
+import random
+import argparse
+
+COLORS = ['Black', 'Orange', 'Yellow', 'Brown', 'Purple', 'Cyan', 'Gray', 'Red', 'White', 'Pink', 'Blue', 'Green']
+LOAD_SHAPES = ['Cube', 'Sphere']
+PULLEY_FILLS = ['Solid', 'Hollow']
+# masses that read_annotation_pulley rounds back to themselves
+MASSES = [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5]
+
+MAX_ROPES = len(COLORS)
+MAX_LOADS = len(COLORS) * len(LOAD_SHAPES)
+MAX_PULLEYS = len(COLORS) * len(PULLEY_FILLS) * 2
+
+
+def make_scene(num_ropes, num_pulleys, num_loads, num_counterfactuals, num_frames=150, dynamic_ratio=0.3, rng=random):
+    """ The content of a synthetic outputs.json
+
+    Object names are unique at the level read_annotation_pulley works at: a rope per color,
+    a load per (color, shape) and a pulley per (color, fill, dynamics). The fixed points are
+    shared between the ropes when there are more rope ends than colors.
+    """
+    if not 1 <= num_ropes <= MAX_ROPES:
+        raise ValueError(f"num_ropes must be in [1, {MAX_ROPES}]")
+    if not 0 <= num_loads <= min(MAX_LOADS, 2 * num_ropes):
+        raise ValueError(f"num_loads must be in [0, {min(MAX_LOADS, 2 * num_ropes)}] with {num_ropes} ropes")
+    if not 0 <= num_pulleys <= MAX_PULLEYS:
+        raise ValueError(f"num_pulleys must be in [0, {MAX_PULLEYS}]")
+
+    ropes = [f'{color} Rope' for color in rng.sample(COLORS, num_ropes)]
+    loads = [f'{color} {shape}' for color, shape in rng.sample([(c, s) for c in COLORS for s in LOAD_SHAPES], num_loads)]
+    free = {d: rng.sample([(c, f) for c in COLORS for f in PULLEY_FILLS], len(COLORS) * len(PULLEY_FILLS)) for d in ['Static', 'Dynamic']}
+    cells = rng.sample([(i, j) for i in range(8) for j in range(8)], num_pulleys)
+    pulleys = []
+    for i, j in cells:
+        dyn = 'Dynamic' if rng.random() < dynamic_ratio else 'Static'
+        if not free[dyn]:
+            dyn = 'Static' if dyn == 'Dynamic' else 'Dynamic'
+        color, fill = free[dyn].pop()
+        pulleys.append(f'{color} {fill} {dyn} Pulley ({i} {j})')
+    fixed_colors = rng.sample(COLORS, len(COLORS))
+
+    # ends: load k goes to rope k % num_ropes, first end then second end
+    ends = [[None, None] for _ in ropes]
+    for k, load in enumerate(loads):
+        ends[k % num_ropes][k // num_ropes] = load
+    num_fixed = 0
+    for rope_ends in ends:
+        for side in range(2):
+            if rope_ends[side] is None:
+                rope_ends[side] = f'{fixed_colors[num_fixed % len(fixed_colors)]} Fixed Point'
+                num_fixed += 1
+
+    chains = []
+    for r, rope in enumerate(ropes):
+        chain = [ends[r][0]]
+        for pulley in pulleys[r::num_ropes]:
+            chain += [rope, pulley]
+        chain += [rope, ends[r][1]]
+        chains.append(chain)
+
+    fixed_points = sorted({name for rope_ends in ends for name in rope_ends if name.endswith('Fixed Point')})
+    movable = pulleys + loads + fixed_points
+
+    def results():
+        return (
+            {p: rng.choice([-1, 0, 1]) for p in pulleys},
+            {name: (rng.choice([-1, 0, 1]) if not name.endswith('Fixed Point') else 0) for name in movable},
+        )
+
+    tension, tension_avg = {}, {}
+    for rope, chain in zip(ropes, chains):
+        base = -rng.uniform(0.5, 5.0)
+        stops = chain[::2]
+        tension[rope] = {f'({a}, {b})': round(base - 1e-5 * i, 8) for i, (a, b) in enumerate(zip(stops, stops[1:]))}
+        tension_avg[rope] = round(sum(tension[rope].values()) / len(tension[rope]), 8)
+
+    masses = {load: rng.choice(MASSES) for load in loads}
+    camera = {"Main Camera": {"position": [-7.45587063, -1.51208258, -43.0518341], "rotation": [348.4731, 346.7676, 0.0], "fov": [40.14217], "mirrored": 1}}
+    counterfactuals = {}
+    for n in range(num_counterfactuals):
+        annotation = {"outputMass": masses, "outputCamera": camera}
+        if loads and n % 2 == 0:
+            target = loads[(n // 2) % len(loads)]
+            mass = masses[target]
+            for side, after in enumerate([round(mass - 0.05, 2), round(mass + 0.05, 2)]):
+                rotation, motion = results()
+                annotation[str(side)] = {
+                    "mode": "COUNTERFACTUAL_change_one_object_mass",
+                    "TargetObj_Name": target,
+                    "TargetObj_Mass_Before_After": {"Item1": mass, "Item2": after},
+                    "ResultRotation": rotation, "ResultMotion": motion,
+                }
+        else:
+            target = rng.choice(movable)
+            for side, direction in enumerate(rng.sample(['up', 'down'], 2)):
+                rotation, motion = results()
+                annotation[str(side)] = {
+                    "mode": "COUNTERFACTUAL_pull_object_up_or_down",
+                    "TargetMovingAgent": {"name": target, "direction": direction, "onAllStaticRope": "False"},
+                    "ResultRotation": rotation, "ResultMotion": motion,
+                }
+        counterfactuals[str(n)] = annotation
+
+    rotation, motion = results()
+    instances = {i + 1: name for i, name in enumerate(ropes + pulleys + loads + fixed_points)}
+    return {
+        "validity": True,
+        "mode": "FACTUAL_PREDICTIVE_set_random_mass",
+        "relatedGroups": chains,
+        "relatedGroupsInRope": [{rope: chain} for rope, chain in zip(ropes, chains)],
+        "ResultRotation": rotation,
+        "ResultMotion": motion,
+        "ResultTension": tension,
+        "ResultTensionAvg": tension_avg,
+        "PredictiveEventType": {rope: "None" for rope in ropes},
+        "PredictiveEventPulleyName": {rope: "None" for rope in ropes},
+        "outputMass": masses,
+        "outputCamera": camera,
+        "imgAnnotationDescriptions": {
+            "perFrameAnnotations": {str(frame): _frame_annotation(frame, instances, rng) for frame in range(1, num_frames + 1)},
+            "Id2ObjectNameDict": {str(i): name for i, name in instances.items()},
+        },
+        "CounterFactualAnnotations": counterfactuals,
+    }
+
+def _frame_annotation(frame, instances, rng):
+    boxes = [{
+        "instanceId": i, "labelId": i, "labelName": name,
+        "origin": [float(rng.randrange(1800)), float(rng.randrange(1000))],
+        "dimension": [float(rng.randrange(20, 300)), float(rng.randrange(20, 300))],
+    } for i, name in instances.items()]
+    return [{
+        "@type": "type.unity.com/unity.solo.RGBCamera", "id": "camera", "filename": f"step{frame}.camera.png",
+        "dimension": [1920.0, 1080.0],
+        "annotations": [{"@type": "type.unity.com/unity.solo.BoundingBox2DAnnotation", "id": "bounding box", "sensorId": "camera", "values": boxes}],
+    }]
+
+def write_scenes(output_dir, num_videos, seed=0, **scene_kwargs):
+    """ Write num_videos scenes to <output_dir>/<video_id>/outputs.json, return their paths """
+    rng = random.Random(seed)
+    paths = []
+    for video_id in range(num_videos):
+        video_dir = os.path.join(output_dir, str(video_id))
+        os.makedirs(video_dir, exist_ok=True)
+        path = os.path.join(video_dir, 'outputs.json')
+        with open(path, 'w') as f:
+            json.dump(make_scene(rng=rng, **scene_kwargs), f, indent=4)
+        paths.append(path)
+    return paths
+
+
+def build_args_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_dir", type=str, required=True, help="")
+    parser.add_argument("--videos", type=int, default=20, help="")
+    parser.add_argument("--ropes", type=int, default=2, help="")
+    parser.add_argument("--pulleys", type=int, default=4, help="")
+    parser.add_argument("--loads", type=int, default=3, help="")
+    parser.add_argument("--counterfactuals", type=int, default=5, help="")
+    parser.add_argument("--frames", type=int, default=150, help="Number of frames of bounding boxes")
+    parser.add_argument("--dynamic_ratio", type=float, default=0.3, help="Share of dynamic pulleys")
+    parser.add_argument("--seed", type=int, default=0, help="")
+    args = parser.parse_args()
+    return args
+
+if __name__=="__main__":
+    args = build_args_parser()
+    paths = write_scenes(args.output_dir, args.videos, args.seed, num_ropes=args.ropes, num_pulleys=args.pulleys, num_loads=args.loads,
+                         num_counterfactuals=args.counterfactuals, num_frames=args.frames, dynamic_ratio=args.dynamic_ratio)
+    print(f"wrote {len(paths)} scenes to {args.output_dir}")
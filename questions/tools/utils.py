@@ -3,8 +3,16 @@ import os
 import argparse
 import random
 import re
+import sys
 from prettytable import PrettyTable
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from question_store import QuestionStore
+
+
+def video_rng(seed, video_id):
+    """ Random generator of the sampling of one video, independent of the other videos and of the file order """
+    return random.Random(f'{seed}-sample-{video_id}')
 
 def build_args_parser():
     parser = argparse.ArgumentParser()
@@ -15,6 +23,7 @@ def build_args_parser():
     parser.add_argument("--merge_ques_path", type=str, default="output/merge/merge.json", help="")
     parser.add_argument('--debug', action='store_true')
     parser.add_argument("--out_id", type=str, default="v1", help="")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed of the per video samplers")
     parser.add_argument("--analysis", type=str, default="", help="analysis of different scenes, pulley/fire/cloth/fluid")
     args = parser.parse_args()
     return args
@@ -73,39 +82,6 @@ def run_question_sampler_v1(args):
     with open(args.merge_ques_path, 'w') as f:
         json.dump(sample_out_list, f)
 
-def split_dataset(args):
-    full_ann_list = json.load(open(args.merge_ques_path))
-    base_dir = os.path.dirname(args.merge_ques_path)
-    split_list = ["train", "val", "test"]
-    split_ratio = {"train": 0.5, "val": 0.2, "test": 0.3}
-    
-    vid_list = list(set([ele["video_id"] for ele in full_ann_list]))
-    vid_2_ques_list = {vid: [] for vid in vid_list}
-    for ele in full_ann_list:
-        vid_2_ques_list[ele["video_id"]].append(ele)
-    # sort vid_list
-    vid_list = [int(id) for id in vid_list]
-    vid_list.sort()
-    vid_list = [str(id) for id in vid_list]
-
-    st_ratio, ed_ratio = 0.0, 0.0
-    for split, ratio in split_ratio.items():
-        ques_list = []
-        ed_ratio = st_ratio + ratio
-        st_id, ed_id = int(len(vid_list)*st_ratio), int(len(vid_list)*ed_ratio) 
-        print("start: %d, end: %d, split: %s"%(st_id, ed_id, split))
-        for vid in vid_list[st_id:ed_id]:
-            tmp_list = vid_2_ques_list[vid]
-            for idx, ele in enumerate(tmp_list):
-                ele["split"] = split
-            ques_list +=tmp_list
-        output_file_path = os.path.join(base_dir, args.video_type + "_"+split+"_"+args.out_id+".json")
-        with open(output_file_path, 'w') as f:
-            json.dump(ques_list, f)
-        st_ratio = ed_ratio 
-        if args.analysis:
-            simple_analysis(ques_list, split)
-
 def sample_list_based_onanswer(qa_list):
     ans_list = list(set([ele["answer"] for ele in qa_list ]))
     ans2qlist = {ele: [] for ele in ans_list }
@@ -193,47 +169,84 @@ def run_question_sampler_v2(args):
         json.dump(sample_out_list, f)
 
 
+PULLEY_TEMPLATES = {
+    'mass0': r"The mass of the (.+?) is ((?!not).+?) the mass of the (.+?)\.",
+    'mass1': r"The mass of the (.+?) is not (.+?)the mass of the (.+?)\.",
+    'mass2': r"It is impossible to determine the relationship between the masses of the (.+?) and the (.+?) based on the information given\.",
+    'mass3': r"It is possible to determine the relationship between the masses of the (.+?) and the (.+?) based on the information given\.",
+    "tension0": r"The average tension of the (.+?) is ((?!not).+?) the average tension of the (.+?)\.",
+    "tension1": r"The average tension of the (.+?) is not (.+?)the average tension of the (.+?)\.",
+    "tension2": r"It is impossible to determine the relationship between the average tension of the (.+?) and the (.+?) based on the information given\.",
+    "tension3": r"It is possible to determine the relationship between the average tension of the (.+?) and the (.+?) based on the information given\.",
+    "shape_number": r"The number of (.+?)s in the video is (.+?)\.",
+    "color_number": r"The number of (.+?) objects in the video is (.+?)\.",
+    "color_shape0": r"There exists a (.+?) in the video\.",
+    "color_shape1": r"There does not exist a (.+?) in the video\.",
+    "counterfactual_pull": r"If we pull the (.+?), (.+?)", 
+    "counterfactual_mass": r"If we (.+?) the mass of the (.+?), (.+?)", 
+    "goal_pull": r"Pull the (.+?)\.",
+    "goal_mass": r"(Increase|Decrease) the mass of (.+?)\.",
+}
+# a match of these templates is dropped when the check on the match is true
+PULLEY_TEMPLATE_EXCLUDES = {
+    "shape_number": lambda match: 'object' in match[1], # it not belongs to shape number
+}
+
+class TemplateMatcher:
+    """ Classify strings against a set of regex templates, compiled once
+
+    The templates are dispatched on their leading literal words: a string is only matched
+    against the templates whose literal prefix it starts with (plus the ones without a literal
+    prefix), and against all of them so that ambiguous strings are detected.
+    """
+    def __init__(self, templates, excludes=None):
+        self.excludes = excludes or {}
+        self.buckets = {}
+        for order, (key, pattern) in enumerate(templates.items()):
+            prefix = re.match(r"[^()\[\].?*+\\|{}^$]*", pattern)[0]
+            self.buckets.setdefault(prefix.split(' ', 1)[0], []).append((order, key, prefix, re.compile(pattern)))
+        self.no_prefix = self.buckets.pop('', [])
+
+    def match_keys(self, choice):
+        """ All the templates matching `choice`, in template order """
+        matches = []
+        for order, key, prefix, regex in self.buckets.get(choice.split(' ', 1)[0], []) + self.no_prefix:
+            if not choice.startswith(prefix):
+                continue
+            match = regex.match(choice)
+            if match and not (key in self.excludes and self.excludes[key](match)):
+                matches.append((order, key))
+        # the templates without a literal prefix are tried last, put them back in their place
+        return [key for _, key in sorted(matches)]
+
+    def classify(self, choices):
+        """ Return (keys, diagnostics)
+
+        keys[i] is the first template matching choices[i], None if there is none. diagnostics lists
+        the unmatched and ambiguous choices as {"index", "choice", "matches"} instead of stopping.
+        """
+        keys, diagnostics = [], []
+        for idx, choice in enumerate(choices):
+            match_keys = self.match_keys(choice)
+            if len(match_keys) != 1:
+                diagnostics.append({"index": idx, "choice": choice, "matches": match_keys})
+            keys.append(match_keys[0] if match_keys else None)
+        return keys, diagnostics
+
+PULLEY_MATCHER = TemplateMatcher(PULLEY_TEMPLATES, PULLEY_TEMPLATE_EXCLUDES)
+
 def pulley_analysis(choices, answers):
-    colors: set(["red", "cyan", "blue", "green", "yellow", "purple", "orange", "pink", "brown", "black", "white", "gray", "turquoise", "magenta", "lime", "teal", "lavender"])
-    shapes = set(["cube", "rope", "sphere", "fixed point", "solid pulley", "triple-rod pulley"]) 
-    template = {
-        'mass0': r"The mass of the (.+?) is ((?!not).+?) the mass of the (.+?)\.",
-        'mass1': r"The mass of the (.+?) is not (.+?)the mass of the (.+?)\.",
-        'mass2': r"It is impossible to determine the relationship between the masses of the (.+?) and the (.+?) based on the information given\.",
-        'mass3': r"It is possible to determine the relationship between the masses of the (.+?) and the (.+?) based on the information given\.",
-        "tension0": r"The average tension of the (.+?) is ((?!not).+?) the average tension of the (.+?)\.",
-        "tension1": r"The average tension of the (.+?) is not (.+?)the average tension of the (.+?)\.",
-        "tension2": r"It is impossible to determine the relationship between the average tension of the (.+?) and the (.+?) based on the information given\.",
-        "tension3": r"It is possible to determine the relationship between the average tension of the (.+?) and the (.+?) based on the information given\.",
-        "shape_number": r"The number of (.+?)s in the video is (.+?)\.",
-        "color_number": r"The number of (.+?) objects in the video is (.+?)\.",
-        "color_shape0": r"There exists a (.+?) in the video\.",
-        "color_shape1": r"There does not exist a (.+?) in the video\.",
-        "counterfactual_pull": r"If we pull the (.+?), (.+?)", 
-        "counterfactual_mass": r"If we (.+?) the mass of the (.+?), (.+?)", 
-        "goal_pull": r"Pull the (.+?)\.",
-        "goal_mass": r"(Increase|Decrease) the mass of (.+?)\.",
-    }
+    """ Count the right / wrong answers per template, return the diagnostics of the unmatched and ambiguous choices """
     df_dict0 = {}
 
-    all_matches = []
-    for choice in choices:
-        match_key_list = []
-        for k, v in template.items():
-            if re.match(v, choice):
-                if k == 'shape_number' and 'object' in re.match(v, choice)[1]:
-                    continue # it not belongs to shape number
-                match_key_list.append(k)
-    
-        if len(match_key_list) == 0 or len(match_key_list) > 1:
-            print(choice)
-            print(match_key_list)
-            breakpoint()
-
-        match_key = match_key_list[0]
-        all_matches.append(match_key)
+    all_matches, diagnostics = PULLEY_MATCHER.classify(choices)
+    if diagnostics:
+        num_unmatched = sum(len(diag["matches"]) == 0 for diag in diagnostics)
+        print("unmatched choices: %d, ambiguous choices: %d" % (num_unmatched, len(diagnostics) - num_unmatched))
 
     for match_key, ans in zip(all_matches, answers):
+        if match_key is None:
+            continue
         if match_key not in df_dict0:
             df_dict0[match_key] = [0, 0, 0] #  answer_right, answer_wrong, all
         if ans:
@@ -278,7 +291,7 @@ def pulley_analysis(choices, answers):
 
     print(table)
 
-    return    
+    return diagnostics
 
 def simple_analysis(data, dataset_name):
     ana_dict = {}
@@ -287,7 +300,9 @@ def simple_analysis(data, dataset_name):
             ana_dict[ele['question_family']] = 1
         else:
             ana_dict[ele['question_family']] += 1
+    print_family_counts(ana_dict, dataset_name)
 
+def print_family_counts(ana_dict, dataset_name):
     table = PrettyTable()
     table.field_names = ["template", dataset_name]
     for k, v in ana_dict.items():
@@ -295,77 +310,164 @@ def simple_analysis(data, dataset_name):
 
     print(table)
 
-def run_question_sampler_v3(args):
-    out_dir = os.path.join(args.output_ques_ann_path, args.video_type)
-    fn_list = [fn for fn in os.listdir(out_dir) if fn.endswith("json")]
-
-    sample_out_list = []
-    for idx, fn in enumerate(fn_list):
-        full_path = os.path.join(out_dir, fn)
-        ann_dict = json.load(open(full_path))
-       
-        if args.debug and idx > 10:
-            break
+SPLIT_RATIO = {"train": 0.5, "val": 0.2, "test": 0.3}
+
+def list_video_ids(out_dir):
+    """ Ids of the generated videos, in numerical order, other files of the directory are ignored """
+    store_dir = os.path.join(out_dir, "store")
+    if os.path.isdir(store_dir):
+        video_ids = QuestionStore(store_dir).index().keys()
+    else:
+        video_ids = [fn[:-len(".json")] for fn in os.listdir(out_dir) if fn.endswith(".json") and fn[:-len(".json")].isdigit()]
+    return sorted(video_ids, key=int)
+
+def iter_question_files(out_dir, video_ids=None):
+    """ Yield the generated {"video_id", "question_dict"} of every video, one video at a time
+
+    Reads the jsonl store of agent_pulley_dev.py (--output_format jsonl) when there is one,
+    otherwise the per-video json files.
+    """
+    if video_ids is None:
+        video_ids = list_video_ids(out_dir)
+    store_dir = os.path.join(out_dir, "store")
+    if os.path.isdir(store_dir):
+        yield from QuestionStore(store_dir).records(video_ids)
+        return
+    for video_id in video_ids:
+        with open(os.path.join(out_dir, f"{video_id}.json")) as f:
+            yield json.load(f)
+
+def assign_splits(video_ids, split_ratio=SPLIT_RATIO):
+    """ video_id -> split, contiguous ranges of the numerically sorted ids in the proportions of split_ratio """
+    vid_list = sorted(video_ids, key=int)
+    vid_2_split = {}
+    st_ratio, ed_ratio = 0.0, 0.0
+    for split, ratio in split_ratio.items():
+        ed_ratio = st_ratio + ratio
+        st_id, ed_id = int(len(vid_list)*st_ratio), int(len(vid_list)*ed_ratio)
+        print("start: %d, end: %d, split: %s"%(st_id, ed_id, split))
+        for vid in vid_list[st_id:ed_id]:
+            vid_2_split[vid] = split
+        st_ratio = ed_ratio
+    return vid_2_split
+
+class JsonListWriter:
+    """ Write a json list one element at a time, the file is the same as json.dump of the whole list """
+    def __init__(self, path):
+        self.f = open(path, 'w')
+        self.f.write('[')
+        self.count = 0
+
+    def write(self, ele):
+        if self.count:
+            self.f.write(', ')
+        json.dump(ele, self.f)
+        self.count += 1
+
+    def close(self):
+        self.f.write(']')
+        self.f.close()
+
+def sample_video_questions(ann_dict, args):
+    """ Sample the factual and counterfactual questions of one video """
+    rng = video_rng(args.seed, ann_dict["video_id"]) if args.seed is not None else random
+    
+    count_keys = [key for key in ann_dict["question_dict"].keys() if "counterfact" in key or "goal" in key or "predict" in key] # counterfactual, goal_drivem
+    fact_keys = [key for key in ann_dict["question_dict"].keys() if key not in count_keys] # factual, predictive
+    count_list, fact_list = [], []
+    count_type_list, fact_type_list = [], []
+
+    for qtype, qa_list in ann_dict["question_dict"].items(): 
+        for idx, ele in enumerate(qa_list):
+            ele["qtype"] = qtype
+            ele["video_id"] = ann_dict["video_id"]
+            qa_list[idx] = ele
+        if len(qa_list)==0:
+            continue
         
-        count_keys = [key for key in ann_dict["question_dict"].keys() if "counterfact" in key or "goal" in key or "predict" in key] # counterfactual, goal_drivem
-        fact_keys = [key for key in ann_dict["question_dict"].keys() if key not in count_keys] # factual, predictive
-        count_list, fact_list = [], []
-        count_type_list, fact_type_list = [], []
-
-        for qtype, qa_list in ann_dict["question_dict"].items(): 
-            for idx, ele in enumerate(qa_list):
-                ele["qtype"] = qtype
-                ele["video_id"] = ann_dict["video_id"]
-                qa_list[idx] = ele
-            if len(qa_list)==0:
-                continue
-            
-            if qtype in count_keys:
-                count_list +=qa_list
-                #Use answer to sample
-                #sub_qa_list = sample_list_based_onanswer(qa_list)
-                # sub_qa_list = sample_list_based_on_answertext(qa_list)
-                count_type_list.append(random.choice(qa_list))
-            else:
-                fact_list +=qa_list
-                #Use answer to sample
-                #sub_qa_list = sample_list_based_onanswer(qa_list)
-                # sub_qa_list = sample_list_based_on_answertext(qa_list)
-                fact_type_list.append(random.choice(qa_list))
-        if len(count_type_list) >= args.count_ques_num: # TODO: change into each key choice 1 as we only has four keys
-            count_smp_list = random.sample(count_type_list, args.count_ques_num)
+        if qtype in count_keys:
+            count_list +=qa_list
+            #Use answer to sample
+            #sub_qa_list = sample_list_based_onanswer(qa_list)
+            # sub_qa_list = sample_list_based_on_answertext(qa_list)
+            count_type_list.append(rng.choice(qa_list))
         else:
-            smp_num = min(len(count_list), args.count_ques_num - len(count_type_list))
-            count_smp_list = count_type_list + random.sample(count_list, smp_num)
-
-        if len(fact_type_list) >= args.fact_ques_num:
-            fact_smp_list = random.sample(fact_type_list, args.fact_ques_num)
-        else:
-            smp_num = min(len(fact_list), args.fact_ques_num - len(fact_type_list))
-            fact_smp_list = fact_type_list + random.sample(fact_list, smp_num)
-
-        sample_out_list +=fact_smp_list
-        sample_out_list +=count_smp_list
-
-    # add question_id
-    for idx, ele in enumerate(sample_out_list):
-        ele["question_id"] = '{:0>5d}'.format(idx)
-        if ele["answer"] == "No answer.":
-            ele["positive"] = []
-
+            fact_list +=qa_list
+            #Use answer to sample
+            #sub_qa_list = sample_list_based_onanswer(qa_list)
+            # sub_qa_list = sample_list_based_on_answertext(qa_list)
+            fact_type_list.append(rng.choice(qa_list))
+    if len(count_type_list) >= args.count_ques_num: # TODO: change into each key choice 1 as we only has four keys
+        count_smp_list = rng.sample(count_type_list, args.count_ques_num)
+    else:
+        smp_num = min(len(count_list), args.count_ques_num - len(count_type_list))
+        count_smp_list = count_type_list + rng.sample(count_list, smp_num)
+
+    if len(fact_type_list) >= args.fact_ques_num:
+        fact_smp_list = rng.sample(fact_type_list, args.fact_ques_num)
+    else:
+        smp_num = min(len(fact_list), args.fact_ques_num - len(fact_type_list))
+        fact_smp_list = fact_type_list + rng.sample(fact_list, smp_num)
+
+    return fact_smp_list + count_smp_list
+
+def run_sample_and_split(args):
+    """ Sample the questions of every video into merge.json, then split them by video into the train / val / test files
+
+    The sampled questions are appended to merge.json as soon as a video is sampled, and spilled
+    to a temporary jsonl file next to it. The splits are contiguous ranges of the numerically
+    sorted ids of the videos that got at least one sampled question, so they are assigned after
+    the sampling pass, and a second pass streams the spilled questions to their split file.
+    Only the questions of one video are in memory at a time.
+    """
+    out_dir = os.path.join(args.output_ques_ann_path, args.video_type)
     base_dir = os.path.dirname(args.merge_ques_path)
     if not os.path.isdir(base_dir):
         os.makedirs(base_dir)
-    with open(args.merge_ques_path, 'w') as f:
-        json.dump(sample_out_list, f)
 
-    # TODO: implement cloth/fluid/fire
+    merge_writer = JsonListWriter(args.merge_ques_path)
+    spill_path = f'{args.merge_ques_path}.{os.getpid()}.jsonl'
+    sampled_ids = []
+    family_counts = {split: {} for split in ["All Num"] + list(SPLIT_RATIO)}
+    try:
+        with open(spill_path, 'w') as spill:
+            for idx, ann_dict in enumerate(iter_question_files(out_dir)):
+                if args.debug and idx > 10:
+                    break
+                sampled = sample_video_questions(ann_dict, args)
+                if sampled:
+                    sampled_ids.append(ann_dict["video_id"])
+                for ele in sampled:
+                    ele["question_id"] = '{:0>5d}'.format(merge_writer.count)
+                    if ele["answer"] == "No answer.":
+                        ele["positive"] = []
+                    merge_writer.write(ele)
+                    spill.write(json.dumps(ele) + '\n')
+                    family_counts["All Num"][ele['question_family']] = family_counts["All Num"].get(ele['question_family'], 0) + 1
+        merge_writer.close()
+
+        vid_2_split = assign_splits(sampled_ids)
+        split_writers = {split: JsonListWriter(os.path.join(base_dir, args.video_type + "_"+split+"_"+args.out_id+".json")) for split in SPLIT_RATIO}
+        with open(spill_path, 'r') as spill:
+            for line in spill:
+                ele = json.loads(line)
+                split = vid_2_split.get(ele["video_id"])
+                if split is None:
+                    continue # left out by the rounding of the ratios
+                ele["split"] = split
+                split_writers[split].write(ele)
+                family_counts[split][ele['question_family']] = family_counts[split].get(ele['question_family'], 0) + 1
+        for writer in split_writers.values():
+            writer.close()
+    finally:
+        if os.path.exists(spill_path):
+            os.remove(spill_path)
     if args.analysis:
-        simple_analysis(sample_out_list, 'All Num')
+        for name, ana_dict in family_counts.items():
+            print_family_counts(ana_dict, name)
 
 if __name__=="__main__":
     args = build_args_parser()
     print(args)
     # run_question_sampler_v2(args)
-    run_question_sampler_v3(args)
-    split_dataset(args)
\ No newline at end of file
+    run_sample_and_split(args)
\ No newline at end of file
@@ -0,0 +1,251 @@
+""" File based work queue to share the generation between processes or hosts
+
+The videos are split into shards by a hash of their id, so every process computes the same
+split. A shared directory holds the state of the queue:
+  plan.json              {"num_shards": N, "shards": {"<shard>": [video_id, ...]}}, written once
+  shard-<k>.lock         claim of shard k, {"owner": ..., "token": ...}, its mtime is the heartbeat
+  shard-<k>.done         report of shard k, {"owner": ..., "videos": {...}, "manifest": {...}}
+A process claims a shard by creating its lock file (O_EXCL), touches it while it works on it
+and writes the report when done. A lock that was not touched for `timeout` seconds belongs to
+a stalled process, it is taken over by the next process looking for work. Creating the report
+is exclusive as well, so each shard is reported exactly once even if two processes ended up
+working on it; merge then checks that every video was reported exactly once.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+
+
+def shard_of(video_id, num_shards):
+    """ Shard of a video, stable across processes and hosts (unlike hash()) """
+    return int(hashlib.sha1(str(video_id).encode()).hexdigest(), 16) % num_shards
+
+def default_owner():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+def _write_exclusive(path, content):
+    """ Create `path` with `content`, False if it already exists """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        json.dump(content, f)
+    return True
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None # gone, or being written
+
+
+class ShardQueue:
+    def __init__(self, root, num_shards, timeout=300, owner=None):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.num_shards = num_shards
+        self.timeout = timeout
+        self.owner = owner or default_owner()
+        self.tokens = {} # shard -> token of our claim
+
+    def _lock_path(self, shard):
+        return os.path.join(self.root, f'shard-{shard}.lock')
+
+    def _done_path(self, shard):
+        return os.path.join(self.root, f'shard-{shard}.done')
+
+    def plan(self, video_ids):
+        """ Split the videos into shards, or load the split of the processes that started first
+
+        Return shard -> [video_id]. All the processes must see the same videos and number of shards.
+        """
+        shards = {str(k): [] for k in range(self.num_shards)}
+        for video_id in sorted(video_ids):
+            shards[str(shard_of(video_id, self.num_shards))].append(video_id)
+        path = os.path.join(self.root, 'plan.json')
+        tmp_path = f'{path}.{self.owner}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"num_shards": self.num_shards, "shards": shards}, f)
+        try:
+            os.link(tmp_path, path) # exclusive, unlike os.replace
+        except FileExistsError:
+            existing = _read_json(path)
+            if existing != {"num_shards": self.num_shards, "shards": shards}:
+                raise ValueError(f"{path} was made for other videos or another number of shards")
+        finally:
+            os.remove(tmp_path)
+        return {int(k): v for k, v in shards.items()}
+
+    def claim(self):
+        """ Claim a shard that is neither done nor held by a live process, None when there is none left """
+        # start at a different shard in every process to avoid contending for the same locks
+        start = int(hashlib.sha1(self.owner.encode()).hexdigest(), 16) % self.num_shards
+        for shard in [(start + i) % self.num_shards for i in range(self.num_shards)]:
+            if os.path.exists(self._done_path(shard)):
+                continue
+            token = uuid.uuid4().hex
+            if _write_exclusive(self._lock_path(shard), {"owner": self.owner, "token": token}) or \
+                    (self._take_over(shard) and _write_exclusive(self._lock_path(shard), {"owner": self.owner, "token": token})):
+                if os.path.exists(self._done_path(shard)):
+                    # finished between our check and our claim
+                    self._release(shard, token)
+                    continue
+                self.tokens[shard] = token
+                return shard
+        return None
+
+    def wait_claim(self, poll=None):
+        """ Claim a shard, waiting while the remaining ones are held by other processes, None once every shard is done
+
+        A held shard is either reported by its owner or, if the owner stalled, taken over once its
+        lock is older than `timeout`, so a process only leaves when the whole run is done.
+        """
+        poll = poll or min(30, self.timeout / 4)
+        while (shard := self.claim()) is None:
+            if self.done():
+                return None
+            time.sleep(poll)
+        return shard
+
+    def done(self):
+        """ Whether every shard was reported """
+        return all(os.path.exists(self._done_path(shard)) for shard in range(self.num_shards))
+
+    def _take_over(self, shard):
+        """ Remove the lock of a stalled process, True if the lock is gone """
+        lock_path = self._lock_path(shard)
+        try:
+            if time.time() - os.stat(lock_path).st_mtime < self.timeout:
+                return False
+        except FileNotFoundError:
+            return True
+        stale = _read_json(lock_path)
+        moved_path = f'{lock_path}.{uuid.uuid4().hex}.stale'
+        try:
+            os.rename(lock_path, moved_path) # only one of the processes taking over gets it
+        except FileNotFoundError:
+            return False
+        if _read_json(moved_path) != stale:
+            # someone took the shard over in between, give the fresh lock back
+            try:
+                os.link(moved_path, lock_path)
+            except FileExistsError:
+                pass # its owner will notice on its next heartbeat
+            os.remove(moved_path)
+            return False
+        os.remove(moved_path)
+        return True
+
+    def is_owner(self, shard):
+        lock = _read_json(self._lock_path(shard))
+        return lock is not None and lock.get("token") == self.tokens.get(shard)
+
+    def heartbeat(self, shard):
+        """ Touch the lock of the shard, False if it was taken over by another process """
+        if not self.is_owner(shard):
+            return False
+        try:
+            os.utime(self._lock_path(shard))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def keep_alive(self, shard, interval=None):
+        """ Context manager touching the lock from a background thread, see Heartbeat """
+        return Heartbeat(self, shard, interval or self.timeout / 4)
+
+    def complete(self, shard, report):
+        """ Write the report of the shard and release it, False if the shard was lost to another process """
+        if not self.is_owner(shard):
+            self.tokens.pop(shard)
+            return False # its new owner reports it
+        token = self.tokens.pop(shard)
+        written = _write_exclusive(self._done_path(shard), dict(report, shard=shard, owner=self.owner))
+        self._release(shard, token)
+        return written
+
+    def abandon(self, shard):
+        """ Give up a shard without reporting it, e.g. after it was taken over """
+        token = self.tokens.pop(shard, None)
+        if token is not None:
+            self._release(shard, token)
+
+    def _release(self, shard, token):
+        lock = _read_json(self._lock_path(shard))
+        if lock is not None and lock.get("token") == token:
+            os.remove(self._lock_path(shard))
+
+    def reports(self):
+        """ shard -> report of the shards done so far """
+        reports = {}
+        for shard in range(self.num_shards):
+            report = _read_json(self._done_path(shard))
+            if report is not None:
+                reports[shard] = report
+        return reports
+
+    def merge(self):
+        """ Check that every video of the plan was reported exactly once, by the shard it belongs to
+
+        Return (reports, problems), problems is a list of messages, empty if the run is complete.
+        """
+        plan = _read_json(os.path.join(self.root, 'plan.json'))
+        if plan is None:
+            return {}, ["no plan.json, nothing was generated"]
+        if plan["num_shards"] != self.num_shards:
+            return {}, [f"plan.json has {plan['num_shards']} shards, not {self.num_shards}"]
+        reports = self.reports()
+        problems = [f"shard {shard} is not done" for shard in range(self.num_shards) if shard not in reports]
+
+        seen = {}
+        for shard, report in reports.items():
+            for video_id in report["videos"]:
+                seen.setdefault(video_id, []).append(shard)
+        for shard, video_ids in plan["shards"].items():
+            if int(shard) not in reports:
+                continue
+            for video_id in video_ids:
+                if video_id not in seen:
+                    problems.append(f"video {video_id} of shard {shard} was not processed")
+        planned = {video_id for video_ids in plan["shards"].values() for video_id in video_ids}
+        for video_id, shards in seen.items():
+            if video_id not in planned:
+                problems.append(f"video {video_id} is not in the plan")
+            elif len(shards) > 1:
+                problems.append(f"video {video_id} was processed {len(shards)} times, by shards {shards}")
+            elif shard_of(video_id, self.num_shards) != shards[0]:
+                problems.append(f"video {video_id} was processed by shard {shards[0]} instead of {shard_of(video_id, self.num_shards)}")
+        return reports, problems
+
+
+class Heartbeat:
+    """ Touch the lock of a shard every `interval` seconds while the block runs, `lost` is set if it was taken over """
+    def __init__(self, queue, shard, interval):
+        self.queue = queue
+        self.shard = shard
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.queue.heartbeat(self.shard):
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False